@@ -0,0 +1,226 @@
+"""Benchmark of the optimizers used by ``guv csv_create_groups``.
+
+Synthetic cohorts are generated for each size with random columns of
+already formed groups (``--other-groups``), of affinity groups
+(``--affinity-groups``) and of values to balance (``--balance``). Each solver
+is run on each cohort and one JSON record per run is written with the time
+to build the constraints, the time of the search, the number of attempts, the
+final score, the lower bound and the peak memory measured by `tracemalloc`.
+Times are measured without tracing, the peak memory comes from a second
+traced run with the same seed, skipped with ``--no-memory``.
+
+Usage::
+
+    python benchmarks/bench_group_optimizer.py --output results.jsonl
+    python benchmarks/bench_group_optimizer.py --sizes 50 200 --solvers tabu annealing
+
+Records of two runs are compared with ``--compare before.jsonl after.jsonl``.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from guv.tasks.evolutionary_algorithm import evolutionary_algorithm
+from guv.tasks.group_constraints import (ConstraintGraph, get_affinity_components,
+                                         pack_components)
+from guv.tasks.local_search import SOLVERS, solve
+
+DENSE = "dense"
+
+
+def make_cohort(rng, n, n_other, other_size, n_affinity, affinity_size, n_balance):
+    """Return the codes of the columns of a synthetic cohort of `n` students."""
+
+    def random_groups(size, fill=1.0):
+        codes = rng.permutation(np.arange(n) // size).astype(np.int32)
+        # Students without group
+        codes[rng.random(n) > fill] = -1
+        return codes
+
+    return {
+        "other": [random_groups(other_size) for _ in range(n_other)],
+        "affinity": [random_groups(affinity_size) for _ in range(n_affinity)],
+        "balance": [rng.choice(4, size=n, p=[0.4, 0.3, 0.2, 0.1]).astype(np.int32) for _ in range(n_balance)],
+    }
+
+
+def make_problem(n, cohort, group_size):
+    """Return the graph and the initial partition as `CsvCreateGroups` does."""
+
+    # Affinity codes are coded as with nan_policy="same" in the graph
+    affinity_same = [np.where(codes == -1, codes.max() + 1, codes) for codes in cohort["affinity"]]
+    graph = ConstraintGraph.from_codes(n, cohort["other"], affinity_same, cohort["balance"])
+    partition = np.arange(n) % math.ceil(n / group_size)
+    partition.sort()
+
+    if cohort["affinity"]:
+        components = get_affinity_components(n, cohort["affinity"])
+        labels, partition = pack_components(components, np.bincount(partition))
+        graph = graph.contract(labels)
+
+    return graph, partition
+
+
+def dense_penalty(graph):
+    """Return the dense matrix equivalent to `graph` for the legacy algorithm."""
+
+    penalty = np.zeros((graph.n, graph.n), dtype=int)
+    penalty[graph.rows, graph.cols] = graph.weights
+    penalty[graph.cols, graph.rows] = graph.weights
+    penalty -= graph.offset
+    penalty[np.diag_indices(graph.n)] = graph.n_repulse - graph.n_affinity - graph.offset
+    return penalty
+
+
+def run(solver, graph, partition, max_iter, time_limit, seed):
+    if solver == DENSE:
+        penalty = dense_penalty(graph)
+        return evolutionary_algorithm(
+            partition,
+            penalty,
+            graph.min_cost,
+            max_variants=max_iter,
+            num_variants=10,
+            num_permutations=math.ceil(0.4 * graph.n),
+            top_k=20,
+        )
+    return solve(solver, graph, partition, max_iter=max_iter, time_limit=time_limit, seed=seed)
+
+
+def benchmark(args):
+    for n, (n_other, other_size), n_affinity, group_size, seed in itertools.product(
+        args.sizes,
+        itertools.product(args.other_columns, args.other_sizes),
+        args.affinity_columns,
+        args.group_sizes,
+        range(args.repeat),
+    ):
+        rng = np.random.default_rng(seed)
+        cohort = make_cohort(rng, n, n_other, other_size, n_affinity, args.affinity_size, args.balance_columns)
+
+        start = time.perf_counter()
+        graph, partition = make_problem(n, cohort, group_size)
+        build_time = time.perf_counter() - start
+
+        for solver in args.solvers:
+            # The dense algorithm has quadratic memory
+            if solver == DENSE and (graph.n > args.dense_max_size or not graph.has_unit_sizes or graph.balances):
+                continue
+
+            start = time.perf_counter()
+            attempts, score, _ = run(solver, graph, partition, args.max_iter, args.time_limit, seed)
+            elapsed = time.perf_counter() - start
+
+            # Tracing slows allocations down, memory is measured separately
+            peak = None
+            if args.memory:
+                tracemalloc.start()
+                run(solver, graph, partition, args.max_iter, args.time_limit, seed)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            yield {
+                "solver": solver,
+                "n": n,
+                "nodes": graph.n,
+                "edges": graph.num_edges,
+                "other_columns": n_other,
+                "other_size": other_size,
+                "affinity_columns": n_affinity,
+                "affinity_size": args.affinity_size,
+                "balance_columns": args.balance_columns,
+                "group_size": group_size,
+                "seed": seed,
+                "build_time": build_time,
+                "time": elapsed,
+                "attempts": int(attempts),
+                "score": int(score),
+                "min_cost": int(graph.min_cost),
+                "optimal": bool(score == graph.min_cost),
+                "time_to_optimal": elapsed if score == graph.min_cost else None,
+                "peak_memory": peak,
+            }
+
+
+def compare(before_file, after_file):
+    """Print the mean time and gap to the lower bound of two result files."""
+
+    def load(path):
+        results = {}
+        with open(path, "r") as stream:
+            for line in stream:
+                record = json.loads(line)
+                if "solver" not in record:
+                    continue
+                key = (record["solver"], record["n"], record["other_columns"], record["other_size"],
+                       record["affinity_columns"], record["group_size"])
+                results.setdefault(key, []).append(record)
+        return results
+
+    before, after = load(before_file), load(after_file)
+    print("solver,n,other_columns,other_size,affinity_columns,group_size,time_before,time_after,gap_before,gap_after")
+    for key in sorted(set(before) & set(after)):
+        stats = []
+        for records in (before[key], after[key]):
+            stats.append((
+                np.mean([r["time"] for r in records]),
+                np.mean([r["score"] - r["min_cost"] for r in records]),
+            ))
+        print(",".join(map(str, key)) + f",{stats[0][0]:.4f},{stats[1][0]:.4f},{stats[0][1]:.1f},{stats[1][1]:.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the group optimizers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000, 5000])
+    parser.add_argument("--solvers", nargs="+", choices=[*SOLVERS, DENSE], default=[*SOLVERS, DENSE])
+    parser.add_argument("--other-columns", type=int, nargs="+", default=[1, 3],
+                        help="Numbers of columns of already formed groups")
+    parser.add_argument("--other-sizes", type=int, nargs="+", default=[4, 20],
+                        help="Sizes of the already formed groups, larger is denser")
+    parser.add_argument("--affinity-columns", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--affinity-size", type=int, default=2)
+    parser.add_argument("--balance-columns", type=int, default=0)
+    parser.add_argument("--group-sizes", type=int, nargs="+", default=[3])
+    parser.add_argument("--repeat", type=int, default=1, help="Number of seeds per configuration")
+    parser.add_argument("--max-iter", type=int, default=1000)
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--dense-max-size", type=int, default=500)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="Do not measure the peak memory in a second traced run")
+    parser.add_argument("--output", default=None, help="JSON lines file, standard output by default")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare is not None:
+        compare(*args.compare)
+        return
+
+    stream = sys.stdout if args.output is None else open(args.output, "w")
+    try:
+        # First record describes the environment
+        print(json.dumps({
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "arguments": vars(args),
+        }), file=stream, flush=True)
+        for record in benchmark(args):
+            print(json.dumps(record), file=stream, flush=True)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+
+if __name__ == "__main__":
+    main()
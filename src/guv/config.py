@@ -162,6 +162,9 @@ class Settings:
         # Next look at loaded settings
         elif name in self.settings:
             value = self.settings[name]
+            # DOCS can be the path of a pipeline file relative to the UV
+            if name == "DOCS" and self.is_uv_dir and isinstance(value, (str, os.PathLike)):
+                value = self.settings[name] = self.load_pipeline(value)
         # Look at dynamic default
         elif (name + "_default") in Settings.__dict__:
             value = Settings.__dict__[name + "_default"](self)
@@ -243,6 +246,22 @@ class Settings:
                 msg = _("Problem loading file `{config_file}`: ").format(config_file=config_file)
                 raise ImproperlyConfigured(msg, e) from e
 
+    def load_pipeline(self, docs):
+        """Return the `Documents` of the pipeline file `docs` of the UV.
+
+        Called when `DOCS` is first accessed, pandas is not imported just
+        to load the settings.
+        """
+
+        pipeline_file = Path(self.conf_dir) / docs
+        try:
+            from .tasks.internal import Documents
+            return Documents.from_file(pipeline_file)
+        except Exception as e:
+            pipeline_file = rel_to_dir_aux(pipeline_file, self._settings["CWD"], self._settings["SEMESTER_DIR"])
+            msg = _("Problem loading file `{config_file}`: ").format(config_file=pipeline_file)
+            raise ImproperlyConfigured(msg, e) from e
+
     def load_file(self, config_file):
         logger.debug(_("Loading configuration file: `%s`"), config_file)
         module_name = Path(config_file).stem
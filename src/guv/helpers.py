@@ -17,6 +17,7 @@ from .config import settings
 from .exceptions import GuvUserError, ImproperlyConfigured
 from .logger import logger
 from .operation import Operation
+from .tasks.gradebook_evaluator import read_gradebook
 from .tasks.internal import Documents
 from .translations import _, Docstring
 from .utils import (check_if_absent, check_if_present, convert_to_numeric,
@@ -113,6 +114,16 @@ class FillnaColumn(Operation):
 
         return df
 
+    @property
+    def reads(self):
+        if self.group_column is not None:
+            return [self.colname, self.group_column]
+        return [self.colname]
+
+    @property
+    def writes(self):
+        return [self.colname]
+
     def message(self):
         if self.na_value is not None:
             return _("Replace NAs in the column `{colname}` with the value `{na_value}`").format(colname=self.colname, na_value=self.na_value)
@@ -147,11 +158,7 @@ class ReplaceRegex(Operation):
             )
 
         check_if_present(df, self.colname)
-
-        new_column = df[self.colname].copy()
-        for rep in self.reps:
-            new_column = new_column.str.replace(*rep, regex=True)
-
+        new_column = self.rewrite(df[self.colname].copy())
         return replace_column_aux(
             df,
             new_colname=self.new_colname,
@@ -160,6 +167,25 @@ class ReplaceRegex(Operation):
             backup=self.backup,
         )
 
+    def rewrite(self, values):
+        for rep in self.reps:
+            values = values.str.replace(*rep, regex=True)
+        return values
+
+    @property
+    def rewritten_column(self):
+        if self.new_colname is None and not self.backup:
+            return self.colname
+        return None
+
+    @property
+    def reads(self):
+        return [self.colname]
+
+    @property
+    def writes(self):
+        return replace_column_aux_writes(self.colname, self.new_colname, self.backup)
+
     def message(self):
         if self.msg is not None:
             return self.msg
@@ -196,7 +222,7 @@ class ReplaceColumn(Operation):
             )
 
         check_if_present(df, self.colname)
-        new_column = df[self.colname].replace(self.rep_dict)
+        new_column = self.rewrite(df[self.colname])
         return replace_column_aux(
             df,
             new_colname=self.new_colname,
@@ -205,6 +231,23 @@ class ReplaceColumn(Operation):
             backup=self.backup,
         )
 
+    def rewrite(self, values):
+        return values.replace(self.rep_dict)
+
+    @property
+    def rewritten_column(self):
+        if self.new_colname is None and not self.backup:
+            return self.colname
+        return None
+
+    @property
+    def reads(self):
+        return [self.colname]
+
+    @property
+    def writes(self):
+        return replace_column_aux_writes(self.colname, self.new_colname, self.backup)
+
     def message(self):
         if self.msg is not None:
             return self.msg
@@ -247,9 +290,24 @@ class ApplyColumn(Operation):
 
     def apply(self, df):
         check_if_present(df, self.colname)
-        df.loc[:, self.colname] = df[self.colname].apply(self.func)
+        df.loc[:, self.colname] = self.rewrite(df[self.colname])
         return df
 
+    def rewrite(self, values):
+        return values.apply(self.func)
+
+    @property
+    def rewritten_column(self):
+        return self.colname
+
+    @property
+    def reads(self):
+        return [self.colname]
+
+    @property
+    def writes(self):
+        return [self.colname]
+
     def message(self):
         if self.msg is not None:
             return self.msg
@@ -290,6 +348,14 @@ class ComputeNewColumn(Operation):
         df = df.assign(**{self.colname: new_col})
         return df
 
+    @property
+    def reads(self):
+        return list(self.col2id.keys())
+
+    @property
+    def writes(self):
+        return [self.colname]
+
     def message(self):
         if self.msg is not None:
             return self.msg
@@ -338,6 +404,17 @@ class ApplyCell(Operation):
 
         return df
 
+    @property
+    def reads(self):
+        # Only one cell is modified, the rest of the column is kept
+        if '@' in self.name_or_email:
+            return [self.colname, self.settings.EMAIL_COLUMN]
+        return [self.colname, self.settings.LASTNAME_COLUMN, self.settings.NAME_COLUMN]
+
+    @property
+    def writes(self):
+        return [self.colname]
+
     def message(self):
         if self.msg is not None:
             return self.msg
@@ -351,6 +428,7 @@ class FileOperation(Operation):
     def __init__(self, filename):
         super().__init__()
         self._filename = filename
+        self._prefetched = None
 
     @property
     def filename(self):
@@ -360,6 +438,25 @@ class FileOperation(Operation):
     def deps(self):
         return [self.filename]
 
+    def read(self):
+        """Read and parse the input file.
+
+        Might be called from a worker thread so it should not depend on the
+        dataframe being processed.
+        """
+        return None
+
+    def prefetch(self, executor):
+        self._prefetched = executor.submit(self.read)
+
+    def load(self):
+        """Return the result of `read`, waiting for it if prefetched."""
+
+        if self._prefetched is not None:
+            future, self._prefetched = self._prefetched, None
+            return future.result()
+        return self.read()
+
     def message(self):
         return _("Aggregation of the file `{filename}`").format(filename=rel_to_dir(self.filename, self.settings.CWD))
 
@@ -374,6 +471,14 @@ class Add(FileOperation):
         self.func = func
         self.kw_func = kw_func
 
+    def read(self):
+        return read_dataframe(self.filename, kw_read=self.kw_func)
+
+    def prefetch(self, executor):
+        # The file is handed over to `func` otherwise
+        if self.func is None:
+            super().prefetch(executor)
+
     def apply(self, df):
         if df is not None and self.func is None:
             raise ImproperlyConfigured(_("An aggregation function must be provided"))
@@ -384,7 +489,7 @@ class Add(FileOperation):
         if self.func is not None and df is not None:
             return self.func(df, self.filename, **self.kw_func)
         else:
-            return read_dataframe(self.filename, kw_read=self.kw_func)
+            return self.load()
 
 
 class Aggregate(FileOperation):
@@ -422,8 +527,11 @@ class Aggregate(FileOperation):
         self.read_method = read_method
         self.kw_read = kw_read
 
+    def read(self):
+        return read_dataframe(self.filename, kw_read=self.kw_read, read_method=self.read_method)
+
     def apply(self, left_df):
-        right_df = read_dataframe(self.filename, kw_read=self.kw_read, read_method=self.read_method)
+        right_df = self.load()
 
         if self.on is not None:
             if self.left_on is not None or self.right_on is not None:
@@ -458,6 +566,33 @@ class Aggregate(FileOperation):
 
         return df_merge
 
+    @property
+    def reads(self):
+        if self.postprocessing is not None:
+            return None
+
+        key_columns = merger_columns(self.on if self.on is not None else self.left_on)
+        if key_columns is None:
+            return None
+
+        # Existing columns are merged unless erased
+        if self.merge_policy != "erase":
+            written = self.writes
+            if written is None:
+                return None
+            return key_columns + written
+
+        return key_columns
+
+    @property
+    def writes(self):
+        if self.subset is None or self.postprocessing is not None:
+            return None
+
+        subset = [self.subset] if isinstance(self.subset, str) else self.subset
+        rename = self.rename or {}
+        return [rename.get(c, c) for c in subset]
+
 
 class AggregateSelf(Operation):
     __doc__ = Docstring()
@@ -509,6 +644,13 @@ class AggregateSelf(Operation):
 
         return merge
 
+    # Backs up manually added columns
+    removable = False
+
+    @property
+    def writes(self):
+        return self.columns
+
     def message(self):
         msg = ", ".join(f"`{e}`" for e in self.columns)
         return _("Add manual columns: {msg}").format(msg=msg)
@@ -532,7 +674,7 @@ class AggregateOrg(FileOperation):
         self.on = on
         self.postprocessing = postprocessing
 
-    def apply(self, left_df):
+    def read(self):
         check_filename(self.filename, base_dir=settings.SEMESTER_DIR)
 
         def parse_org(text):
@@ -546,7 +688,10 @@ class AggregateOrg(FileOperation):
                 yield header, text
 
         text = open(self.filename, 'r').read()
-        df_org = pd.DataFrame(parse_org(text), columns=["header", self.colname])
+        return pd.DataFrame(parse_org(text), columns=["header", self.colname])
+
+    def apply(self, left_df):
+        df_org = self.load()
 
         if self.on is None:
             columns = [self.settings.LASTNAME_COLUMN, self.settings.NAME_COLUMN]
@@ -570,6 +715,20 @@ class AggregateOrg(FileOperation):
 
         return df_merge
 
+    @property
+    def reads(self):
+        if self.postprocessing is not None:
+            return None
+        if self.on is None:
+            return [self.settings.LASTNAME_COLUMN, self.settings.NAME_COLUMN, self.colname]
+        return merger_columns(self.on) + [self.colname]
+
+    @property
+    def writes(self):
+        if self.postprocessing is not None:
+            return None
+        return [self.colname]
+
 
 class FileStringOperation(FileOperation):
     msg_file = _("Aggregation of the file `{filename}`")
@@ -593,8 +752,7 @@ class FileStringOperation(FileOperation):
 
         return self._is_file
 
-    @property
-    def lines(self):
+    def read(self):
         if self.is_file:
             filename = str(Path(self.base_dir) / self.filename_or_string)
             check_filename(filename, base_dir=self.base_dir)
@@ -604,6 +762,14 @@ class FileStringOperation(FileOperation):
 
         return lines
 
+    def prefetch(self, executor):
+        if self.is_file:
+            super().prefetch(executor)
+
+    @property
+    def lines(self):
+        return self.load()
+
     @property
     def deps(self):
         if self.is_file:
@@ -663,6 +829,14 @@ class Flag(FileStringOperation):
         df = df.drop('fullname_slug', axis=1)
         return df
 
+    @property
+    def reads(self):
+        return [self.settings.NAME_COLUMN, self.settings.LASTNAME_COLUMN]
+
+    @property
+    def writes(self):
+        return [self.colname]
+
 
 class Switch(FileStringOperation):
     __doc__ = Docstring()
@@ -713,6 +887,19 @@ class Switch(FileStringOperation):
         df = df.drop('fullname_slug', axis=1)
         return df
 
+    @property
+    def reads(self):
+        return [
+            self.colname,
+            self.settings.LASTNAME_COLUMN,
+            self.settings.NAME_COLUMN,
+            self.settings.EMAIL_COLUMN,
+        ]
+
+    @property
+    def writes(self):
+        return replace_column_aux_writes(self.colname, self.new_colname, self.backup)
+
 
 def replace_column_aux(
         df, new_colname=None, colname=None, new_column=None, backup=False, errors="warning"
@@ -734,6 +921,33 @@ def replace_column_aux(
     return df
 
 
+def replace_column_aux_writes(colname, new_colname=None, backup=False):
+    """Return the columns written by `replace_column_aux`."""
+
+    if backup:
+        return [f"{colname}_orig", colname]
+    elif new_colname is not None:
+        return [new_colname]
+    else:
+        return [colname]
+
+
+def merger_columns(obj):
+    """Return the columns used by a merger specification, None if unknown."""
+
+    if isinstance(obj, str):
+        return [obj]
+    elif isinstance(obj, list):
+        columns = [merger_columns(e) for e in obj]
+        if any(c is None for c in columns):
+            return None
+        return [c for cols in columns for c in cols]
+    elif hasattr(obj, "columns"):
+        return list(obj.columns)
+    else:
+        return None
+
+
 def read_pairs(lines):
     """Generate pairs read in `lines`. """
 
@@ -828,10 +1042,13 @@ class MoodleFileOperation(FileOperation):
         super().__init__(filename)
         self._moodle_df = None
 
+    def read(self):
+        return read_dataframe(self.filename, kw_read=type(self).read_dataframe_kwargs)
+
     @property
     def moodle_df(self):
         if self._moodle_df is None:
-            self._moodle_df = read_dataframe(self.filename, kw_read=type(self).read_dataframe_kwargs)
+            self._moodle_df = self.load()
         return self._moodle_df
 
 
@@ -882,6 +1099,15 @@ class AggregateMoodleGroups(MoodleFileOperation):
 
         return df_merge
 
+    @property
+    def reads(self):
+        # An existing column is renamed with an `_orig` suffix
+        return [self.settings.EMAIL_COLUMN, self.colname, self.colname + "_orig"]
+
+    @property
+    def writes(self):
+        return [self.colname + "_orig", self.colname]
+
     def message(self):
         return _("Aggregation of the group file `{filename}`").format(filename=rel_to_dir(self.filename, self.settings.CWD))
 
@@ -957,6 +1183,58 @@ class AggregateJury(FileOperation):
         op.setup(settings=self.settings, info=self.info)
         return op.apply(df)
 
+    @property
+    def reads(self):
+        return [self.settings.EMAIL_COLUMN] + self.writes
+
+    @property
+    def writes(self):
+        return [_("Aggregated grade"), _("ECTS grade")]
+
+
+class AggregateGradeBook(FileOperation):
+    __doc__ = Docstring()
+
+    hash_fields = ["_filename", "subset"]
+
+    def __init__(self, filename: str, subset: Union[None, str, List[str]] = None):
+        super().__init__(filename)
+        self.subset = subset
+
+    def read(self):
+        return read_gradebook(self.filename)
+
+    def apply(self, left_df):
+        right_df = self.load()
+        email_column = self.settings.EMAIL_COLUMN
+        subset = self.subset if self.subset is not None else right_df.attrs["grade_columns"]
+
+        agg = Aggregator(
+            left_df,
+            right_df,
+            left_on=email_column,
+            right_on=copy.copy(email_column),
+            subset=subset,
+            how="left"
+        )
+
+        df_merge = agg.merge()
+        agg.report()
+
+        return df_merge
+
+    @property
+    def reads(self):
+        if self.writes is None:
+            return None
+        return [self.settings.EMAIL_COLUMN] + self.writes
+
+    @property
+    def writes(self):
+        if self.subset is None:
+            return None
+        return [self.subset] if isinstance(self.subset, str) else list(self.subset)
+
 
 def add_action_method(cls, klass, method_name):
     """Add new method named `method_name` to class `cls`"""
@@ -985,6 +1263,7 @@ def load_actions():
         ("aggregate_moodle_grades", AggregateMoodleGrades),
         ("aggregate_moodle_groups", AggregateMoodleGroups),
         ("aggregate_jury", AggregateJury),
+        ("aggregate_gradebook", AggregateGradeBook),
         ("aggregate_org", AggregateOrg),
         ("flag", Flag),
         ("apply_cell", ApplyCell),
@@ -5,6 +5,13 @@ from .operation import Operation
 
 
 class Documents:
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "Documents":
+        ...
+
+    def dtypes(self, dtypes: dict[str, str] | None = None, infer: bool = False) -> None:
+        ...
+
     def fillna_column(
         self,
         colname: str,
@@ -74,6 +81,9 @@ class Documents:
     def aggregate_jury(self, filename: str) -> None:
         ...
 
+    def aggregate_gradebook(self, filename: str, subset: str | list[str] | None = None) -> None:
+        ...
+
     def aggregate_org(
         self,
         filename: str,
@@ -0,0 +1,86 @@
+"""Column-level dependency graph of the operations in ``DOCS``.
+
+Each operation may declare the columns it reads and writes through its
+`reads` and `writes` properties. A value of None means that the operation
+might read or write any column, for example ``apply_df``.
+
+A written column that is not read by the same operation is completely
+overwritten by it: its previous values are not needed.
+"""
+
+
+class ColumnLineage:
+    """Column lineage graph of a list of operations"""
+
+    def __init__(self, actions):
+        self.actions = list(actions)
+        self.reads = [_as_set(a.reads) for a in self.actions]
+        self.writes = [_as_set(a.writes) for a in self.actions]
+
+    def lineage(self, column):
+        """Return indices of operations the final value of `column` depends on.
+
+        Operations are walked backwards: an operation is kept if it (might)
+        write a needed column, its read columns become needed and fully
+        overwritten columns are no longer needed.
+        """
+
+        # None means that all columns are needed
+        needed = {column}
+        indices = []
+        for i in reversed(range(len(self.actions))):
+            reads, writes = self.reads[i], self.writes[i]
+            if needed is not None and writes is not None and not (writes & needed):
+                continue
+
+            indices.append(i)
+            if reads is None:
+                needed = None
+            elif needed is not None:
+                if writes is not None:
+                    needed -= writes - reads
+                needed |= reads
+
+        return indices[::-1]
+
+    def overwritten_by(self, i, column):
+        """Return index of the operation overwriting `column` written by `i`.
+
+        Return None if `column` is read before being overwritten or if it
+        makes it to the central file.
+        """
+
+        for j in range(i + 1, len(self.actions)):
+            reads, writes = self.reads[j], self.writes[j]
+            if reads is None or column in reads:
+                return None
+            if writes is not None and column in writes:
+                return j
+        return None
+
+    def redundant(self):
+        """Return a dictionary of redundant operations.
+
+        Keys are indices of operations whose written columns are all
+        overwritten later without being read. Values are the indices of the
+        overwriting operations.
+        """
+
+        redundant = {}
+        for i, (action, writes) in enumerate(zip(self.actions, self.writes)):
+            if writes is None or not writes or not action.removable:
+                continue
+
+            killers = [self.overwritten_by(i, column) for column in writes]
+            if all(j is not None for j in killers):
+                redundant[i] = sorted(set(killers))
+
+        return redundant
+
+
+def _as_set(columns):
+    if columns is None:
+        return None
+    if isinstance(columns, str):
+        return {columns}
+    return set(columns)
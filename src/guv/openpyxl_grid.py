@@ -0,0 +1,351 @@
+"""In-memory layout of workbooks written in a single pass.
+
+Gradebooks are laid out on `GridSheet` objects instead of openpyxl
+worksheets: values and styles are stored in dictionaries indexed by
+``(row, column)`` and merged cells as range records. Nothing is written
+until `GridWorkbook.save` streams each sheet row by row with a write-only
+openpyxl workbook.
+
+The value of a formula can be stored along with it in `cached_value` so
+that the workbook can be read without being recalculated by a
+spreadsheet application.
+
+`GridCell` has the same navigation helpers as the cells patched in
+`openpyxl_patched` so that the functions of `openpyxl_utils` work with
+both.
+"""
+
+from collections import defaultdict
+from types import SimpleNamespace
+
+from openpyxl import Workbook
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.formatting.formatting import ConditionalFormattingList
+from openpyxl.styles import Alignment, Border, Side
+from openpyxl.styles.borders import DEFAULT_BORDER
+from openpyxl.styles.builtins import styles as builtin_styles
+from openpyxl.utils import range_boundaries
+from openpyxl.workbook.child import avoid_duplicate_name
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.filters import AutoFilter
+
+from . import openpyxl_patched  # noqa: F401 - Imported for side effects (writes cached values)
+from .openpyxl_utils import cell_coordinate, column_letter
+
+DEFAULT_ALIGNMENT = Alignment()
+
+
+class FormulaCell(Cell):
+    """Cell of a write-only worksheet with a formula and its value"""
+
+    __slots__ = ("cached_value",)
+
+
+class GridCell:
+    """Cell of a `GridSheet` identified by its row and column"""
+
+    __slots__ = ("parent", "row", "column")
+
+    def __init__(self, parent, row, column):
+        if row < 1 or column < 1:
+            raise ValueError("Row or column values must be at least 1")
+        self.parent = parent
+        self.row = row
+        self.column = column
+
+    def __repr__(self):
+        return f"<GridCell {self.parent.title!r}.{self.coordinate}>"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, GridCell)
+            and self.parent is other.parent
+            and self.row == other.row
+            and self.column == other.column
+        )
+
+    def __hash__(self):
+        return hash((id(self.parent), self.row, self.column))
+
+    @property
+    def key(self):
+        return self.row, self.column
+
+    @property
+    def col_idx(self):
+        return self.column
+
+    @property
+    def column_letter(self):
+        return column_letter(self.column)
+
+    @property
+    def coordinate(self):
+        return cell_coordinate(self.row, self.column)
+
+    @property
+    def value(self):
+        return self.parent.values.get(self.key)
+
+    @value.setter
+    def value(self, value):
+        if value is None:
+            self.parent.values.pop(self.key, None)
+        else:
+            self.parent.values[self.key] = value
+
+    @property
+    def cached_value(self):
+        return self.parent.cached_values.get(self.key)
+
+    @cached_value.setter
+    def cached_value(self, value):
+        if value is None:
+            self.parent.cached_values.pop(self.key, None)
+        else:
+            self.parent.cached_values[self.key] = value
+
+    @property
+    def alignment(self):
+        return self.parent.alignments.get(self.key, DEFAULT_ALIGNMENT)
+
+    @alignment.setter
+    def alignment(self, alignment):
+        self.parent.alignments[self.key] = alignment
+
+    @property
+    def border(self):
+        return self.parent.borders.get(self.key, DEFAULT_BORDER)
+
+    @border.setter
+    def border(self, border):
+        self.parent.borders[self.key] = border
+
+    @property
+    def style(self):
+        return self.parent.styles.get(self.key, "Normal")
+
+    @style.setter
+    def style(self, name):
+        # As with openpyxl, a named style also sets the border and the
+        # alignment that can be amended afterwards
+        named_style = builtin_styles[name]
+        self.parent.styles[self.key] = name
+        self.border = named_style.border
+        self.alignment = named_style.alignment
+
+    def offset(self, row=0, column=0):
+        return self.parent.cell(row=self.row + row, column=self.column + column)
+
+    def left(self, step=1):
+        return self.offset(0, -step)
+
+    def right(self, step=1):
+        return self.offset(0, step)
+
+    def above(self, step=1):
+        return self.offset(-step, 0)
+
+    def below(self, step=1):
+        return self.offset(step, 0)
+
+    def top(self):
+        return self.parent.cell(row=1, column=self.column)
+
+    def text(self, value):
+        self.value = value
+        return self
+
+    def center(self):
+        self.alignment = Alignment(horizontal="center", vertical="center")
+        return self
+
+    def set_border(self):
+        thin = Side(border_style="thin", color="000000")
+        self.border += Border(top=thin, left=thin, right=thin, bottom=thin)
+        return self
+
+    def merge(self, cell):
+        assert self.parent == cell.parent
+
+        self.parent.merge_cells(
+            start_row=self.row,
+            start_column=self.column,
+            end_row=cell.row,
+            end_column=cell.column
+        )
+        return self
+
+
+class GridSheet:
+    """Layout of a worksheet kept in memory until the workbook is saved"""
+
+    def __init__(self, parent, title):
+        self.parent = parent
+        self.title = title
+
+        # Sparse grid of values and styles
+        self.values = {}
+        self.cached_values = {}
+        self.alignments = {}
+        self.borders = {}
+        self.styles = {}
+
+        # Range records
+        self.merged_ranges = []
+        self.conditional_formatting = ConditionalFormattingList()
+        self.auto_filter = AutoFilter()
+
+        self.column_dimensions = defaultdict(lambda: SimpleNamespace(width=None))
+        self.freeze_panes = None
+
+    def __repr__(self):
+        return f"<GridSheet {self.title!r}>"
+
+    def cell(self, row, column, value=None):
+        cell = GridCell(self, row, column)
+        if value is not None:
+            cell.value = value
+        return cell
+
+    def write_column(self, ref, values):
+        """Write `values` from `ref` downwards and return the cells."""
+
+        self.values.update(
+            ((ref.row + i, ref.column), value)
+            for i, value in enumerate(values)
+            if value is not None
+        )
+        return [GridCell(self, ref.row + i, ref.column) for i in range(len(values))]
+
+    def write_row(self, ref, values):
+        """Write `values` from `ref` rightwards and return the cells."""
+
+        self.values.update(
+            ((ref.row, ref.column + i), value)
+            for i, value in enumerate(values)
+            if value is not None
+        )
+        return [GridCell(self, ref.row, ref.column + i) for i in range(len(values))]
+
+    def __getitem__(self, key):
+        """Return a cell or the rows of cells of a range like ``"A1:C3"``."""
+
+        min_col, min_row, max_col, max_row = range_boundaries(key)
+        if ":" not in key:
+            return self.cell(min_row, min_col)
+
+        return tuple(
+            tuple(self.cell(row, column) for column in range(min_col, max_col + 1))
+            for row in range(min_row, max_row + 1)
+        )
+
+    def merge_cells(self, range_string=None, start_row=None, start_column=None, end_row=None, end_column=None):
+        self.merged_ranges.append(CellRange(
+            range_string=range_string,
+            min_row=start_row,
+            min_col=start_column,
+            max_row=end_row,
+            max_col=end_column,
+        ))
+
+    def merge_cells2(self, cell1, cell2):
+        """Merge rectangle defined by upper left and lower right cells"""
+
+        self.merge_cells(
+            start_row=cell1.row,
+            start_column=cell1.col_idx,
+            end_row=cell2.row,
+            end_column=cell2.col_idx
+        )
+
+        return self.cell(row=cell1.row, column=cell1.col_idx)
+
+    def _keys(self):
+        return self.values.keys() | self.alignments.keys() | self.borders.keys() | self.styles.keys()
+
+    @property
+    def max_row(self):
+        return max((row for row, _ in self._keys()), default=1)
+
+    @property
+    def max_column(self):
+        return max((column for _, column in self._keys()), default=1)
+
+    def flush(self, worksheet):
+        """Write the layout in the write-only `worksheet`."""
+
+        for letter, dimension in self.column_dimensions.items():
+            if dimension.width is not None:
+                worksheet.column_dimensions[letter].width = dimension.width
+
+        if self.freeze_panes is not None:
+            worksheet.freeze_panes = getattr(self.freeze_panes, "coordinate", self.freeze_panes)
+
+        for cell_range in self.merged_ranges:
+            worksheet.merged_cells.add(cell_range)
+        worksheet.conditional_formatting = self.conditional_formatting
+        worksheet.auto_filter = self.auto_filter
+
+        styled = self.alignments.keys() | self.borders.keys() | self.styles.keys()
+        rows = defaultdict(dict)
+        for key in self.values.keys() | styled:
+            rows[key[0]][key[1]] = key
+
+        for row in range(1, max(rows, default=0) + 1):
+            columns = rows.get(row, {})
+            # The writer stores the next plain value in the last unstyled
+            # cell given, so a formula cell is never followed by a plain value
+            with_formula_cell = any(key in self.cached_values for key in columns.values())
+
+            values = [None] * max(columns, default=0)
+            for column, key in columns.items():
+                value = self.values.get(key)
+                if key in self.cached_values:
+                    cell = FormulaCell(worksheet, row=1, column=1, value=value)
+                    cell.cached_value = self.cached_values[key]
+                elif key in styled or (with_formula_cell and value is not None):
+                    cell = WriteOnlyCell(worksheet, value)
+                else:
+                    values[column - 1] = value
+                    continue
+
+                if key in self.styles:
+                    cell.style = self.styles[key]
+                if key in self.borders:
+                    cell.border = self.borders[key]
+                if key in self.alignments:
+                    cell.alignment = self.alignments[key]
+                values[column - 1] = cell
+            worksheet.append(values)
+
+
+class GridWorkbook:
+    """Workbook of `GridSheet` saved with a write-only openpyxl workbook"""
+
+    def __init__(self):
+        self.worksheets = []
+        self.active = None
+
+    def create_sheet(self, title):
+        title = avoid_duplicate_name([sheet.title for sheet in self.worksheets], title)
+        sheet = GridSheet(self, title)
+        self.worksheets.append(sheet)
+        if self.active is None:
+            self.active = sheet
+        return sheet
+
+    def __getitem__(self, title):
+        for sheet in self.worksheets:
+            if sheet.title == title:
+                return sheet
+        raise KeyError(f"Worksheet {title} does not exist.")
+
+    def save(self, filename):
+        workbook = Workbook(write_only=True)
+        for sheet in self.worksheets:
+            sheet.flush(workbook.create_sheet(sheet.title))
+
+        if self.active is not None:
+            workbook.active = self.worksheets.index(self.active)
+        workbook.save(filename)
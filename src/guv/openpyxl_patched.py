@@ -101,6 +101,36 @@ def fixit(openpyxl):
 
     _Worksheet.merge_cells2 = _merge_cells2
 
+    # Write the value of a formula if known, see `openpyxl_grid.FormulaCell`
+    from openpyxl.compat import safe_string as _safe_string
+    from openpyxl.worksheet import _writer as _worksheet_writer
+    from openpyxl.xml.functions import Element as _Element
+    from openpyxl.xml.functions import SubElement as _SubElement
+
+    _write_cell = _worksheet_writer.write_cell
+
+    def _write_cell_with_value(xf, worksheet, cell, styled=None):
+        value = getattr(cell, "cached_value", None)
+        if cell.data_type != "f" or value is None:
+            return _write_cell(xf, worksheet, cell, styled)
+
+        attributes = {"r": cell.coordinate}
+        if styled:
+            attributes["s"] = f"{cell.style_id}"
+        if isinstance(value, bool):
+            attributes["t"] = "b"
+            value = int(value)
+        elif isinstance(value, str):
+            attributes["t"] = "str"
+
+        el = _Element("c", attributes)
+        _SubElement(el, "f").text = cell.value[1:]
+        _SubElement(el, "v").text = _safe_string(value)
+        xf.write(el)
+
+
+    _worksheet_writer.write_cell = _write_cell_with_value
+
 
 fixit(openpyxl)
 
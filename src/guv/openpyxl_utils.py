@@ -1,12 +1,13 @@
 import math
+from functools import lru_cache
 from itertools import groupby
 from operator import attrgetter
 from types import SimpleNamespace
 
+import pandas as pd
 from guv import openpyxl_patched as openpyxl  # Import patched version
 from openpyxl import utils
 from openpyxl.styles import Border, Side
-from openpyxl.utils.cell import absolute_coordinate
 
 
 def frame_range(cell1, cell2):
@@ -32,55 +33,107 @@ def frame_range(cell1, cell2):
         r.border = r.border + right
 
 
-def get_address_of_cell(cell, absolute=False, add_worksheet_name=None, compat=False):
-    """Renvoie l'adresse d'un objet Cell sous forme "A1" en prenant en
-    compte la feuille courante si la cellule se trouve sur une
-    autre feuille.
-    """
+@lru_cache(maxsize=None)
+def column_letter(column):
+    """Renvoie la lettre de la colonne d'indice `column`."""
+
+    return utils.get_column_letter(column)
 
-    cell_worksheet = cell.parent
-    workbook = cell.parent.parent
-    active_worksheet = workbook.active
+
+@lru_cache(maxsize=2**16)
+def cell_coordinate(row, column, absolute=False):
+    """Renvoie les coordonnées d'une cellule sous forme "A1" ou "$A$1"."""
 
     if absolute:
-        coordinate = absolute_coordinate(cell.coordinate)
+        return "${}${}".format(column_letter(column), row)
     else:
-        coordinate = cell.coordinate
+        return "{}{}".format(column_letter(column), row)
+
 
-    if add_worksheet_name == False or (add_worksheet_name is None and cell_worksheet == active_worksheet):
-        return coordinate
+def qualify_reference(reference, worksheet, current_worksheet, add_worksheet_name=None, compat=False):
+    """Ajoute à `reference` le nom de `worksheet` s'il s'agit d'une autre
+    feuille que `current_worksheet` ou si `add_worksheet_name` est vrai.
+    """
+
+    if add_worksheet_name == False or (add_worksheet_name is None and worksheet == current_worksheet):
+        return reference
     else:
         if compat:          # GoogleSheet compatibility
-            return "INDIRECT(\"'{}'!{}\")".format(cell_worksheet.title, coordinate)
+            return "INDIRECT(\"'{}'!{}\")".format(worksheet.title, reference)
         else:
-            return "'{}'!{}".format(cell_worksheet.title, coordinate)
+            return "'{}'!{}".format(worksheet.title, reference)
+
+
+def get_address_of_cell(cell, absolute=False, add_worksheet_name=None, compat=False, current_worksheet=None):
+    """Renvoie l'adresse d'un objet Cell sous forme "A1" en prenant en
+    compte la feuille courante si la cellule se trouve sur une
+    autre feuille.
+
+    La feuille courante est `current_worksheet` ou à défaut la feuille
+    active du classeur.
+    """
+
+    if current_worksheet is None:
+        current_worksheet = cell.parent.parent.active
+
+    return qualify_reference(
+        cell_coordinate(cell.row, cell.column, absolute),
+        cell.parent,
+        current_worksheet,
+        add_worksheet_name=add_worksheet_name,
+        compat=compat,
+    )
 
 
-def get_range_from_cells(cell1, cell2, absolute=False, add_worksheet_name=None, compat=False):
-    cell_worksheet = cell1.parent
-    workbook = cell1.parent.parent
-    active_worksheet = workbook.active
+def get_range_from_cells(cell1, cell2, absolute=False, add_worksheet_name=None, compat=False, current_worksheet=None):
+    if current_worksheet is None:
+        current_worksheet = cell1.parent.parent.active
 
     # Upper-left and lower right cells
     cell1_row, cell2_row = (cell1.row, cell2.row) if cell1.row < cell2.row else (cell2.row, cell1.row)
     cell1_col, cell2_col = (cell1.column, cell2.column) if cell1.column < cell2.column else (cell2.column, cell1.column)
 
     # Excel-like coordinates
-    cell1_addr = utils.get_column_letter(cell1_col) + str(cell1_row)
-    cell2_addr = utils.get_column_letter(cell2_col) + str(cell2_row)
+    range = cell_coordinate(cell1_row, cell1_col, absolute) + ":" + cell_coordinate(cell2_row, cell2_col, absolute)
+
+    return qualify_reference(
+        range,
+        cell1.parent,
+        current_worksheet,
+        add_worksheet_name=add_worksheet_name,
+        compat=compat,
+    )
 
-    if absolute:
-        range = absolute_coordinate(cell1_addr) + ":" + absolute_coordinate(cell2_addr)
-    else:
-        range = cell1_addr + ":" + cell2_addr
 
-    if add_worksheet_name == False or (add_worksheet_name is None and cell_worksheet == active_worksheet):
-        return range
-    else:
-        if compat:          # GoogleSheet compatibility
-            return "INDIRECT(\"'{}'!{}\")".format(cell_worksheet.title, range)
-        else:
-            return "'{}'!{}".format(cell_worksheet.title, range)
+class AddressBuilder:
+    """Adresses des cellules dans les formules écrites sur une feuille.
+
+    La feuille courante `current_worksheet` est explicite : le nom de la
+    feuille d'une cellule n'est ajouté que si elle est différente, sans
+    avoir à modifier la feuille active du classeur.
+    """
+
+    def __init__(self, current_worksheet):
+        self.current_worksheet = current_worksheet
+
+    def address(self, cell, absolute=False, add_worksheet_name=None, compat=False):
+        return get_address_of_cell(
+            cell,
+            absolute=absolute,
+            add_worksheet_name=add_worksheet_name,
+            compat=compat,
+            current_worksheet=self.current_worksheet,
+        )
+
+    def range(self, cell1, cell2, absolute=False, add_worksheet_name=None, compat=False):
+        return get_range_from_cells(
+            cell1,
+            cell2,
+            absolute=absolute,
+            add_worksheet_name=add_worksheet_name,
+            compat=compat,
+            current_worksheet=self.current_worksheet,
+        )
 
 
 def get_segment(cell1, cell2):
@@ -165,6 +218,19 @@ def fit_cells_at_col(*cells):
             worksheet.column_dimensions[utils.get_column_letter(k)].width = 1.3*max_len
 
 
+def max_text_length(values):
+    """Return the length of the longest line of `values` written as text.
+
+    Missing values are ignored, 0 is returned if there is none.
+    """
+
+    values = pd.Series(values, dtype=object)
+    values = values[values.notna()].astype(str)
+    if values.empty:
+        return 0
+    return int(values.str.split(r"\r\n|\r|\n", regex=True).explode().str.len().max())
+
+
 def generate_ranges(start_cell, end_cell, nranges=None):
     if start_cell.row == end_cell.row:
         if start_cell.column > end_cell.column:
@@ -9,6 +9,13 @@ class Operation:
     cache = False
     hash_fields = []
 
+    # Canonical hash set when the operation is read from a pipeline file
+    spec_hash = None
+
+    # Whether the operation can be skipped when all its written columns
+    # are overwritten later
+    removable = True
+
     def __init__(self):
         self._settings = None
         self._info = None
@@ -36,12 +43,39 @@ class Operation:
     def deps(self):
         return []
 
+    @property
+    def reads(self):
+        """Columns read by the operation, None if unknown"""
+        return None
+
+    @property
+    def writes(self):
+        """Columns written by the operation, None if unknown"""
+        return None
+
+    @property
+    def rewritten_column(self):
+        """Column rewritten in place value by value, None if not applicable
+
+        Such operations only depend on the value of each cell of that column
+        and can be fused by `Documents` through `rewrite`.
+        """
+        return None
+
+    def rewrite(self, values):
+        """Return the rewritten series `values` of `rewritten_column`."""
+        raise NotImplementedError
+
     def name(self):
         return re.sub(r"(?<!^)(?<=[a-z])(?=[A-Z])", "_", type(self).__name__).lower()
 
     def apply(self, df):
         pass
 
+    def prefetch(self, executor):
+        """Start loading inputs in `executor` before `apply` is called."""
+        pass
+
     def setup(self, settings=None, info=None):
         self._settings = settings
         self._info = info
@@ -51,6 +85,8 @@ class Operation:
         return json.dumps(relevant_data, sort_keys=True)
 
     def hash(self):
+        if self.spec_hash is not None:
+            return self.spec_hash
         return hashlib.sha256(self.fingerprint().encode("utf-8")).hexdigest()
 
 
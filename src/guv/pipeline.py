@@ -0,0 +1,265 @@
+"""Declarative description of the operations of ``DOCS``.
+
+A pipeline file is a YAML or TOML file listing operations by their name in
+``Documents``, for example::
+
+    hooks: hooks.py
+    operations:
+      - add: documents/base_listing.xlsx
+      - replace_regex:
+          args: [Tutorial, ["^TD", "T"]]
+      - apply_column:
+          colname: Tutorial
+          func: {hook: normalize_group}
+          cache: true
+    dtypes:
+      Tutorial: category
+
+The value of an operation is either a single positional argument, a list of
+positional arguments or a dictionary of keyword arguments with the optional
+keys ``args`` for positional arguments and ``cache`` to end a step after the
+operation. Custom functions are written in the hooks file and referenced by
+name with ``{hook: name}``. Dtypes of columns of the central file are
+declared with ``dtypes`` and inferred if ``infer_dtypes`` is true, see
+`Documents.dtypes`.
+
+Hashes of the operations are computed from the canonical form of the file
+and the syntax tree of the hooks file instead of the fingerprints of Python
+functions. The pipeline file is only read when ``DOCS`` is first used.
+"""
+
+import ast
+import hashlib
+import importlib.util
+import json
+from pathlib import Path
+
+import yaml
+
+from .exceptions import ImproperlyConfigured
+from .translations import _
+
+PIPELINE_SUFFIXES = [".yaml", ".yml", ".toml"]
+
+
+def load_pipeline_file(path):
+    """Return the content of the YAML or TOML file `path`."""
+
+    path = Path(path)
+    if path.suffix not in PIPELINE_SUFFIXES:
+        raise ImproperlyConfigured(
+            _("Unsupported pipeline file `{path}`: expected extensions are {suffixes}").format(
+                path=path, suffixes=", ".join(PIPELINE_SUFFIXES)
+            )
+        )
+
+    if path.suffix == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError as e:
+                raise ImproperlyConfigured(
+                    _("Reading TOML files requires Python 3.11 or the `tomli` package")
+                ) from e
+        with open(path, "rb") as stream:
+            return tomllib.load(stream)
+
+    with open(path, "r") as stream:
+        return yaml.safe_load(stream)
+
+
+class Hook:
+    """Reference to a function named `name` in the hooks file"""
+
+    def __init__(self, name, hooks_file):
+        self.name = name
+        self.hooks_file = hooks_file
+        self._func = None
+
+    def node(self):
+        """Return the syntax tree of the definition of the hook."""
+
+        if self.hooks_file is None or not Path(self.hooks_file).exists():
+            raise ImproperlyConfigured(
+                _("The hook `{name}` is used but there is no hooks file").format(name=self.name)
+            )
+
+        tree = ast.parse(Path(self.hooks_file).read_text(), filename=str(self.hooks_file))
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                if node.name == self.name:
+                    return node
+            elif isinstance(node, ast.Assign):
+                if any(isinstance(t, ast.Name) and t.id == self.name for t in node.targets):
+                    return node
+
+        raise ImproperlyConfigured(
+            _("The hook `{name}` is not defined in `{hooks_file}`").format(
+                name=self.name, hooks_file=self.hooks_file
+            )
+        )
+
+    def fingerprint(self):
+        # The whole hooks file is hashed as the hook might use any of its
+        # functions, constants or imports. The dump of the syntax tree
+        # ignores comments and formatting.
+        self.node()
+        tree = ast.parse(Path(self.hooks_file).read_text(), filename=str(self.hooks_file))
+        return hashlib.sha256(ast.dump(tree).encode("utf-8")).hexdigest()
+
+    def resolve(self):
+        """Import the hooks file and return the hook."""
+
+        if self._func is None:
+            self.node()
+            spec = importlib.util.spec_from_file_location(Path(self.hooks_file).stem, self.hooks_file)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            self._func = getattr(module, self.name)
+        return self._func
+
+
+class OperationSpec:
+    """Operation of a pipeline file"""
+
+    def __init__(self, name, args=(), kwargs=None, cache=False):
+        self.name = name
+        self.args = list(args)
+        self.kwargs = kwargs or {}
+        self.cache = cache
+
+    @classmethod
+    def from_entry(cls, entry, hooks_file=None):
+        if not isinstance(entry, dict) or len(entry) != 1:
+            raise ImproperlyConfigured(
+                _("Incorrect operation `{entry}`: a dictionary with a single key is expected").format(entry=entry)
+            )
+
+        name, value = next(iter(entry.items()))
+        value = resolve_hooks(value, hooks_file)
+        if isinstance(value, dict):
+            kwargs = dict(value)
+            args = kwargs.pop("args", [])
+            if not isinstance(args, list):
+                args = [args]
+            cache = kwargs.pop("cache", False)
+            return cls(name, args, kwargs, cache=cache)
+        elif isinstance(value, list):
+            return cls(name, value)
+        elif value is None:
+            return cls(name)
+        else:
+            return cls(name, [value])
+
+    def canonical(self):
+        return {
+            "name": self.name,
+            "args": canonical(self.args),
+            "kwargs": canonical(self.kwargs),
+        }
+
+    def hash(self):
+        data = json.dumps(self.canonical(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def build(self, docs):
+        """Add the operation to `docs` and return it."""
+
+        method = getattr(docs, self.name, None)
+        if method is None or not callable(method):
+            raise ImproperlyConfigured(_("Unknown operation `{name}`").format(name=self.name))
+
+        n_actions = len(docs.actions)
+        method(*materialize(self.args), **materialize(self.kwargs))
+        if len(docs.actions) != n_actions + 1:
+            raise ImproperlyConfigured(_("Unknown operation `{name}`").format(name=self.name))
+        action = docs.actions[-1]
+        action.spec_hash = self.hash()
+        if self.cache:
+            action.cache = True
+        return action
+
+
+def resolve_hooks(value, hooks_file):
+    """Replace ``{hook: name}`` dictionaries in `value` by `Hook` objects."""
+
+    if isinstance(value, dict):
+        if set(value) == {"hook"}:
+            return Hook(value["hook"], hooks_file)
+        return {k: resolve_hooks(v, hooks_file) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [resolve_hooks(v, hooks_file) for v in value]
+    return value
+
+
+def canonical(value):
+    if isinstance(value, Hook):
+        return {"hook": value.name, "ast": value.fingerprint()}
+    elif isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    return value
+
+
+def materialize(value):
+    if isinstance(value, Hook):
+        return value.resolve()
+    elif isinstance(value, dict):
+        return {k: materialize(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [materialize(v) for v in value]
+    return value
+
+
+class Pipeline:
+    """List of operations read from a pipeline file"""
+
+    def __init__(self, operations, path=None, hooks_file=None, dtypes=None, infer_dtypes=False):
+        self.operations = operations
+        self.path = path
+        self.hooks_file = hooks_file
+        self.dtypes = dtypes or {}
+        self.infer_dtypes = infer_dtypes
+
+    @classmethod
+    def from_file(cls, path):
+        path = Path(path)
+        content = load_pipeline_file(path) or {}
+        if not isinstance(content, dict):
+            raise ImproperlyConfigured(
+                _("The pipeline file `{path}` must contain a dictionary").format(path=path)
+            )
+
+        hooks_file = content.get("hooks")
+        if hooks_file is not None:
+            hooks_file = path.parent / hooks_file
+        elif (path.parent / "hooks.py").exists():
+            hooks_file = path.parent / "hooks.py"
+
+        operations = [
+            OperationSpec.from_entry(entry, hooks_file=hooks_file)
+            for entry in content.get("operations") or []
+        ]
+        return cls(
+            operations,
+            path=path,
+            hooks_file=hooks_file,
+            dtypes=content.get("dtypes"),
+            infer_dtypes=content.get("infer_dtypes", False),
+        )
+
+    def to_documents(self, **kwargs):
+        """Return a `Documents` object with the operations of the pipeline."""
+
+        from .helpers import Documents
+
+        docs = Documents(**kwargs)
+        for spec in self.operations:
+            spec.build(docs)
+        if self.dtypes or self.infer_dtypes:
+            docs.dtypes(self.dtypes, infer=self.infer_dtypes)
+        docs.pipeline = self
+        return docs
@@ -10,6 +10,6 @@ la classe. Par exemple
 
 from .attendance import PdfAttendance, PdfAttendanceFull
 from .gradebook import XlsGradeBookGroup, XlsGradeBookJury, XlsGradeBookNoGroup
-from .internal import XlsStudentData
+from .internal import Lineage, XlsStudentData
 from .moodle import CsvCreateGroups, CsvGroups, CsvGroupsGroupings
 from .students import SendEmail, ZoomBreakoutRooms
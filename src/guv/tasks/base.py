@@ -522,6 +522,16 @@ class ConfigOpt(CliArgsInheritMixin):
         else:
             return self.ask_config()
 
+    def config_from_directory(self, directory):
+        """Make the configuration file relative to `directory`.
+
+        The configuration cannot be asked for.
+        """
+
+        if self.config_file is None:
+            raise ImproperlyConfigured(_("The option `{argname}` is required").format(argname=self.config_argname))
+        self.config_file = str(Path(directory) / self.config_file)
+
     def validate_config(self, config):
         """Return a valid configuration.
 
@@ -584,6 +594,16 @@ class MultipleConfigOpt(CliArgsInheritMixin):
         else:
             return self.ask_config()
 
+    def config_from_directory(self, directory):
+        """Make the configuration files relative to `directory`.
+
+        The configurations cannot be asked for.
+        """
+
+        if not self.config_files:
+            raise ImproperlyConfigured(_("The option `{argname}` is required").format(argname=self.config_argname))
+        self.config_files = [str(Path(directory) / config_file) for config_file in self.config_files]
+
     def parse_config(self, config_files):
         configs = []
 
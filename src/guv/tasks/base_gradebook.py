@@ -1,20 +1,99 @@
 import shlex
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
 import pandas as pd
-from openpyxl import Workbook
+from doit.exceptions import TaskFailed
 from openpyxl.utils import get_column_letter
 
-from .. import openpyxl_patched  # noqa: F401 - Imported for side effects (patches openpyxl)
+from ..config import settings
+from ..exceptions import ImproperlyConfigured
 from ..logger import logger
-from ..openpyxl_utils import fit_cells_at_col, get_range_from_cells
+from ..openpyxl_grid import GridWorkbook
+from ..openpyxl_utils import AddressBuilder, max_text_length
 from ..translations import _, _file
-from ..utils import normalize_string, smart_cast
-from ..utils_config import Output, rel_to_dir
-from .base import CliArgsInheritMixin, UVTask
+from ..utils import normalize_string, positive_int, smart_cast_series
+from ..utils_config import Output, rel_to_dir, selected_uv
+from .base import CliArgsInheritMixin, SemesterTask, UVTask
 from .internal import XlsStudentData
 
 
+def run_gradebook(cls, planning, uv, info):
+    """Set up and run the gradebook task `cls` for `uv`.
+
+    Run in a worker process by `SemesterGradeBook`, an error is returned
+    as a message.
+    """
+
+    instance = cls(planning, uv, info)
+    instance.semester_wide = True
+    try:
+        instance.setup()
+        instance.run()
+    except Exception as e:
+        return str(e)
+    return None
+
+
+class SemesterGradeBook(SemesterTask):
+    """Run a gradebook task for the UVs of the semester.
+
+    The gradebook of each UV is generated in a process pool by
+    `run_gradebook`.
+    """
+
+    uptodate = False
+
+    def __init__(self, gradebook_cls):
+        super().__init__()
+        self.gradebook_cls = gradebook_cls
+
+    def task_name(self):
+        return self.gradebook_cls.task_name()
+
+    def doc(self):
+        return self.gradebook_cls.doc()
+
+    def setup(self):
+        super().setup()
+        self.targets = []
+
+        instances = [self.gradebook_cls(*args) for args in selected_uv()]
+        if not instances:
+            raise ImproperlyConfigured(_("No UV/UE specified in the `UVS` variable"))
+        for instance in instances:
+            instance.semester_wide = True
+
+        # Options of the semester are the same for every UV
+        instances[0].parse_args()
+        self.uvs, self.jobs = instances[0].uvs, instances[0].jobs
+        if self.uvs:
+            unknown = set(self.uvs) - {instance.uv for instance in instances}
+            if unknown:
+                raise ImproperlyConfigured(_("Unknown UV/UE in `--uvs`: {uvs}").format(uvs=", ".join(sorted(unknown))))
+            instances = [instance for instance in instances if instance.uv in self.uvs]
+
+        for instance in instances:
+            instance.setup()
+        self.instances = instances
+        self.file_dep = [instance.xls_merge for instance in instances]
+
+    def run(self):
+        args = [(self.gradebook_cls, instance.planning, instance.uv, instance.info) for instance in self.instances]
+        if self.jobs == 1 or len(args) == 1:
+            errors = [run_gradebook(*arg) for arg in args]
+        else:
+            with ProcessPoolExecutor(self.jobs) as executor:
+                errors = list(executor.map(run_gradebook, *zip(*args)))
+
+        failed = [(instance.uv, error) for instance, error in zip(self.instances, errors) if error is not None]
+        for uv, error in failed:
+            logger.error(_("The gradebook of `{uv}` failed: {error}").format(uv=uv, error=error))
+        if failed:
+            return TaskFailed(_("Gradebooks failed for {uvs}").format(uvs=", ".join(uv for uv, error in failed)))
+
+
 class AbstractGradeBook(UVTask, CliArgsInheritMixin):
     """Abstract UVTask that factor out all common gradebook logic"""
 
@@ -26,6 +105,38 @@ class AbstractGradeBook(UVTask, CliArgsInheritMixin):
     # issue if using issubclass in Sphinx's conf.py.
     doc_flag = True
 
+    # Whether an existing gradebook is updated, set by the tasks having an
+    # `--update` option
+    update = False
+
+    # Whether the task is run for the UVs of the semester
+    semester_wide = False
+
+    @classmethod
+    def create_doit_tasks_aux(cls):
+        # In a semester folder, the task is run for the UVs of the semester
+        if "SEMESTER" in settings and settings.UV_DIR is None:
+            return SemesterGradeBook(cls).to_doit_task()
+        return super().create_doit_tasks_aux()
+
+    def add_arguments(self):
+        super().add_arguments()
+
+        self.add_argument(
+            "--uvs",
+            metavar="UV,[UV,...]",
+            type=lambda t: [s.strip() for s in t.split(",")],
+            help=_("UVs/UEs of the semester to create a gradebook for when run from the semester folder (default: all)")
+        )
+
+        self.add_argument(
+            "-j",
+            "--jobs",
+            type=positive_int,
+            default=None,
+            help=_("Number of processes used to create the gradebooks of the semester (default: number of processors)")
+        )
+
     def get_columns(self):
         """Renvoie les colonnes utilisées pour créer la feuille de calcul.
 
@@ -55,16 +166,23 @@ class AbstractGradeBook(UVTask, CliArgsInheritMixin):
 
         return columns
 
-    def get_column_range(self, colname):
-        "Renvoie la plage de cellule de la colonne COLNAME sans l'en-tête."
+    def get_column_range(self, colname, addresses=None):
+        """Renvoie la plage de cellule de la colonne COLNAME sans l'en-tête.
+
+        La plage est relative à la feuille de `addresses`, la première
+        feuille par défaut.
+        """
 
         if colname not in self.first_df.columns:
             raise ValueError("Unknown column name: {}".format(colname))
 
+        if addresses is None:
+            addresses = AddressBuilder(self.first_ws)
+
         cells = self.first_df[colname]
         first, last = cells.iloc[0], cells.iloc[-1]
 
-        return get_range_from_cells(first, last)
+        return addresses.range(first, last)
 
     def setup(self):
         super().setup()
@@ -72,6 +190,12 @@ class AbstractGradeBook(UVTask, CliArgsInheritMixin):
         self.file_dep = [self.xls_merge]
         self.parse_args()
 
+        if self.semester_wide:
+            # Each UV has its own configuration files
+            self.config_from_directory(Path(settings.SEMESTER_DIR) / self.uv)
+        elif self.uvs:
+            raise ImproperlyConfigured(_("The option `--uvs` is only available in the semester folder"))
+
         # No targets to avoid circular deps in doit as we probably
         # want to aggregate target in effectif.xlsx
         self.targets = []
@@ -81,7 +205,9 @@ class AbstractGradeBook(UVTask, CliArgsInheritMixin):
         self.create_first_worksheet()
         self.create_other_worksheets()
         target = self.build_target(name=normalize_string(self.name, type="file"))
-        with Output(target, protected=True) as out:
+        # The updated gradebook is kept as a backup, as well as an existing
+        # one when nobody can be asked in a worker process
+        with Output(target, protected=True, backup=self.update or self.semester_wide) as out:
             self.workbook.save(out.target)
 
         logger.info(self.message(target))
@@ -95,7 +221,6 @@ class AbstractGradeBook(UVTask, CliArgsInheritMixin):
         return _file("XlsGradeBook_message").format(
             filename=rel_to_dir(target, self.settings.UV_DIR),
             columns=columns,
-            email=self.settings.EMAIL_COLUMN,
             command_line="guv " + " ".join(map(shlex.quote, sys.argv[1:]))
         )
 
@@ -117,10 +242,9 @@ class AbstractGradeBook(UVTask, CliArgsInheritMixin):
         return columns
 
     def create_first_worksheet(self):
-        # Create workbook and first worksheet named "data"
-        self.workbook = Workbook()
-        self.first_ws = self.workbook.active
-        self.first_ws.title = "data"
+        # Create workbook laid out in memory and first worksheet named "data"
+        self.workbook = GridWorkbook()
+        self.first_ws = self.workbook.create_sheet("data")
 
         # Pandas dataframe that mirrors the first worksheet
         self.first_df = pd.DataFrame()
@@ -139,23 +263,22 @@ class AbstractGradeBook(UVTask, CliArgsInheritMixin):
             # Update first_ws
             if type != "hide":
                 # Write header of column with Pandas style
-                self.first_ws.cell(1, idx).value = name
-                self.first_ws.cell(1, idx).style = "Pandas"
+                self.first_ws.cell(1, idx, name).style = "Pandas"
 
-                # Copy data from `data_df` if existing into first
-                # worksheet
+                # Copy data from `data_df` if existing into first worksheet.
+                # Convert to number from string once per column to avoid
+                # leading quote in Excel/LibreOffice
                 if name in self.data_df.columns:
-                    for i, value in enumerate(self.data_df[name]):
-                        # Try to convert to number from string to avoid leading
-                        # quote in Excel/LibreOffice
-                        value = smart_cast(value)
-                        self.first_ws.cell(i + 2, idx).value = value
+                    values = smart_cast_series(self.data_df[name])
+                else:
+                    values = [None] * N
 
                 # Get cells
-                cells = self.first_ws[get_column_letter(idx)][1 : (N + 1)]
+                cells = self.first_ws.write_column(self.first_ws.cell(2, idx), values)
 
                 # Fit width of column to actual content
-                fit_cells_at_col(self.first_ws.cell(1, idx), *cells)
+                width = max(max_text_length([name]), max_text_length(values))
+                self.first_ws.column_dimensions[get_column_letter(idx)].width = 1.3 * width
 
                 # Next column index
                 idx += 1
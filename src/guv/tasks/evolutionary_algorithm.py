@@ -1,5 +1,7 @@
 import numpy as np
 
+from .group_constraints import ConstraintGraph, PartitionState
+
 def generate_variants(partitions, num_variants=10, num_permutations=3):
     """
     Génère des variantes d'un vecteur en ajoutant une petite perturbation aléatoire.
@@ -29,16 +31,134 @@ def generate_variants(partitions, num_variants=10, num_permutations=3):
 def evaluate(partitions, penalty):
     """
     Fonction d'évaluation qui attribue un score à un vecteur (à définir selon le problème).
+
+    `penalty` est soit une matrice dense, soit un objet `ConstraintGraph`
+    qui n'utilise que les paires contraintes.
     """
 
+    if hasattr(penalty, "score"):
+        return penalty.score(partitions)
+
     coocurrences = (partitions[:, None, :] == partitions[:, :, None]).astype(int)
     return np.sum(coocurrences * penalty, axis=(1, 2))
 
 
+def default_rng():
+    """Générateur aléatoire initialisé par le générateur global de numpy.
+
+    Comme `generate_variants`, les résultats dépendent ainsi de
+    ``np.random.seed``.
+    """
+
+    return np.random.default_rng(np.random.randint(2**32, dtype=np.uint32))
+
+
+def generate_moves(n, num_permutations, rng=None, sizes=None):
+    """
+    Génère une permutation aléatoire de `num_permutations` positions parmi `n`.
+
+    L'élément ``targets[t]`` prend le groupe qu'avait ``sources[t]``. Si
+    `sizes` est fourni, les positions ont toutes la même taille pour ne pas
+    modifier la taille des groupes.
+    """
+
+    if rng is None:
+        rng = default_rng()
+
+    if sizes is not None:
+        candidates = np.flatnonzero(sizes == sizes[rng.integers(n)])
+        sources = rng.choice(candidates, size=min(num_permutations, len(candidates)), replace=False)
+        targets = rng.permutation(sources)
+        return targets, sources
+
+    sources = rng.choice(n, size=num_permutations, replace=False)
+    targets = rng.permutation(sources)
+    return targets, sources
+
+
+def evaluate_moves(state, moves):
+    """
+    Score de `state` après les déplacements `moves` sans modifier `state`.
+
+    Seules les paires touchant les éléments déplacés sont recalculées.
+    """
+
+    targets, sources = moves
+    return state.score + state.permutation_delta(targets, sources)
+
+
+def apply_moves(state, moves):
+    targets, sources = moves
+    state.permute(targets, sources)
+    return state
+
+
+def incremental_evolutionary_algorithm(initial_partition, graph, optimal_score, max_variants=1000, num_variants=10, num_permutations=4, top_k=3, rng=None, stop=None):
+    """
+    Algorithme évolutif dont les variantes sont évaluées par différence avec
+    leur parent à partir d'un `ConstraintGraph`.
+
+    `rng` est le générateur aléatoire utilisé et `stop` une fonction
+    renvoyant True pour arrêter l'algorithme avant `max_variants`.
+    """
+
+    if rng is None:
+        rng = default_rng()
+
+    states = [PartitionState(graph, initial_partition)]
+    sizes = None if graph.has_unit_sizes else graph.sizes
+    current_num_variants = 0
+    if states[0].score == optimal_score:
+        return current_num_variants, optimal_score, states[0].partition
+
+    while current_num_variants < max_variants:
+        # Génération et évaluation des variantes de chaque parent
+        candidates = []
+        for i, state in enumerate(states):
+            candidates.append((state.score, i, None))
+            for _ in range(num_variants - 1):
+                moves = generate_moves(graph.n, num_permutations, rng=rng, sizes=sizes)
+                candidates.append((evaluate_moves(state, moves), i, moves))
+        current_num_variants += len(candidates)
+
+        # Sélection des meilleurs, les égalités sont départagées au hasard
+        scores = np.array([c[0] for c in candidates])
+        best_indexes = np.lexsort((rng.random(len(candidates)), scores))[:top_k]
+
+        new_states = []
+        for k in best_indexes:
+            _, i, moves = candidates[k]
+            new_state = states[i].copy()
+            if moves is not None:
+                apply_moves(new_state, moves)
+            new_states.append(new_state)
+        states = new_states
+
+        if states[0].score == optimal_score:
+            return current_num_variants, optimal_score, states[0].partition
+
+        if stop is not None and stop():
+            break
+
+    return current_num_variants, states[0].score, states[0].partition
+
+
 def evolutionary_algorithm(initial_partition, penalty, optimal_score, max_variants=1000, num_variants=10, num_permutations=4, top_k=3):
     """
     Algorithme évolutif qui génère et sélectionne les meilleurs vecteurs sur plusieurs générations.
     """
+
+    if isinstance(penalty, ConstraintGraph):
+        return incremental_evolutionary_algorithm(
+            initial_partition,
+            penalty,
+            optimal_score,
+            max_variants=max_variants,
+            num_variants=num_variants,
+            num_permutations=num_permutations,
+            top_k=top_k,
+        )
+
     current_partitions = initial_partition[None, :]
     current_num_variants = 0
 
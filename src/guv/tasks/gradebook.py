@@ -1,23 +1,31 @@
 import json
+from collections import Counter
+from functools import cached_property
 from importlib.resources import files
 from pathlib import Path
 
 import jsonschema
+import pandas as pd
 import yaml
 from openpyxl.formatting.rule import CellIsRule
 from openpyxl.styles import Alignment, PatternFill
 from openpyxl.utils import get_column_letter
 
 from .. import openpyxl_patched  # noqa: F401 - Imported for side effects (patches openpyxl)
-from ..openpyxl_utils import (fit_columns_dimension, frame_range,
-                              generate_ranges, get_address_of_cell,
-                              get_range_from_cells, get_segment, row_and_col)
+from ..exceptions import GuvUserError
+from ..logger import logger
+from ..openpyxl_utils import (AddressBuilder, col_and_row, fit_cells_at_col,
+                              fit_columns_dimension, frame_range,
+                              generate_ranges, get_segment, row_and_col)
 from ..translations import Docstring, _, _file
-from ..utils import generate_groupby, normalize_string, sort_values
+from ..utils import generate_groupby, normalize_string, positive_int, smart_cast_series, sort_values
 from ..utils_ask import checkboxlist_prompt, prompt_number
-from ..utils_config import ask_choice, rel_to_dir
+from ..utils_config import Output, ask_choice, rel_to_dir
 from . import base
 from . import base_gradebook as baseg
+from .gradebook_evaluator import (evaluate_jury, evaluate_marking_scheme,
+                                  percentile, read_entered_grades)
+from .internal import XlsStudentData
 
 __all__ = ["XlsGradeBookGroup", "XlsGradeBookJury", "XlsGradeBookNoGroup"]
 
@@ -25,17 +33,25 @@ __all__ = ["XlsGradeBookGroup", "XlsGradeBookJury", "XlsGradeBookNoGroup"]
 def generate_tree_blocks_coordinates(tree):
     """Generate coordinates of rectangles according to a tree"""
 
+    # Depth and number of leaves of each subtree, computed once
+    depths = {}
+    n_leaves = {}
+
     def compute_depth(tree):
-        if isinstance(tree, dict):
-            return 1 + max(compute_depth(child) for child in tree.values())
-        else:
-            return 1
+        if id(tree) not in depths:
+            if isinstance(tree, dict):
+                depths[id(tree)] = 1 + max(compute_depth(child) for child in tree.values())
+            else:
+                depths[id(tree)] = 1
+        return depths[id(tree)]
 
     def compute_n_leaves(tree):
-        if isinstance(tree, dict):
-            return sum(compute_n_leaves(child) for child in tree.values())
-        else:
-            return 1
+        if id(tree) not in n_leaves:
+            if isinstance(tree, dict):
+                n_leaves[id(tree)] = sum(compute_n_leaves(child) for child in tree.values())
+            else:
+                n_leaves[id(tree)] = 1
+        return n_leaves[id(tree)]
 
     depth = compute_depth(tree) - 1
 
@@ -81,33 +97,73 @@ class MarkingScheme:
         self.points_cells = None
         self.scale_cells = None
         self.bottom_right = None
+        self.transposed = False
+        self.addresses = None
 
-    @property
+    @cached_property
     def scales(self):
         return get_values(self.tree, "scale")
 
-    @property
+    @cached_property
     def points(self):
         """Return depth-first list of points"""
         return get_values(self.tree, "points")
 
+    @cached_property
+    def blocks(self):
+        """Return the blocks of the marking scheme and its height and width.
+
+        Blocks are the names of the parts and questions with their
+        coordinates and size relative to the upper left cell. They are
+        computed once and stamped in each worksheet by `write`.
+        """
+
+        blocks = list(generate_tree_blocks_coordinates(self.tree))
+        height = max(i + di for name, i, j, di, dj in blocks)
+        width = max(j + dj for name, i, j, di, dj in blocks)
+        return blocks, height, width
+
     @property
     def n_grades(self):
         return len(self.points)
 
-    def write(self, ref):
+    def along(self, cell, step=1):
+        """Move along the questions, downwards unless transposed."""
+
+        return cell.right(step) if self.transposed else cell.below(step)
+
+    def across(self, cell, step=1):
+        """Move across the questions, rightwards unless transposed."""
+
+        return cell.below(step) if self.transposed else cell.right(step)
+
+    def align(self, cell1, cell2):
+        """Return the cell on the question of `cell1` and across at `cell2`."""
+
+        return col_and_row(cell1, cell2) if self.transposed else row_and_col(cell1, cell2)
+
+    def write_line(self, ref, values):
+        """Write `values` along the questions from `ref`, return the cells."""
+
+        if self.transposed:
+            return ref.parent.write_row(ref, values)
+        return ref.parent.write_column(ref, values)
+
+    def write(self, ref, transposed=False):
         self.top_left = ref
+        self.transposed = transposed
+        self.addresses = AddressBuilder(ref.parent)
 
         # Write marking scheme
         bottom_right = self.write_marking_scheme(ref)
 
-        ref_points = row_and_col(ref, bottom_right).right()
+        ref_points = self.across(self.align(ref, bottom_right))
         self.write_points_column(ref_points)
 
-        ref_scales = row_and_col(ref, bottom_right).right(2)
+        ref_scales = self.across(self.align(ref, bottom_right), 2)
         self.write_scales_column(ref_scales)
 
-        self.bottom_right = bottom_right.right(2)
+        self.bottom_right = self.across(bottom_right, 2)
         return self.bottom_right
 
     def write_marking_scheme(self, ref):
@@ -115,59 +171,81 @@ class MarkingScheme:
 
         row = ref.row
         col = ref.col_idx
-        maxi = maxj = -1
         worksheet = ref.parent
-
-        for name, i, j, di, dj in generate_tree_blocks_coordinates(self.tree):
-            maxi = max(maxi, i + di)
-            maxj = max(maxj, j + dj)
+        blocks, maxi, maxj = self.blocks
+        if self.transposed:
+            maxi, maxj = maxj, maxi
+
+        al = Alignment(horizontal="center", vertical="center")
+        for name, i, j, di, dj in blocks:
+            if self.transposed:
+                i, j, di, dj = j, i, dj, di
             worksheet.merge_cells(
                 start_row=row + i,
                 start_column=col + j,
                 end_row=row + i + di - 1,
                 end_column=col + j + dj - 1,
             )
-            worksheet.cell(row=row + i, column=col + j).value = name
-            al = Alignment(horizontal="center", vertical="center")
-            worksheet.cell(row=row + i, column=col + j).alignment = al
+            cell = worksheet.cell(row=row + i, column=col + j, value=name)
+            cell.alignment = al
 
         return worksheet.cell(row=row + maxi - 1, column=col + maxj - 1)
 
     def write_points_column(self, ref):
         # Column of points
-        ref.above().text(_("Points"))
+        self.along(ref, -1).text(_("Points"))
 
-        for i, points in enumerate(self.points):
-            ref.below(i).text(points)
-        self.points_cells = [ref.below(i) for i in range(len(self.points))]
+        self.points_cells = self.write_line(ref, self.points)
 
-        ref_points_last = ref.below(len(self.points) - 1)
+        ref_points_last = self.along(ref, len(self.points) - 1)
 
-        range_cell = get_range_from_cells(ref, ref_points_last)
-        self.global_total = ref_points_last.below(2).text(f"=SUM({range_cell})")
-        self.global_total_rescale = ref_points_last.below(3).text(20)
+        range_cell = self.addresses.range(ref, ref_points_last)
+        self.global_total = self.along(ref_points_last, 2).text(f"=SUM({range_cell})")
+        self.global_total.cached_value = sum(self.points)
+        self.global_total_rescale = self.along(ref_points_last, 3).text(20)
 
-        ref_points_last.below(2).left().text(_("Grade"))
-        ref_points_last.below(3).left().text(_("Grade /20"))
+        self.across(self.along(ref_points_last, 2), -1).text(_("Grade"))
+        self.across(self.along(ref_points_last, 3), -1).text(_("Grade /20"))
 
     def write_scales_column(self, ref):
         # Column of scales
-        ref.above().text(_("Scale"))
+        self.along(ref, -1).text(_("Scale"))
 
-        for i, scale in enumerate(self.scales):
-            ref.below(i).text(scale)
-        self.scale_cells = [ref.below(i) for i in range(len(self.scales))]
+        self.scale_cells = self.write_line(ref, self.scales)
 
     def get_formula(self, cells):
-        subformula = " + ".join(
-            "{points} * {grade} / {scale}".format(
-                points=get_address_of_cell(points_cell, absolute=True),
-                grade=get_address_of_cell(grade_cell),
-                scale=get_address_of_cell(scale_cell, absolute=True)
-            )
-            for grade_cell, points_cell, scale_cell in zip(cells, self.points_cells, self.scale_cells)
+        """Return the formula of the total of the grades in `cells`.
+
+        `cells` are contiguous and in the same order as the points and scales
+        so the total is a single SUMPRODUCT over the three ranges whatever
+        the number of questions. Text in grades still yields an error.
+        """
+
+        cells = list(cells)
+        return "SUMPRODUCT({points}*{grades}/{scales})".format(
+            points=self.addresses.range(self.points_cells[0], self.points_cells[-1], absolute=True),
+            grades=self.addresses.range(cells[0], cells[-1]),
+            scales=self.addresses.range(self.scale_cells[0], self.scale_cells[-1], absolute=True),
+        )
+
+    def evaluate(self, grade_cells):
+        """Return the values of the totals and the grades /20.
+
+        `grade_cells` holds the grade cells of each student, the values are
+        the ones the formulas of `write` and `get_formula` evaluate to.
+        """
+
+        return self.evaluate_values([[cell.value for cell in cells] for cells in grade_cells])
+
+    def evaluate_values(self, grades):
+        """Same as `evaluate` with the values of the grade cells."""
+
+        return evaluate_marking_scheme(
+            self.points,
+            self.scales,
+            grades,
+            rescaling=self.global_total_rescale.value
         )
-        return subformula
 
 
 class XlsGradeBookNoGroup(baseg.AbstractGradeBook, base.MultipleConfigOpt):
@@ -179,6 +257,12 @@ class XlsGradeBookNoGroup(baseg.AbstractGradeBook, base.MultipleConfigOpt):
     config_number = _("How many grading scales? ")
     config_num = _("Grading scale {i}")
 
+    # Sheets with more students are split into several sheets
+    max_students_default = 200
+
+    # Whether students can be laid out in rows
+    transposable = True
+
     def __init__(self, planning, uv, info):
         super().__init__(planning, uv, info)
 
@@ -310,6 +394,78 @@ class XlsGradeBookNoGroup(baseg.AbstractGradeBook, base.MultipleConfigOpt):
             help=_("Additional columns to include in the grade sheet")
         )
 
+        self.add_argument(
+            "--max-students",
+            metavar="N",
+            type=positive_int,
+            default=self.max_students_default,
+            help=_("Maximum number of students in a sheet, larger sheets are split (default: {default})").format(
+                default=self.max_students_default
+            )
+        )
+
+        if self.transposable:
+            self.add_argument(
+                "-t",
+                "--transpose",
+                action="store_true",
+                help=_("One row per student instead of one column per student")
+            )
+
+        self.add_argument(
+            "--update",
+            action="store_true",
+            help=_("Update the existing gradebook with the students of the central file and keep the grades already entered")
+        )
+
+    def read_entered_grades(self):
+        """Read the grades entered in the gradebook to update.
+
+        Grades are kept by marking scheme and by email, the students of
+        the central file are compared to the ones of the gradebook.
+        """
+
+        target = self.build_target(name=normalize_string(self.name, type="file"))
+        if not Path(target).exists():
+            raise GuvUserError(_("The gradebook `{fn}` to update does not exist").format(
+                fn=rel_to_dir(target, self.settings.SEMESTER_DIR)
+            ))
+
+        marking_schemes = {ms.name + " " + _("raw"): ms for ms in self.marking_schemes}
+        self.entered_grades = read_entered_grades(
+            target, self.settings.EMAIL_COLUMN, list(marking_schemes)
+        )
+
+        for colname, ms in marking_schemes.items():
+            if colname not in self.entered_grades:
+                logger.warning(_("No grades of `%s` in the gradebook to update"), ms.name)
+            entered = self.entered_grades.get(colname, {})
+            if any(len(grades.values) != ms.n_grades for grades in entered.values()):
+                raise GuvUserError(_("The marking scheme `{name}` has changed, the grades entered cannot be kept").format(
+                    name=ms.name
+                ))
+
+        emails = set(self.data_df[self.settings.EMAIL_COLUMN].dropna())
+        previous = set().union(*self.entered_grades.values())
+        logger.info(
+            _("Update of the gradebook: %d student(s) added, %d removed"),
+            len(emails - previous),
+            len(previous - emails)
+        )
+        for email in sorted(previous - emails):
+            if any(
+                any(value is not None for value in entered[email].values)
+                for entered in self.entered_grades.values()
+                if email in entered
+            ):
+                logger.warning(_("The grades of `%s` who is no longer a student are not kept"), email)
+
+    def entered_grades_of(self, ms, record):
+        """Return the grades entered for `record` with `ms` or None."""
+
+        entered = self.entered_grades.get(ms.name + " " + _("raw"), {})
+        return entered.get(record[self.settings.EMAIL_COLUMN])
+
     @property
     def marking_schemes(self):
         ms = [
@@ -338,6 +494,11 @@ class XlsGradeBookNoGroup(baseg.AbstractGradeBook, base.MultipleConfigOpt):
 
         order_by = self.order_by if self.order_by is not None else self.settings.LASTNAME_COLUMN
 
+        # Grades to keep from the gradebook to update
+        self.entered_grades = {}
+        if self.update:
+            self.read_entered_grades()
+
         if self.group_by is not None:
             gen_group = list(generate_groupby(self.first_df, self.group_by))
         else:
@@ -346,53 +507,78 @@ class XlsGradeBookNoGroup(baseg.AbstractGradeBook, base.MultipleConfigOpt):
         for ms in self.marking_schemes:
             for name, group in gen_group:
                 group = sort_values(group, [order_by])
-                self.create_worksheet(name, ms, group)
+                shards = self.split_group(group)
+                for i, shard in enumerate(shards):
+                    part = i + 1 if len(shards) > 1 else None
+                    self.create_worksheet(name, ms, shard, part=part)
+
+    def split_group(self, group):
+        """Split the students of a worksheet in at most `max_students`."""
+
+        n = self.max_students
+        if n is None or len(group.index) <= n:
+            return [group]
+
+        return [group.iloc[i:i + n] for i in range(0, len(group.index), n)]
+
+    def create_worksheet(self, name, ms, group, part=None):
+        """Create one worksheet for group with marking scheme and name.
 
-    def create_worksheet(self, name, ms, group):
-        """Create one worksheet for group with marking scheme and name."""
+        `part` numbers the worksheets of a group that is split.
+        """
 
         worksheet_name = name if name else ms.name
+        if part is not None:
+            worksheet_name += f" ({part})"
         worksheet_name = normalize_string(worksheet_name, type="excel")
         gradesheet = self.workbook.create_sheet(title=worksheet_name)
 
-        # Make current worksheet the default one, useful for get_address_of_cell
-        self.workbook.active = gradesheet
+        # Addresses in the formulas written on the worksheet
+        addresses = AddressBuilder(gradesheet)
 
         # Leave room from statistics
-        ref_stats = gradesheet.cell(4, 2)
+        transposed = self.transpose
+        ref_stats = gradesheet.cell(2, 4) if transposed else gradesheet.cell(4, 2)
         formula = '=IF(ISERROR(QUARTILE({{marks_range}}, {num})), "", QUARTILE({{marks_range}}, {num}))'
         stats = [
             (name, formula.format(num=num))
             for name, num in ((_("Min"), 0), (_("Q1"), 1), (_("median"), 2), (_("Q3"), 3), (_("Max"), 4))
         ]
-        ref_marking_scheme = ref_stats.right(len(stats))
+        ref_marking_scheme = ref_stats.below(len(stats)) if transposed else ref_stats.right(len(stats))
 
-        bottom_right = ms.write(ref_marking_scheme)
-        ref = row_and_col(ref_marking_scheme, bottom_right).right()
+        bottom_right = ms.write(ref_marking_scheme, transposed=transposed)
+        ref = ms.across(ms.align(ref_marking_scheme, bottom_right))
 
         # Freeze the structure
-        gradesheet.freeze_panes = ref.top()
+        gradesheet.freeze_panes = ref if transposed else ref.top()
+
+        # Same for all students
+        global_total = addresses.address(ms.global_total, absolute=True)
+        rescaling = addresses.address(ms.global_total_rescale, absolute=True)
 
         def insert_record(ref_cell, i, record):
-            """Insert a column in worksheet"""
+            """Insert a column (a row if transposed) in worksheet"""
 
             # Header, last name and first name
             index = ref_cell.text(_("Student {i}").format(i=i))
-            last_name = index.below().text(record[self.settings.LASTNAME_COLUMN])
-            first_name = last_name.below().text(record[self.settings.NAME_COLUMN])
+            last_name = ms.along(index).text(record[self.settings.LASTNAME_COLUMN])
+            first_name = ms.along(last_name).text(record[self.settings.NAME_COLUMN])
 
             # Other important cells
-            first_grade = first_name.below()
-            last_grade = row_and_col(ms.bottom_right, first_grade)
-            total = last_grade.below(2)
-            total_rescaled = total.below()
+            first_grade = ms.along(first_name)
+            last_grade = ms.align(ms.bottom_right, first_grade)
+            total = ms.along(last_grade, 2)
+            total_rescaled = ms.along(total)
 
             # Formula to compute grade with points/scale
-            cells = get_segment(first_grade, last_grade)
+            cells = list(get_segment(first_grade, last_grade))
+            if (entered := self.entered_grades_of(ms, record)) is not None:
+                for cell, value in zip(cells, entered.values):
+                    cell.value = value
             subformula = ms.get_formula(cells)
 
             # Use COUNTBLANK to display grade once every points is available
-            marks_range = get_range_from_cells(first_grade, last_grade)
+            marks_range = addresses.range(first_grade, last_grade)
             formula = '=IF(COUNTBLANK({marks_range}) > 0, "", {subformula})'.format(
                 marks_range=marks_range,
                 subformula=subformula
@@ -401,57 +587,72 @@ class XlsGradeBookNoGroup(baseg.AbstractGradeBook, base.MultipleConfigOpt):
 
             total_rescaled.text(
                 '=IF(ISTEXT({stu_total}),"",{stu_total}/{global_total}*{rescaling})'.format(
-                    stu_total=get_address_of_cell(total),
-                    global_total=get_address_of_cell(ms.global_total, absolute=True),
-                    rescaling=get_address_of_cell(ms.global_total_rescale, absolute=True)
+                    stu_total=addresses.address(total),
+                    global_total=global_total,
+                    rescaling=rescaling
                 )
             )
 
             # Link total_rescaled to cell in first worksheet
             cell = record[ms.name]
-            cell.value = "=" + get_address_of_cell(
+            cell.value = "=" + addresses.address(
                 total_rescaled, add_worksheet_name=True, absolute=True
             )
 
             # Link total to cell in first worksheet
             cell = record[ms.name + " " + _("raw")]
-            cell.value = "=" + get_address_of_cell(
+            cell.value = "=" + addresses.address(
                 total, add_worksheet_name=True, absolute=True
             )
 
+            students.append((cells, total, total_rescaled, record))
             return total_rescaled
 
         ref_cells = []
+        students = []
         for j, (index, record) in enumerate(group.iterrows()):
-            ref_cell = ref.right(j).above(3)
+            ref_cell = ms.along(ms.across(ref, j), -3)
             ref_cells.append(ref_cell)
             last_cell = insert_record(ref_cell, j + 1, record)
 
-        # Add statistics of grades
+        # Store the values of the totals along with their formulas
+        totals, totals_rescaled = ms.evaluate([student[0] for student in students])
+        for (cells, total, total_rescaled, record), value, value_rescaled in zip(
+            students, totals, totals_rescaled
+        ):
+            total.cached_value = record[ms.name + " " + _("raw")].cached_value = value
+            total_rescaled.cached_value = record[ms.name].cached_value = value_rescaled
+
+        # Add statistics of grades of the students of the worksheet
         for i, (first, last) in enumerate(zip(
-            get_segment(ref, row_and_col(last_cell, ref)),
-            get_segment(row_and_col(ref, last_cell), last_cell),
+            get_segment(ref, ms.align(last_cell, ref)),
+            get_segment(ms.align(ref, last_cell), last_cell),
         )):
-            marks_range = get_range_from_cells(first, last)
+            marks_range = addresses.range(first, last)
             for j, (name, formula) in enumerate(stats):
                 if i == 0:
-                    ref_stats.right(j).below(-1).text(name).center()
-                ref_stats.right(j).below(i).text(formula.format(marks_range=marks_range))
+                    ms.along(ms.across(ref_stats, j), -1).text(name).center()
+                ms.along(ms.across(ref_stats, j), i).text(formula.format(marks_range=marks_range))
 
         # Set column dimensions
-        fit_columns_dimension(*[c for ref in ref_cells for c in [ref.below(1), ref.below(2)]])
+        names = [c for ref in ref_cells for c in [ms.along(ref, 1), ms.along(ref, 2)]]
+        if transposed:
+            fit_cells_at_col(*names)
+        else:
+            fit_columns_dimension(*names)
 
         # Around grades
-        frame_range(ref.above(3), last_cell.above(3))
+        frame_range(ms.along(ref, -3), ms.along(last_cell, -3))
 
         # Around totals
-        frame_range(row_and_col(last_cell, ref).above(), last_cell)
+        frame_range(ms.along(ms.align(last_cell, ref), -1), last_cell)
 
 
 class XlsGradeBookGroup(XlsGradeBookNoGroup):
     __doc__ = Docstring()
 
     config_argname = "--marking-scheme"
+    transposable = False
 
     def get_columns(self):
         columns = super().get_columns()
@@ -478,18 +679,38 @@ class XlsGradeBookGroup(XlsGradeBookNoGroup):
 
         super().create_first_worksheet()
 
-    def create_worksheet(self, name, ms, group):
+    def split_group(self, group):
+        """Split the groups of a worksheet in at most `max_students` students.
+
+        Groups are never split, they are taken in the order of the worksheet.
+        """
+
+        n = self.max_students
+        if n is None or len(group.index) <= n:
+            return [group]
+
+        shards = [[]]
+        size = 0
+        for subname, subgroup in group.groupby(self.subgroup_by):
+            if shards[-1] and size + len(subgroup.index) > n:
+                shards.append([])
+                size = 0
+            shards[-1].append(subgroup)
+            size += len(subgroup.index)
+
+        return [group.loc[pd.concat(shard).index] for shard in shards]
+
+    def create_worksheet(self, name, ms, group, part=None):
         if name:
             worksheet_name = ms.name + " " + name
         else:
             worksheet_name = ms.name
+        if part is not None:
+            worksheet_name += f" ({part})"
 
         worksheet_name = normalize_string(worksheet_name, type="excel")
         gradesheet = self.workbook.create_sheet(title=worksheet_name)
 
-        # Make current worksheet the default one, useful for get_address_of_cell
-        self.workbook.active = gradesheet
-
         # Leave room from statistics
         ref_marking_scheme = gradesheet.cell(4, 2)
 
@@ -514,7 +735,8 @@ class XlsGradeBookGroup(XlsGradeBookNoGroup):
                 group_name=subname,
                 group=subgroup,
                 header=header,
-                settings=self.settings
+                settings=self.settings,
+                entered_grades=[self.entered_grades_of(ms, record) for index, record in subgroup.iterrows()]
             )
             blocks.append(block)
             block.write(ref)
@@ -523,13 +745,16 @@ class XlsGradeBookGroup(XlsGradeBookNoGroup):
 
 
 class GroupBlock:
-    def __init__(self, marking_scheme, group_name, group, header, settings):
+    def __init__(self, marking_scheme, group_name, group, header, settings, entered_grades=None):
         self.marking_scheme = marking_scheme
         self.header = header
         self.group_name = group_name
         self.group = group
         self.settings = settings
 
+        # Grades entered for each student of the group when updating
+        self.entered_grades = entered_grades or [None] * len(group.index)
+
         self.bottom_right = None
 
     @property
@@ -548,6 +773,11 @@ class GroupBlock:
     def write(self, ref_cell):
         self.N = len(self.group)  # Number of students
 
+        # Addresses in the formulas written on the worksheet
+        addresses = AddressBuilder(ref_cell.parent)
+        global_total = addresses.address(self.marking_scheme.global_total, absolute=True)
+        rescaling = addresses.address(self.marking_scheme.global_total_rescale, absolute=True)
+
         self.first_student = ref_cell.right()
         self.last_student = ref_cell.right(self.N)
 
@@ -571,8 +801,33 @@ class GroupBlock:
         group_grade_cells = list(get_segment(group_first_grade, group_last_grade))
         subformula = self.marking_scheme.get_formula(group_grade_cells)
 
+        # Restore the grades of the group and of each student: a grade of
+        # the group is the most common one mirrored by its students, other
+        # grades are individual ones
+        entered = [grades for grades in self.entered_grades if grades is not None]
+        for i, group_cell in enumerate(group_grade_cells):
+            mirrored = [grades.values[i] for grades in entered if grades.mirrored[i]]
+            if mirrored:
+                group_cell.value = Counter(mirrored).most_common(1)[0][0]
+
+        group_values = [cell.value for cell in group_grade_cells]
+        individuals, students_values = [], []
+        for grades in self.entered_grades:
+            if grades is None:
+                individual = [False] * self.n_grades
+            else:
+                individual = [
+                    not is_mirrored or value != group_value
+                    for value, is_mirrored, group_value in zip(grades.values, grades.mirrored, group_values)
+                ]
+            individuals.append(individual)
+            students_values.append([
+                grades.values[i] if is_individual else group_value
+                for i, (is_individual, group_value) in enumerate(zip(individual, group_values))
+            ])
+
         # Use COUNTBLANK to display total grades once every grade is available
-        marks_range = get_range_from_cells(group_first_grade, group_last_grade)
+        marks_range = addresses.range(group_first_grade, group_last_grade)
         formula = '=IF(COUNTBLANK({marks_range}) > 0, "", {subformula})'.format(
             marks_range=marks_range,
             subformula=subformula
@@ -581,17 +836,24 @@ class GroupBlock:
 
         group_total_rescaled.text(
             '=IF(ISTEXT({group_total}),"",{group_total}/{global_total}*{rescaling})'.format(
-                group_total=get_address_of_cell(group_total),
-                global_total=get_address_of_cell(self.marking_scheme.global_total, absolute=True),
-                rescaling=get_address_of_cell(self.marking_scheme.global_total_rescale, absolute=True)
+                group_total=addresses.address(group_total),
+                global_total=global_total,
+                rescaling=rescaling
             )
         )
 
+        # Values of the totals of the group and of each student
+        totals, totals_rescaled = self.marking_scheme.evaluate_values([group_values] + students_values)
+        group_total.cached_value = totals[0]
+        group_total_rescaled.cached_value = totals_rescaled[0]
+
         # Next columns are per-student columns
         gen = generate_ranges(self.first_student, self.first_student.below(self.total_height-1), nranges=self.N)
 
         # Group student dataframe record and corresponding column range
-        for stu_range, (index, record) in zip(gen, self.group.iterrows()):
+        for stu_range, (index, record), stu_values, individual, total, total_rescaled in zip(
+            gen, self.group.iterrows(), students_values, individuals, totals[1:], totals_rescaled[1:]
+        ):
             # Important cells
             idx_cell = stu_range[0]
             lastname_cell = stu_range[1]
@@ -604,39 +866,50 @@ class GroupBlock:
             lastname_cell.value = record[self.settings.LASTNAME_COLUMN]
             name_cell.value = record[self.settings.NAME_COLUMN]
 
-            # Mirror group grade
+            # Mirror group grade unless an individual grade is restored
             stu_grade_cells = list(get_segment(stu_first_grade, stu_last_grade))
-            for group_cell, stu_cell in zip(group_grade_cells, stu_grade_cells):
+            for group_cell, stu_cell, value, is_individual in zip(
+                group_grade_cells, stu_grade_cells, stu_values, individual
+            ):
+                if is_individual:
+                    stu_cell.value = value
+                    continue
                 stu_cell.value = '=IF(ISBLANK({addr}),"",{addr})'.format(
-                    addr=get_address_of_cell(group_cell)
+                    addr=addresses.address(group_cell)
                 )
+                stu_cell.cached_value = "" if group_cell.value is None else group_cell.value
 
             # Total of student
             subformula = self.marking_scheme.get_formula(stu_grade_cells)
 
             # Use COUNTBLANK to display grade once every points is available
-            marks_range = get_range_from_cells(stu_first_grade, stu_last_grade)
+            marks_range = addresses.range(stu_first_grade, stu_last_grade)
             formula = '=IF(COUNTBLANK({marks_range}) > 0, "", {subformula})'.format(
                 marks_range=marks_range,
                 subformula=subformula
             )
             stu_total.value = formula
+            stu_total.cached_value = total
 
             # Total of student rescaled
             stu_total_rescaled.text(
                 '=IF(ISTEXT({stu_total}),"",{stu_total}/{global_total}*{rescaling})'.format(
-                    stu_total=get_address_of_cell(stu_total),
-                    global_total=get_address_of_cell(self.marking_scheme.global_total, absolute=True),
-                    rescaling=get_address_of_cell(self.marking_scheme.global_total_rescale, absolute=True)
+                    stu_total=addresses.address(stu_total),
+                    global_total=global_total,
+                    rescaling=rescaling
                 )
             )
 
-            record[self.marking_scheme.name].value = "=" + get_address_of_cell(
+            stu_total_rescaled.cached_value = total_rescaled
+
+            record[self.marking_scheme.name].value = "=" + addresses.address(
                 stu_total_rescaled, add_worksheet_name=True
             )
-            record[self.marking_scheme.name + " " + _("raw")].value = "=" + get_address_of_cell(
+            record[self.marking_scheme.name].cached_value = total_rescaled
+            record[self.marking_scheme.name + " " + _("raw")].value = "=" + addresses.address(
                 stu_total, add_worksheet_name=True
             )
+            record[self.marking_scheme.name + " " + _("raw")].cached_value = total
 
         bottom_right = ref_cell.below(self.total_height - 1).right(self.N)
         self.bottom_right = bottom_right
@@ -659,11 +932,50 @@ class XlsGradeBookJury(baseg.AbstractGradeBook, base.ConfigOpt):
     def __init__(self, planning, uv, info):
         super().__init__(planning, uv, info)
 
+    def add_arguments(self):
+        super().add_arguments()
+
+        self.add_argument(
+            "--preview",
+            action="store_true",
+            help=_("Only compute the outcome of the jury, display it and write it in a CSV file")
+        )
+
     def message(self, target):
         return _file("XlsGradeBookJury_message").format(
             filename=rel_to_dir(target, self.settings.UV_DIR)
         )
 
+    def run(self):
+        if not self.preview:
+            return super().run()
+
+        self.data_df = XlsStudentData.read_target(self.xls_merge)
+
+        # Grades as they would be written in the workbook
+        values = pd.DataFrame({
+            name: smart_cast_series(self.data_df[name])
+            if name in self.data_df.columns else [None] * len(self.data_df.index)
+            for name, props in self.grade_columns
+            if name != _("Aggregated grade")
+        }, index=self.data_df.index, dtype=object)
+
+        outcome, thresholds = self.evaluate_jury(values)
+        columns = [
+            self.settings.LASTNAME_COLUMN, self.settings.NAME_COLUMN, self.settings.EMAIL_COLUMN
+        ] + self.config["others"]
+        df = pd.concat((self.data_df.reindex(columns=columns), values, outcome), axis=1)
+
+        print(df.to_string(index=False))
+        for ects in "ABCD":
+            print(_("{ects} if >=").format(ects=ects), thresholds[ects])
+
+        target = self.build_target(
+            name=normalize_string(self.name, type="file"), target_name="{name}_preview.csv"
+        )
+        with Output(target) as out:
+            df.to_csv(out.target, index=False)
+
     def get_columns(self, **kwargs):
         # Les colonnes classiques
         columns = [(self.settings.LASTNAME_COLUMN, "raw", 0), (self.settings.NAME_COLUMN, "raw", 0), (self.settings.EMAIL_COLUMN, "raw", 0)]
@@ -688,9 +1000,26 @@ class XlsGradeBookJury(baseg.AbstractGradeBook, base.ConfigOpt):
         return columns
 
     def create_other_worksheets(self):
+        values = pd.DataFrame({
+            name: [cell.value for cell in self.first_df[name]]
+            for name, props in self.grade_columns
+            if name != _("Aggregated grade")
+        }, index=self.first_df.index)
+        self.outcome, self.thresholds = self.evaluate_jury(values)
         self.create_second_worksheet()
         self.update_first_worksheet()
 
+    @property
+    def percentiles(self):
+        return {
+            ects: self.config[_("Percentile grade") + " " + ects] for ects in "ABCD"
+        }
+
+    def evaluate_jury(self, values):
+        """Return the outcome of the jury and the thresholds of ECTS grades."""
+
+        return evaluate_jury(values, self.config["grades"], self.percentiles)
+
     def ask_config(self):
         cols = self.data_df.columns.values.tolist()
 
@@ -765,7 +1094,7 @@ class XlsGradeBookJury(baseg.AbstractGradeBook, base.ConfigOpt):
         jsonschema.validate(config, schema)
 
         # Add default value in grades
-        if _("Percentile A") not in config:
+        if _("Percentile grade A") not in config:
             config[_("Percentile grade A")] = .9
         if _("Percentile grade B") not in config:
             config[_("Percentile grade B")] = .65
@@ -825,16 +1154,17 @@ class XlsGradeBookJury(baseg.AbstractGradeBook, base.ConfigOpt):
     def create_second_worksheet(self):
         # Write new gradesheet
         self.gradesheet = self.workbook.create_sheet(title=_("Parameters"))
-        self.workbook.active = self.gradesheet
+        addresses = AddressBuilder(self.gradesheet)
         current_cell = self.gradesheet.cell(row=1, column=1)
 
         # Write option blocks for grade columns
         self.grades_options = {}
         for name, props in self.grade_columns:
             # Add some stats on marks
-            for stat, q in ((_("Min"), 0), (_("Q1"), 1), (_("Median"), 2), (_("Q3"), 3), (_("Max"), 4)):
+            stats = ((_("Min"), 0), (_("Q1"), 1), (_("Median"), 2), (_("Q3"), 3), (_("Max"), 4))
+            for stat, q in stats:
                 props[stat] = '=IF(ISERROR(QUARTILE({0}, 0)), NA(), QUARTILE({0}, {1}))'.format(
-                    self.get_column_range(name),
+                    self.get_column_range(name, addresses),
                     q
                 )
 
@@ -848,6 +1178,16 @@ class XlsGradeBookJury(baseg.AbstractGradeBook, base.ConfigOpt):
             self.grades_options[name] = keytocell
             current_cell = current_cell.right(3)
 
+            # An error in the column is an error of QUARTILE
+            if name == _("Aggregated grade"):
+                values = self.outcome[name]
+                if values.isna().any():
+                    continue
+            else:
+                values = [cell.value for cell in self.first_df[name]]
+            for stat, q in stats:
+                keytocell[stat].cached_value = percentile(values, q / 4)
+
         # Maximum number of options
         max_height = max(len(v) for k, v in self.grades_options.items())
 
@@ -869,25 +1209,29 @@ class XlsGradeBookJury(baseg.AbstractGradeBook, base.ConfigOpt):
             props[
                 _("{ects} if >=").format(ects=ects)
             ] = "=IF(ISERROR(PERCENTILE({a}, {b})), NA(), PERCENTILE({a}, {b}))".format(
-                a=self.get_column_range(_("Passing grade")),
-                b=get_address_of_cell(percentile_cell),
+                a=self.get_column_range(_("Passing grade"), addresses),
+                b=addresses.address(percentile_cell),
             )
 
         lower_right, percentiles_theo = self.write_key_value_props(
             current_cell, _("Theoretical percentiles"), props
         )
+        for ects in "ABCD":
+            percentiles_theo[_("{ects} if >=").format(ects=ects)].cached_value = self.thresholds[ects]
         current_cell = current_cell.right(3)
 
         # Percentiles effectifs
         props = {}
         for i, ects in enumerate("ABCD"):
-            props[_("{ects} if >=").format(ects=ects)] = "=" + get_address_of_cell(
+            props[_("{ects} if >=").format(ects=ects)] = "=" + addresses.address(
                 percentiles_theo[_("{ects} if >=").format(ects=ects)]
             )
 
         lower_right, self.percentiles_used = self.write_key_value_props(
             current_cell, _("Used percentiles"), props
         )
+        for ects in "ABCD":
+            self.percentiles_used[_("{ects} if >=").format(ects=ects)].cached_value = self.thresholds[ects]
         current_cell = current_cell.right(3)
 
         # On écrit les proportions de notes ECTS en fonction de la
@@ -895,133 +1239,135 @@ class XlsGradeBookJury(baseg.AbstractGradeBook, base.ConfigOpt):
         props = {}
         for ects in "ABCDEF":
             props[_("Number of {ects}").format(ects=ects)] = ('=COUNTIF({}, "{}")').format(
-                self.get_column_range(_("ECTS grade")), ects
+                self.get_column_range(_("ECTS grade"), addresses), ects
             )
         props[_("Number of passed")] = '=SUMIF({}, "<>#N/A")'.format(
-            self.get_column_range(_("Passed"))
+            self.get_column_range(_("Passed"), addresses)
         )
-        props[_("Total number")] = "=COUNTA({})".format(self.get_column_range(_("Passed")))
+        props[_("Total number")] = "=COUNTA({})".format(self.get_column_range(_("Passed"), addresses))
         props[_("Ratio")] = '=IF(ISERROR(AVERAGEIF({0}, "<>#N/A")), NA(), AVERAGEIF({0}, "<>#N/A"))'.format(
-            self.get_column_range(_("Passed"))
+            self.get_column_range(_("Passed"), addresses)
         )
         lower_right, statistiques = self.write_key_value_props(
             current_cell, _("Statistics"), props
         )
 
+        ects_grades = self.outcome[_("ECTS grade")]
+        passed = self.outcome[_("Passed")].dropna()
+        for ects in "ABCDEF":
+            statistiques[_("Number of {ects}").format(ects=ects)].cached_value = int((ects_grades == ects).sum())
+        statistiques[_("Number of passed")].cached_value = int(passed.sum())
+        statistiques[_("Total number")].cached_value = len(ects_grades)
+        if len(passed) > 0:
+            statistiques[_("Ratio")].cached_value = float(passed.mean())
+
     def update_first_worksheet(self):
-        # Pour que get_address_of_cell marche correctement
-        self.workbook.active = self.first_ws
+        # Adresses dans les formules de la première feuille
+        addresses = AddressBuilder(self.first_ws)
+
+        def address(name):
+            "Adresse de la cellule de la colonne `name` sur la ligne `{row}`"
+            return self.first_df[name].iloc[0].column_letter + "{row}"
+
+        def option(name, key):
+            return addresses.address(self.grades_options[name][key], absolute=True)
+
+        grade_names = [name for name, props in self.grade_columns if name != _("Aggregated grade")]
 
         # On écrit la note agrégée basée sur la note maximum et le coefficient
         # de chaque note
-        coef_sum = "+".join(
-            get_address_of_cell(
-                self.grades_options[name]["coefficient"],
-                absolute=True,
+        coef_sum = "+".join(option(name, "coefficient") for name in grade_names)
+        aggregated_grade = "=(" + "+".join(
+            "{coef}*{grade}/{grade_max}*20".format(
+                coef=option(name, "coefficient"),
+                grade=address(name),
+                grade_max=option(name, "maximum grade"),
             )
-            for name, props in self.grade_columns
-            if name != _("Aggregated grade")
-        )
-
-        for i, (index, record) in enumerate(self.first_df.iterrows()):
-            formula = "=(" + "+".join(
-                "{coef}*{grade}/{grade_max}*20".format(
-                    coef=get_address_of_cell(
-                        self.grades_options[name]["coefficient"],
-                        absolute=True,
-                    ),
-                    grade=get_address_of_cell(record[name]),
-                    grade_max=get_address_of_cell(
-                        self.grades_options[name]["maximum grade"],
-                        absolute=True,
-                    ),
-                )
-                for name, props in self.grade_columns
-                if name != _("Aggregated grade")
-            ) + f")/({coef_sum})"
-
-            record[_("Aggregated grade")].value = formula
+            for name in grade_names
+        ) + f")/({coef_sum})"
 
         # On écrit la colonne "Admis" des admis/refusés basée sur les
-        # barres
-        for i, (index, record) in enumerate(self.first_df.iterrows()):
-            # Teste si une des notes est vide
-            any_blank_cell = "OR({})".format(
-                ", ".join(
-                    "ISBLANK({})".format(get_address_of_cell(record[name]))
-                    for name, props in self.grade_columns
-                )
+        # barres. Teste si une des notes est vide
+        any_blank_cell = "OR({})".format(
+            ", ".join(
+                "ISBLANK({})".format(address(name))
+                for name, props in self.grade_columns
             )
+        )
 
-            # Teste si toutes les barres sont atteintes
-            above_all_threshold = "AND({})".format(
-                ", ".join(
-                    "IF(ISNUMBER({0}), {0}>={1}, 1)".format(
-                        get_address_of_cell(record[name]),
-                        get_address_of_cell(
-                            self.grades_options[name]["passing grade"],
-                            absolute=True,
-                        ),
-                    )
-                    for name, props in self.grade_columns
+        # Teste si toutes les barres sont atteintes
+        above_all_threshold = "AND({})".format(
+            ", ".join(
+                "IF(ISNUMBER({0}), {0}>={1}, 1)".format(
+                    address(name), option(name, "passing grade")
                 )
+                for name, props in self.grade_columns
             )
+        )
 
-            # NA() s'il y a un problème, 0 si recalé, 1 si reçu
-            formula = f"=IFERROR(IF({any_blank_cell}, NA(), IF({above_all_threshold}, 1, 0)), NA())"
-            record[_("Passed")].value = formula
+        # NA() s'il y a un problème, 0 si recalé, 1 si reçu
+        passed = f"=IFERROR(IF({any_blank_cell}, NA(), IF({above_all_threshold}, 1, 0)), NA())"
 
         # On écrit la note agrégée des admis dans la colonne "Note
         # admis" pour faciliter le calcul des percentiles sur les
         # admis
-        for i, (index, record) in enumerate(self.first_df.iterrows()):
-            record[_("Passing grade")].value = '=IFERROR(IF({}=1, {}, ""), "")'.format(
-                get_address_of_cell(record[_("Passed")]),
-                get_address_of_cell(record[_("Aggregated grade")]),
-            )
+        passing_grade = '=IFERROR(IF({}=1, {}, ""), "")'.format(
+            address(_("Passed")), address(_("Aggregated grade"))
+        )
 
         # On écrit la note ECTS en fonction de la note agrégée et des
         # percentiles utilisés
-        perc_A = get_address_of_cell(self.percentiles_used[_("A if >=")], absolute=True)
-        perc_B = get_address_of_cell(self.percentiles_used[_("B if >=")], absolute=True)
-        perc_C = get_address_of_cell(self.percentiles_used[_("C if >=")], absolute=True)
-        perc_D = get_address_of_cell(self.percentiles_used[_("D if >=")], absolute=True)
-        percs = dict(perc_A=perc_A, perc_B=perc_B, perc_C=perc_C, perc_D=perc_D)
-
-        for i, (index, record) in enumerate(self.first_df.iterrows()):
-            note_admis = get_address_of_cell(record[_("Passed")])
-            note_agregee = get_address_of_cell(record[_("Aggregated grade")])
-            opts = dict(note_admis=note_admis, note_agregee=note_agregee)
-            opts.update(percs)
-
-            # Fonction pour la construction des IF imbriqués
-            def switch(ifs, default):
-                if ifs:
-                    cond, then = ifs[0]
-                    return "IF({cond}, {then}, {else_})".format(
-                        cond=cond.format(**opts),
-                        then=then,
-                        else_=switch(ifs[1:], default),
-                    )
-                else:
-                    return default
-
-            # Formule de type switch/case
-            formula = switch(
-                (
-                    ("ISNA({note_admis})", "NA()"),
-                    ('{note_agregee}="RESERVE"', '"RESERVE"'),
-                    ('{note_agregee}="ABS"', '"ABS"'),
-                    ("{note_admis}=0", '"F"'),
-                    ("{note_agregee}>={perc_A}", '"A"'),
-                    ("{note_agregee}>={perc_B}", '"B"'),
-                    ("{note_agregee}>={perc_C}", '"C"'),
-                    ("{note_agregee}>={perc_D}", '"D"'),
-                ),
-                '"E"',
-            )
+        opts = dict(
+            note_admis=address(_("Passed")),
+            note_agregee=address(_("Aggregated grade")),
+            **{
+                f"perc_{ects}": addresses.address(
+                    self.percentiles_used[_("{ects} if >=").format(ects=ects)], absolute=True
+                )
+                for ects in "ABCD"
+            }
+        )
+
+        # Fonction pour la construction des IF imbriqués
+        def switch(ifs, default):
+            if ifs:
+                cond, then = ifs[0]
+                return "IF({cond}, {then}, {else_})".format(
+                    cond=cond.format(**opts),
+                    then=then,
+                    else_=switch(ifs[1:], default),
+                )
+            else:
+                return default
+
+        # Formule de type switch/case
+        ects_grade = "=" + switch(
+            (
+                ("ISNA({note_admis})", "NA()"),
+                ('{note_agregee}="RESERVE"', '"RESERVE"'),
+                ('{note_agregee}="ABS"', '"ABS"'),
+                ("{note_admis}=0", '"F"'),
+                ("{note_agregee}>={perc_A}", '"A"'),
+                ("{note_agregee}>={perc_B}", '"B"'),
+                ("{note_agregee}>={perc_C}", '"C"'),
+                ("{note_agregee}>={perc_D}", '"D"'),
+            ),
+            '"E"',
+        )
 
-            record[_("ECTS grade")].value = "=" + formula
+        # Les formules ne dépendent que de la ligne : on les écrit à
+        # partir des modèles précédents avec les valeurs calculées par
+        # `evaluate_jury`
+        templates = {
+            _("Aggregated grade"): aggregated_grade,
+            _("Passed"): passed,
+            _("Passing grade"): passing_grade,
+            _("ECTS grade"): ects_grade,
+        }
+        for name, template in templates.items():
+            for cell, value in zip(self.first_df[name], self.outcome[name]):
+                cell.value = template.format(row=cell.row)
+                cell.cached_value = value
 
         # On centre les notes ECTS
         for cell in self.first_df[_("ECTS grade")]:
@@ -1043,7 +1389,7 @@ class XlsGradeBookJury(baseg.AbstractGradeBook, base.ConfigOpt):
 
         for name, opts in self.grades_options.items():
             threshold_cell = opts["passing grade"]
-            threshold_addr = get_address_of_cell(threshold_cell, compat=True)
+            threshold_addr = addresses.address(threshold_cell, compat=True)
             self.first_ws.conditional_formatting.add(
                 self.get_column_range(name),
                 CellIsRule(
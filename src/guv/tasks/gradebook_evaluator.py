@@ -0,0 +1,360 @@
+"""Evaluation in Python of the formulas written in gradebooks.
+
+Workbooks written by openpyxl hold formulas without their values, they are
+only computed when the workbook is opened and saved in a spreadsheet
+application. `evaluate_marking_scheme` computes the totals of a marking
+scheme for many students at once, it is used to store the values of the
+formulas when gradebooks are written. `evaluate_jury` does the same for
+the aggregated grades, admissions and ECTS grades of a jury gradebook.
+`read_gradebook` reads the first worksheet of a filled gradebook and
+computes the grades it links to, `read_entered_grades` reads the grades
+entered in its worksheets to update it.
+"""
+
+import re
+from types import SimpleNamespace
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.utils import range_boundaries
+
+from ..exceptions import MissingColumns
+from ..logger import logger
+from ..translations import _
+
+# References as written by `get_address_of_cell` and `get_range_from_cells`
+ADDRESS = r"(?:'[^']+'!)?\$?[A-Z]+\$?\d+"
+RANGE = ADDRESS + r":\$?[A-Z]+\$?\d+"
+
+LINK_FORMULA = re.compile(rf"=(?P<address>{ADDRESS})")
+SUM_FORMULA = re.compile(rf"=SUM\((?P<range>{RANGE})\)")
+MIRROR_FORMULA = re.compile(rf'=IF\(ISBLANK\((?P<address>{ADDRESS})\),"",(?P=address)\)')
+TOTAL_FORMULA = re.compile(
+    rf'=IF\(COUNTBLANK\((?P<marks>{RANGE})\) > 0, "", '
+    rf"SUMPRODUCT\((?P<points>{RANGE})\*(?P<grades>{RANGE})/(?P<scales>{RANGE})\)\)"
+)
+RESCALED_FORMULA = re.compile(
+    rf'=IF\(ISTEXT\((?P<total>{ADDRESS})\),"",(?P=total)/(?P<global_total>{ADDRESS})\*(?P<rescaling>{ADDRESS})\)'
+)
+
+
+def grade_values(values):
+    """Return the grades in `values` as floats and the mask of blank ones.
+
+    Text is NaN as it yields an error in the formulas.
+    """
+
+    values = np.array(values, dtype=object)
+    flat = pd.Series(values.ravel(), dtype=object)
+    text = flat.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+    blank = flat.isna().to_numpy() | flat.eq("").to_numpy()
+    grades = pd.to_numeric(flat.mask(text), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    return grades.reshape(values.shape), blank.reshape(values.shape)
+
+
+def evaluate_marking_scheme(points, scales, grades, rescaling=20):
+    """Return the totals and the rescaled totals of the rows of `grades`.
+
+    `grades` holds the values of the grade cells, one row per student, in the
+    same order as `points` and `scales`. As with the formulas of the
+    gradebook, totals are "" as long as a grade is blank. They are None if a
+    grade is not a number.
+    """
+
+    points = np.asarray(points, dtype=float)
+    scales = np.asarray(scales, dtype=float)
+    grades, blank = grade_values(grades)
+    grades, blank = grades.reshape(-1, len(points)), blank.reshape(-1, len(points))
+
+    totals = (points * grades / scales).sum(axis=1)
+    rescaled = totals / points.sum() * rescaling
+
+    def cached(values):
+        values = values.astype(object)
+        values[np.isnan(values.astype(float))] = None
+        values[blank.any(axis=1)] = ""
+        return values
+
+    return cached(totals), cached(rescaled)
+
+
+def percentile(values, q):
+    """Return the percentile `q` of the numbers in `values` as PERCENTILE.
+
+    Return None when PERCENTILE yields an error: no numbers or `q` not in
+    [0, 1].
+    """
+
+    numbers = grade_values(values)[0].ravel()
+    numbers = numbers[~np.isnan(numbers)]
+    if len(numbers) == 0 or not 0 <= q <= 1:
+        return None
+    return float(np.percentile(numbers, 100 * q))
+
+
+def evaluate_jury(values, grades, percentiles, thresholds=None):
+    """Return the outcome of a jury and the thresholds of the ECTS grades.
+
+    `values` holds the grades of the students, one column per name in
+    `grades` which are the grade options of `XlsGradeBookJury`.
+    `percentiles` maps the ECTS grades A to D to their percentile among
+    the students who passed. `thresholds` overrides the thresholds
+    computed from the percentiles.
+
+    The outcome mirrors the formulas of the jury gradebook: an aggregated
+    grade, whether the student passed, the aggregated grade of students
+    who passed and the ECTS grade. A text value of the aggregated grade
+    like "RESERVE" or "ABS" overrides the computed one. As with
+    `evaluate_marking_scheme`, errors are None.
+    """
+
+    agg_colname = _("Aggregated grade")
+    options = [props for props in grades if props["name"] != agg_colname]
+    agg_options = next((props for props in grades if props["name"] == agg_colname), {})
+    names = [props["name"] for props in options]
+    n = len(values.index)
+
+    def option(key, default):
+        return np.array([props.get(key, default) for props in options], dtype=float)
+
+    coefficients = option("coefficient", 1)
+    maximum_grades = option("maximum grade", 20)
+    passing_grades = option("passing grade", -1)
+
+    grades_array, blank = grade_values(values.reindex(columns=names).to_numpy(dtype=object))
+    grades_array, blank = grades_array.reshape(n, len(names)), blank.reshape(n, len(names))
+
+    # Blank grades count as zero, text grades yield an error
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aggregated = (
+            np.where(blank, 0, grades_array) * coefficients / maximum_grades * 20
+        ).sum(axis=1) / coefficients.sum()
+    aggregated[~np.isfinite(aggregated)] = np.nan
+
+    agg = aggregated.astype(object)
+    agg[np.isnan(aggregated)] = None
+    if agg_colname in values.columns:
+        overrides = values[agg_colname].map(lambda value: isinstance(value, str) and value != "")
+        agg[overrides.to_numpy(dtype=bool)] = values[agg_colname][overrides].to_numpy(dtype=object)
+    agg_text = np.array([isinstance(value, str) for value in agg], dtype=bool)
+    agg_error = np.array([value is None for value in agg], dtype=bool)
+    agg_number = np.where(agg_text | agg_error, np.nan, aggregated)
+
+    # Not a number grade does not prevent from passing
+    above = np.where(np.isnan(grades_array), True, grades_array >= passing_grades).all(axis=1)
+    above &= np.isnan(agg_number) | (agg_number >= agg_options.get("passing grade", -1))
+    passed = np.where(blank.any(axis=1), np.nan, above.astype(float))
+
+    passing_grade = np.full(n, "", dtype=object)
+    passing_grade[passed == 1] = agg[passed == 1]
+    passing_grade[(passed == 1) & agg_error] = ""
+
+    if thresholds is None:
+        thresholds = {
+            ects: percentile(passing_grade, percentiles[ects])
+            for ects in "ABCD"
+        }
+
+    # Conditions of the nested IF of the ECTS grade in order, text is
+    # greater than any number
+    ects_grades = np.full(n, "E", dtype=object)
+    undecided = np.ones(n, dtype=bool)
+
+    def decide(condition, value):
+        ects_grades[undecided & condition] = value
+        undecided[condition] = False
+
+    upper = np.array([value.upper() if isinstance(value, str) else "" for value in agg], dtype=object)
+    decide(np.isnan(passed), None)
+    decide(agg_error, None)
+    decide(upper == "RESERVE", "RESERVE")
+    decide(upper == "ABS", "ABS")
+    decide(passed == 0, "F")
+    for ects in "ABCD":
+        if thresholds[ects] is None:
+            decide(np.ones(n, dtype=bool), None)
+        else:
+            decide(agg_text | (agg_number >= thresholds[ects]), ects)
+
+    passed = np.array([None if np.isnan(value) else int(value) for value in passed], dtype=object)
+    outcome = pd.DataFrame({
+        agg_colname: agg,
+        _("Passed"): passed,
+        _("Passing grade"): passing_grade,
+        _("ECTS grade"): ects_grades,
+    }, index=values.index, dtype=object)
+
+    return outcome, thresholds
+
+
+class GradeBookEvaluator:
+    """Evaluate the formulas of a gradebook written by guv
+
+    Only the formulas linking the cells, the totals of the marking schemes
+    and their rescaling are supported. Values of the worksheets are read
+    once as arrays and evaluated cells are memoized.
+    """
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self.arrays = {}
+        self.memo = {}
+
+    def array(self, title):
+        if title not in self.arrays:
+            worksheet = self.workbook[title]
+            self.arrays[title] = np.array(
+                [list(row) for row in worksheet.iter_rows(values_only=True)] or [[]],
+                dtype=object
+            )
+        return self.arrays[title]
+
+    def reference(self, reference, title):
+        """Return the worksheet title and the bounds of `reference`."""
+
+        if "!" in reference:
+            title, reference = reference.split("!")
+            title = title[1:-1]
+        min_col, min_row, max_col, max_row = range_boundaries(reference.replace("$", ""))
+        return title, min_row, min_col, max_row, max_col
+
+    def range_values(self, reference, title):
+        title, min_row, min_col, max_row, max_col = self.reference(reference, title)
+        return np.array([
+            [self.value(title, row, column) for column in range(min_col, max_col + 1)]
+            for row in range(min_row, max_row + 1)
+        ], dtype=object)
+
+    def address_value(self, reference, title):
+        title, row, column = self.reference(reference, title)[:3]
+        return self.value(title, row, column)
+
+    def raw_value(self, title, row, column):
+        """Return the value or the formula of the cell at `row` and `column`."""
+
+        array = self.array(title)
+        if row > array.shape[0] or column > array.shape[1]:
+            return None
+        return array[row - 1, column - 1]
+
+    def value(self, title, row, column):
+        """Return the value of the cell at `row` and `column` of `title`."""
+
+        key = (title, row, column)
+        if key not in self.memo:
+            value = self.raw_value(title, row, column)
+            if isinstance(value, str) and value.startswith("="):
+                value = self.evaluate(value, title)
+            self.memo[key] = value
+        return self.memo[key]
+
+    def evaluate(self, formula, title):
+        if match := LINK_FORMULA.fullmatch(formula):
+            return self.address_value(match["address"], title)
+
+        if match := MIRROR_FORMULA.fullmatch(formula):
+            value = self.address_value(match["address"], title)
+            return "" if value is None else value
+
+        if match := SUM_FORMULA.fullmatch(formula):
+            values = grade_values(self.range_values(match["range"], title))[0]
+            return np.nansum(values)
+
+        if match := TOTAL_FORMULA.fullmatch(formula):
+            if grade_values(self.range_values(match["marks"], title))[1].any():
+                return ""
+            points, scales, grades = (
+                grade_values(self.range_values(match[name], title).ravel())[0]
+                for name in ("points", "scales", "grades")
+            )
+            total = (points * grades / scales).sum()
+            return None if np.isnan(total) else total
+
+        if match := RESCALED_FORMULA.fullmatch(formula):
+            total = self.address_value(match["total"], title)
+            if isinstance(total, str):
+                return ""
+            global_total = self.address_value(match["global_total"], title)
+            rescaling = self.address_value(match["rescaling"], title)
+            try:
+                return total / global_total * rescaling
+            except (TypeError, ZeroDivisionError):
+                return None
+
+        logger.warning(_("Unsupported formula ignored: {formula}").format(formula=formula))
+        return None
+
+
+def read_gradebook(filename):
+    """Return the first worksheet of a gradebook with its formulas evaluated.
+
+    The columns holding formulas are listed in ``df.attrs["grade_columns"]``.
+    """
+
+    workbook = openpyxl.load_workbook(filename)
+    worksheet = workbook.worksheets[0]
+    evaluator = GradeBookEvaluator(workbook)
+
+    array = evaluator.array(worksheet.title)
+    header, rows = list(array[0]), array[1:]
+    values = [
+        [evaluator.value(worksheet.title, i + 2, j + 1) for j in range(len(header))]
+        for i in range(len(rows))
+    ]
+    df = pd.DataFrame(values, columns=header).replace("", np.nan)
+    df.attrs["grade_columns"] = [
+        name for name, column in zip(header, rows.T)
+        if any(isinstance(v, str) and v.startswith("=") for v in column)
+    ]
+    return df
+
+
+def read_entered_grades(filename, key, columns):
+    """Return the grades entered in the worksheets of a gradebook.
+
+    `columns` are columns of the first worksheet linking to the total of a
+    marking scheme and `key` the column identifying the students. For each
+    column and each student, the values of the grade cells of the total
+    are returned in order along with the mask of the cells mirroring the
+    cell of a group. The value of a mirroring cell is the value of the
+    mirrored cell.
+    """
+
+    workbook = openpyxl.load_workbook(filename)
+    worksheet = workbook.worksheets[0]
+    evaluator = GradeBookEvaluator(workbook)
+
+    array = evaluator.array(worksheet.title)
+    header, rows = list(array[0]), array[1:]
+    if key not in header:
+        raise MissingColumns([key], header)
+
+    grades = {column: {} for column in columns if column in header}
+    for row in rows:
+        if row[header.index(key)] is None:
+            continue
+
+        for column, entered in grades.items():
+            link = row[header.index(column)]
+            if not isinstance(link, str) or not (match := LINK_FORMULA.fullmatch(link)):
+                continue
+            title, total_row, total_column = evaluator.reference(match["address"], worksheet.title)[:3]
+            total = evaluator.raw_value(title, total_row, total_column)
+            if not isinstance(total, str) or not (match := TOTAL_FORMULA.fullmatch(total)):
+                continue
+
+            title, min_row, min_col, max_row, max_col = evaluator.reference(match["marks"], title)
+            values, mirrored = [], []
+            for i in range(min_row, max_row + 1):
+                for j in range(min_col, max_col + 1):
+                    value = evaluator.raw_value(title, i, j)
+                    match = isinstance(value, str) and MIRROR_FORMULA.fullmatch(value)
+                    if match:
+                        value = evaluator.raw_value(*evaluator.reference(match["address"], title)[:3])
+                    values.append(value)
+                    mirrored.append(bool(match))
+
+            entered[row[header.index(key)]] = SimpleNamespace(values=values, mirrored=mirrored)
+
+    return grades
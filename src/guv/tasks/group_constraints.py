@@ -0,0 +1,649 @@
+"""Sparse representation of the constraints used to create groups.
+
+Constraints are given by columns of already formed groups (students that
+should not be together again) and columns of affinity groups (students that
+should be together). Only the pairs of students sharing a group in one of
+these columns are stored, as edge arrays. Columns to balance among groups
+are stored as category counts.
+"""
+
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+
+def get_group_codes(series, nan_policy="same"):
+    """Return integer codes of the groups in `series`.
+
+    Missing values form a group of their own if `nan_policy` is "same" and
+    are coded -1 (no group) if it is "different".
+    """
+
+    codes, _ = pd.factorize(series)
+    if nan_policy == "same":
+        codes = np.where(codes == -1, codes.max() + 1, codes)
+    elif nan_policy != "different":
+        raise ValueError("Wrong nan_policy")
+    return codes.astype(np.int32)
+
+
+def get_pairs_from_codes(codes):
+    """Return arrays `rows`, `cols` of pairs i < j sharing the same code.
+
+    A code of -1 means that the element does not belong to any group.
+    """
+
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(codes)]])
+
+    rows, cols = [], []
+    for start, end in zip(starts, ends):
+        size = end - start
+        if size < 2 or sorted_codes[start] == -1:
+            continue
+        members = np.sort(order[start:end])
+        iu, ju = np.triu_indices(size, 1)
+        rows.append(members[iu])
+        cols.append(members[ju])
+
+    if not rows:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    order = np.lexsort((cols, rows))
+    return rows[order], cols[order]
+
+
+def get_affinity_components(n, affinity_codes):
+    """Return the connected components of elements sharing an affinity group.
+
+    Union-find over the codes of each affinity column, a code of -1 does not
+    link elements. Components are labelled in order of first appearance.
+    """
+
+    parent = list(range(n))
+
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    for codes in affinity_codes:
+        first = {}
+        for a, code in enumerate(codes):
+            if code == -1:
+                continue
+            if code in first:
+                ra, rb = find(a), find(first[code])
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+            else:
+                first[code] = a
+
+    roots = np.array([find(a) for a in range(n)], dtype=int)
+    _, labels = np.unique(roots, return_inverse=True)
+    return labels.reshape(-1)
+
+
+def pack_components(components, group_sizes):
+    """Pack `components` into groups of sizes `group_sizes`.
+
+    Components are placed from the largest in the group with the most room
+    left. Those that fit nowhere are split into single elements. Returns the
+    super-node of each element and the group of each super-node.
+    """
+
+    group_sizes = np.asarray(group_sizes, dtype=int)
+    component_sizes = np.bincount(components)
+    room = group_sizes.copy()
+
+    labels = np.full(len(components), -1, dtype=int)
+    node_groups = []
+    for c in np.argsort(-component_sizes, kind="stable"):
+        if component_sizes[c] < 2:
+            break
+        g = np.argmax(room)
+        if room[g] >= component_sizes[c]:
+            labels[components == c] = len(node_groups)
+            node_groups.append(g)
+            room[g] -= component_sizes[c]
+
+    # Remaining elements fill the groups in order
+    singles = np.flatnonzero(labels == -1)
+    labels[singles] = len(node_groups) + np.arange(len(singles))
+    node_groups.extend(np.repeat(np.arange(len(room)), room))
+
+    return labels, np.array(node_groups, dtype=int)
+
+
+def get_repulse_violations(partition, codes):
+    """Return pairs i < j in the same group of `partition` with the same code."""
+
+    partition = np.asarray(partition)
+    combined = np.where(codes == -1, -1, partition * (codes.max() + 1) + codes)
+    return get_pairs_from_codes(combined)
+
+
+def get_affinity_violations(partition, codes):
+    """Return pairs i < j in the same group of `partition` with different codes."""
+
+    rows, cols = get_pairs_from_codes(np.asarray(partition))
+    mask = codes[rows] != codes[cols]
+    return rows[mask], cols[mask]
+
+
+def get_balance_violations(partition, codes):
+    """Return the groups, codes, counts and bounds of codes beyond their bound."""
+
+    partition = np.asarray(partition)
+    balance = Balance.from_codes(codes)
+    n_groups = partition.max() + 1
+    counts = balance.group_counts(partition, n_groups)
+    bounds = balance.bounds(np.bincount(partition, minlength=n_groups))
+    groups, categories = np.nonzero(counts > bounds)
+    return groups, categories, counts[groups, categories], bounds[groups, categories]
+
+
+class Balance:
+    """Even spread of the categories of a column among groups
+
+    A group of size S may contain at most ``ceil(T * S / N)`` elements of a
+    category of T elements among N. This bound can always be met, each
+    element beyond it adds `weight` to the score.
+    """
+
+    weight = 2
+
+    def __init__(self, counts, n):
+        self.counts = np.asarray(counts, dtype=int)
+        self.n = n
+        self.totals = self.counts.sum(axis=0)
+
+    @classmethod
+    def from_codes(cls, codes):
+        """Build the balance from codes as returned by `get_group_codes`."""
+
+        codes = np.asarray(codes)
+        n_categories = codes.max() + 1 if len(codes) > 0 else 0
+        counts = np.zeros((len(codes), max(n_categories, 0)), dtype=int)
+        known = codes != -1
+        counts[np.flatnonzero(known), codes[known]] = 1
+        return cls(counts, len(codes))
+
+    def contract(self, labels):
+        counts = np.zeros((labels.max() + 1, self.counts.shape[1]), dtype=int)
+        np.add.at(counts, labels, self.counts)
+        return Balance(counts, self.n)
+
+    def group_counts(self, partition, n_groups):
+        """Return the number of elements of each category in each group."""
+
+        counts = np.zeros((n_groups, self.counts.shape[1]), dtype=int)
+        np.add.at(counts, partition, self.counts)
+        return counts
+
+    def bounds(self, sizes):
+        sizes = np.asarray(sizes)
+        return -((-self.totals * sizes[..., None]) // self.n)
+
+    def excess(self, counts, sizes):
+        """Return the number of elements beyond the bounds, summed over the last axis."""
+
+        return np.maximum(counts - self.bounds(sizes), 0).sum(axis=-1)
+
+    def penalty(self, counts, sizes):
+        return self.weight * int(self.excess(counts, sizes).sum())
+
+
+class ConstraintGraph:
+    """Weighted pairs of elements constrained to be apart or together
+
+    The score of a partition is the same as the one obtained with the dense
+    matrix ``cooc_repulse - cooc_affinity - offset`` summed over all pairs
+    in the same group, diagonal included, but is computed in O(E) per
+    partition where E is the number of constrained pairs.
+
+    Nodes of a graph returned by `contract` are super-nodes made of `sizes`
+    elements that always stay together. Scores are still those of the
+    partitions of the elements. `balances` add the penalties of `Balance`
+    objects.
+    """
+
+    def __init__(self, n, rows, cols, weights, n_repulse=0, n_affinity=0, sizes=None, constant=0, offset=None, balances=()):
+        self.n = n
+        self.rows = np.asarray(rows, dtype=int)
+        self.cols = np.asarray(cols, dtype=int)
+        self.weights = np.asarray(weights, dtype=int)
+        self.n_repulse = n_repulse
+        self.n_affinity = n_affinity
+        self.sizes = np.ones(n, dtype=int) if sizes is None else np.asarray(sizes, dtype=int)
+        self.constant = constant
+        self._offset = offset
+        self.balances = list(balances)
+
+    @classmethod
+    def from_dataframe(cls, df, repulse_columns=(), affinity_columns=(), balance_columns=()):
+        """Build the graph from columns of `df`."""
+
+        return cls.from_codes(
+            len(df.index),
+            [get_group_codes(df[column], nan_policy="different") for column in repulse_columns],
+            [get_group_codes(df[column], nan_policy="same") for column in affinity_columns],
+            [get_group_codes(df[column], nan_policy="different") for column in balance_columns],
+        )
+
+    @classmethod
+    def from_codes(cls, n, repulse_codes=(), affinity_codes=(), balance_codes=(), weighted_pairs=None):
+        """Build the graph from lists of group codes as returned by `get_group_codes`.
+
+        `weighted_pairs` is an optional tuple of arrays `rows`, `cols` and
+        positive `weights` of pairs i < j to keep apart.
+        """
+
+        keys, values = [], []
+        for codes_list, sign in [(repulse_codes, 1), (affinity_codes, -1)]:
+            for codes in codes_list:
+                rows, cols = get_pairs_from_codes(codes)
+                keys.append(rows * n + cols)
+                values.append(np.full(len(rows), sign))
+
+        if weighted_pairs is not None:
+            rows, cols, weights = weighted_pairs
+            keys.append(np.asarray(rows, dtype=int) * n + np.asarray(cols, dtype=int))
+            values.append(np.asarray(weights, dtype=int))
+
+        if keys:
+            keys = np.concatenate(keys)
+            values = np.concatenate(values)
+        else:
+            keys = np.zeros(0, dtype=int)
+            values = np.zeros(0, dtype=int)
+
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        weights = np.bincount(inverse, weights=values, minlength=len(unique_keys)).astype(int)
+        mask = weights != 0
+
+        return cls(
+            n,
+            unique_keys[mask] // max(n, 1),
+            unique_keys[mask] % max(n, 1),
+            weights[mask],
+            n_repulse=len(repulse_codes),
+            n_affinity=len(affinity_codes),
+            balances=[Balance.from_codes(codes) for codes in balance_codes],
+        )
+
+    def contract(self, labels):
+        """Return the graph of the super-nodes given by `labels`.
+
+        Edges between super-nodes are summed and edges inside a super-node
+        become a constant of the score.
+        """
+
+        labels = np.asarray(labels)
+        n = int(labels.max()) + 1 if len(labels) > 0 else 0
+        rows, cols = labels[self.rows], labels[self.cols]
+        inside = rows == cols
+
+        rows, cols = np.minimum(rows, cols)[~inside], np.maximum(rows, cols)[~inside]
+        unique_keys, inverse = np.unique(rows * n + cols, return_inverse=True)
+        weights = np.bincount(inverse, weights=self.weights[~inside], minlength=len(unique_keys)).astype(int)
+        mask = weights != 0
+
+        return ConstraintGraph(
+            n,
+            unique_keys[mask] // max(n, 1),
+            unique_keys[mask] % max(n, 1),
+            weights[mask],
+            n_repulse=self.n_repulse,
+            n_affinity=self.n_affinity,
+            sizes=np.bincount(labels, weights=self.sizes, minlength=n).astype(int),
+            constant=self.constant + 2 * int(self.weights[inside].sum()),
+            offset=self.offset,
+            balances=[balance.contract(labels) for balance in self.balances],
+        )
+
+    @property
+    def num_edges(self):
+        return len(self.weights)
+
+    @property
+    def num_elements(self):
+        return int(self.sizes.sum())
+
+    @cached_property
+    def has_unit_sizes(self):
+        return bool(np.all(self.sizes == 1))
+
+    @cached_property
+    def offset(self):
+        """Minimum of the dense constraint matrix"""
+
+        if self._offset is not None:
+            return self._offset
+
+        candidates = [self.n_repulse - self.n_affinity]
+        if self.num_edges > 0:
+            candidates.append(self.weights.min())
+        if self.num_edges < self.n * (self.n - 1) // 2:
+            candidates.append(0)
+        return int(min(candidates))
+
+    @property
+    def min_cost(self):
+        """Lower bound of the score, reached when no constraint is violated"""
+        return self.num_elements * (self.n_repulse - self.n_affinity - self.offset)
+
+    def score(self, partitions):
+        """Return the scores of a partition or of a batch of partitions."""
+
+        partitions = np.asarray(partitions)
+        single = partitions.ndim == 1
+        partitions = np.atleast_2d(partitions)
+        n_partitions = partitions.shape[0]
+
+        same = partitions[:, self.rows] == partitions[:, self.cols]
+        pair_scores = 2 * (same.astype(int) @ self.weights)
+
+        # Number of ordered pairs of distinct elements in the same group
+        n_groups = partitions.max() + 1
+        shifted = partitions + n_groups * np.arange(n_partitions)[:, None]
+        sizes = np.bincount(
+            shifted.ravel(),
+            weights=np.tile(self.sizes, n_partitions),
+            minlength=n_groups * n_partitions,
+        ).astype(int).reshape(n_partitions, n_groups)
+        n_pairs = np.sum(sizes * (sizes - 1), axis=1)
+
+        scores = self.min_cost + self.constant + pair_scores - self.offset * n_pairs
+        for balance in self.balances:
+            scores = scores + np.array([
+                balance.penalty(balance.group_counts(partition, n_groups), sizes[i])
+                for i, partition in enumerate(partitions)
+            ])
+        return int(scores[0]) if single else scores
+
+    @cached_property
+    def adjacency(self):
+        """Adjacency lists in CSR format: `indptr`, `indices` and `data`"""
+
+        rows = np.concatenate([self.rows, self.cols])
+        cols = np.concatenate([self.cols, self.rows])
+        weights = np.concatenate([self.weights, self.weights])
+        order = np.lexsort((cols, rows))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=self.n))])
+        return indptr, cols[order], weights[order]
+
+    def neighbors(self, a):
+        """Return the neighbors of `a` and the weights of the edges."""
+
+        indptr, indices, data = self.adjacency
+        return indices[indptr[a]:indptr[a + 1]], data[indptr[a]:indptr[a + 1]]
+
+    @cached_property
+    def incidence(self):
+        """Indices of the edges incident to each element in CSR format"""
+
+        ends = np.concatenate([self.rows, self.cols])
+        edges = np.concatenate([np.arange(self.num_edges), np.arange(self.num_edges)])
+        order = np.argsort(ends, kind="stable")
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(ends, minlength=self.n))])
+        return indptr, edges[order]
+
+    def incident_edges(self, elements, unique=True):
+        """Return the indices of the edges touching `elements`.
+
+        If `unique` is False, edges between two elements of `elements` are
+        returned twice.
+        """
+
+        indptr, edges = self.incidence
+        elements = np.asarray(elements)
+        starts = indptr[elements]
+        lengths = indptr[elements + 1] - starts
+        total = lengths.sum()
+        if total == 0:
+            return np.zeros(0, dtype=int)
+
+        # Concatenate the ranges [start, start + length)
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        incident = edges[offsets + np.arange(total)]
+        return np.unique(incident) if unique else incident
+
+    def weight(self, a, b):
+        """Return the weight of the pair `a`, `b`."""
+
+        indices, data = self.neighbors(a)
+        k = np.searchsorted(indices, b)
+        if k < len(indices) and indices[k] == b:
+            return int(data[k])
+        return 0
+
+
+class PartitionState:
+    """Partition of the elements of `graph` with incremental scoring
+
+    For each element, the sum of the weights of its edges towards each group
+    (its group-membership counts) is maintained so that the score difference
+    of moving or swapping elements is computed in O(1) and applied in O(deg).
+    Counts are only built when first needed. `sizes` are the numbers of
+    elements of each group, super-nodes included. The category counts of
+    each group are also maintained for each `Balance` of the graph.
+    """
+
+    def __init__(self, graph, partition, n_groups=None, score=None):
+        self.graph = graph
+        self.partition = np.array(partition, dtype=int)
+        if n_groups is None:
+            n_groups = self.partition.max() + 1
+        self.sizes = np.bincount(self.partition, weights=graph.sizes, minlength=n_groups).astype(int)
+        self.balance_counts = [
+            balance.group_counts(self.partition, n_groups) for balance in graph.balances
+        ]
+        self.score = graph.score(self.partition) if score is None else score
+        self._counts = None
+
+    @property
+    def counts(self):
+        if self._counts is None:
+            graph = self.graph
+            self._counts = np.zeros((graph.n, len(self.sizes)), dtype=int)
+            np.add.at(self._counts, (graph.rows, self.partition[graph.cols]), graph.weights)
+            np.add.at(self._counts, (graph.cols, self.partition[graph.rows]), graph.weights)
+        return self._counts
+
+    def copy(self):
+        state = PartitionState.__new__(PartitionState)
+        state.graph = self.graph
+        state.partition = self.partition.copy()
+        state.sizes = self.sizes.copy()
+        state.balance_counts = [counts.copy() for counts in self.balance_counts]
+        state.score = self.score
+        state._counts = None if self._counts is None else self._counts.copy()
+        return state
+
+    def move_delta(self, a, h):
+        """Return the score difference of moving `a` to group `h`."""
+
+        g = self.partition[a]
+        if g == h:
+            return 0
+
+        s = self.graph.sizes[a]
+        pair_delta = 2 * (self.counts[a, h] - self.counts[a, g])
+        n_pairs_delta = 2 * s * (self.sizes[h] - self.sizes[g] + s)
+        balance_delta = sum(
+            balance.weight * (
+                balance.excess(counts[g] - balance.counts[a], self.sizes[g] - s)
+                + balance.excess(counts[h] + balance.counts[a], self.sizes[h] + s)
+                - balance.excess(counts[g], self.sizes[g])
+                - balance.excess(counts[h], self.sizes[h])
+            )
+            for balance, counts in zip(self.graph.balances, self.balance_counts)
+        )
+        return int(pair_delta - self.graph.offset * n_pairs_delta + balance_delta)
+
+    def move(self, a, h):
+        """Move `a` to group `h` and return the score difference."""
+
+        g = self.partition[a]
+        if g == h:
+            return 0
+
+        delta = self.move_delta(a, h)
+        indices, data = self.graph.neighbors(a)
+        self.counts[indices, g] -= data
+        self.counts[indices, h] += data
+        self.sizes[g] -= self.graph.sizes[a]
+        self.sizes[h] += self.graph.sizes[a]
+        for balance, counts in zip(self.graph.balances, self.balance_counts):
+            counts[g] -= balance.counts[a]
+            counts[h] += balance.counts[a]
+        self.partition[a] = h
+        self.score += delta
+        return delta
+
+    def swap_delta(self, a, b):
+        """Return the score difference of swapping the groups of `a` and `b`."""
+
+        g, h = self.partition[a], self.partition[b]
+        if g == h:
+            return 0
+
+        w_ab = self.graph.weight(a, b)
+        d = self.graph.sizes[b] - self.graph.sizes[a]
+        delta = 2 * (
+            self.counts[a, h] - w_ab - self.counts[a, g]
+            + self.counts[b, g] - w_ab - self.counts[b, h]
+        ) - self.graph.offset * 2 * d * (self.sizes[g] - self.sizes[h] + d)
+        if self.graph.balances:
+            delta += self.balance_swap_deltas(a, np.array([b]))[0]
+        return int(delta)
+
+    def swap_deltas(self, a, partners):
+        """Return the score differences of swapping `a` with each of `partners`."""
+
+        partners = np.asarray(partners)
+        g, h = self.partition[a], self.partition[partners]
+        indices, data = self.graph.neighbors(a)
+        k = np.minimum(np.searchsorted(indices, partners), max(len(indices) - 1, 0))
+        if len(indices) > 0:
+            w_ab = np.where(indices[k] == partners, data[k], 0)
+        else:
+            w_ab = np.zeros(len(partners), dtype=int)
+
+        d = self.graph.sizes[partners] - self.graph.sizes[a]
+        deltas = 2 * (
+            self.counts[a, h] - w_ab - self.counts[a, g]
+            + self.counts[partners, g] - w_ab - self.counts[partners, h]
+        ) - self.graph.offset * 2 * d * (self.sizes[g] - self.sizes[h] + d)
+        if self.graph.balances:
+            deltas = deltas + self.balance_swap_deltas(a, partners)
+        return np.where(h == g, 0, deltas)
+
+    def balance_swap_deltas(self, a, partners):
+        """Return the differences of the balance penalties of swapping `a` with `partners`."""
+
+        g, h = self.partition[a], self.partition[partners]
+        d = self.graph.sizes[partners] - self.graph.sizes[a]
+        deltas = np.zeros(len(partners), dtype=int)
+        for balance, counts in zip(self.graph.balances, self.balance_counts):
+            exchanged = balance.counts[partners] - balance.counts[a]
+            deltas += balance.weight * (
+                balance.excess(counts[g] + exchanged, self.sizes[g] + d)
+                + balance.excess(counts[h] - exchanged, self.sizes[h] - d)
+                - balance.excess(counts[g], self.sizes[g])
+                - balance.excess(counts[h], self.sizes[h])
+            )
+        return deltas
+
+    def can_swap(self, a, partners):
+        """Return True for the partners of `a` whose swap keeps the group sizes.
+
+        Super-nodes of the same size can always be swapped. Otherwise the
+        two groups exchange their sizes.
+        """
+
+        g, h = self.partition[a], self.partition[partners]
+        d = self.graph.sizes[partners] - self.graph.sizes[a]
+        return (d == 0) | (d == self.sizes[h] - self.sizes[g])
+
+    def swap(self, a, b):
+        """Swap the groups of `a` and `b` and return the score difference."""
+
+        g, h = self.partition[a], self.partition[b]
+        return self.move(a, h) + self.move(b, g)
+
+    def permutation_delta(self, targets, sources):
+        """Return the score difference when each ``targets[t]`` takes the group of ``sources[t]``.
+
+        `targets` is a permutation of `sources` of super-nodes of the same
+        size so group sizes are unchanged and only the edges touching the
+        moved elements are rescored.
+        """
+
+        graph = self.graph
+        edges = graph.incident_edges(targets, unique=False)
+        rows, cols = graph.rows[edges], graph.cols[edges]
+
+        # Groups after the permutation at the endpoints of the edges only,
+        # moved elements are looked up among the sorted targets
+        targets = np.asarray(targets)
+        order = np.argsort(targets)
+        sorted_targets, new_groups = targets[order], self.partition[np.asarray(sources)[order]]
+
+        def moved_groups(nodes):
+            k = np.minimum(np.searchsorted(sorted_targets, nodes), len(sorted_targets) - 1)
+            moved = sorted_targets[k] == nodes
+            return moved, np.where(moved, new_groups[k], self.partition[nodes])
+
+        moved_rows, after_rows = moved_groups(rows)
+        moved_cols, after_cols = moved_groups(cols)
+
+        # Edges between two moved elements are listed twice
+        multiplicity = np.where(moved_rows & moved_cols, 1, 2)
+
+        before = self.partition[rows] == self.partition[cols]
+        after = after_rows == after_cols
+        delta = int(np.sum((after.astype(int) - before) * multiplicity * graph.weights[edges]))
+
+        for balance, counts in zip(graph.balances, self.balance_counts):
+            new_counts = self.permuted_counts(balance, counts, targets, sources)
+            delta += balance.penalty(new_counts, self.sizes) - balance.penalty(counts, self.sizes)
+        return delta
+
+    def balance_conflicts(self):
+        """Return a mask of the elements of a category beyond its bound in their group."""
+
+        conflicts = np.zeros(self.graph.n, dtype=bool)
+        for balance, counts in zip(self.graph.balances, self.balance_counts):
+            beyond = counts > balance.bounds(self.sizes)
+            conflicts |= np.any(beyond[self.partition] & (balance.counts > 0), axis=1)
+        return conflicts
+
+    def permuted_counts(self, balance, counts, targets, sources):
+        new_counts = counts.copy()
+        np.subtract.at(new_counts, self.partition[targets], balance.counts[targets])
+        np.add.at(new_counts, self.partition[sources], balance.counts[targets])
+        return new_counts
+
+    def permute(self, targets, sources):
+        """Apply the permutation of groups and return the score difference."""
+
+        if self._counts is not None:
+            groups = self.partition[sources]
+            return sum(self.move(a, h) for a, h in zip(targets, groups))
+
+        delta = self.permutation_delta(targets, sources)
+        self.balance_counts = [
+            self.permuted_counts(balance, counts, targets, sources)
+            for balance, counts in zip(self.graph.balances, self.balance_counts)
+        ]
+        self.partition[targets] = self.partition[sources]
+        self.score += delta
+        return delta
@@ -1,4 +1,6 @@
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pandas as pd
@@ -11,14 +13,155 @@ from openpyxl.utils.dataframe import dataframe_to_rows
 from .. import openpyxl_patched  # noqa: F401 - Imported for side effects (patches openpyxl)
 from ..config import settings
 from ..exceptions import ImproperlyConfigured
+from ..lineage import ColumnLineage
 from ..logger import logger
+from ..operation import Operation
 from ..translations import Docstring, _
-from ..utils import pformat
+from ..utils import apply_dtypes, argument, check_if_present, infer_dtypes, pformat
 from ..utils_config import Output, selected_uv
-from .base import UVTask
+from .base import CliArgsMixin, UVTask
 
 
-__all__ = ["XlsStudentData"]
+__all__ = ["Lineage", "XlsStudentData"]
+
+
+class PrefetchExecutor(ThreadPoolExecutor):
+    """Thread pool whose pending tasks are cancelled when it is shut down.
+
+    `ThreadPoolExecutor.shutdown` only accepts `cancel_futures` from Python
+    3.9, submitted futures are kept to cancel them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.futures = []
+
+    def submit(self, *args, **kwargs):
+        future = super().submit(*args, **kwargs)
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True):
+        for future in self.futures:
+            future.cancel()
+        super().shutdown(wait=wait)
+
+
+class FusedColumnRewrite(Operation):
+    """Chain of operations rewriting the same column in place.
+
+    Operations are evaluated once on the unique values of the column and the
+    result is assigned once to the dataframe.
+    """
+
+    def __init__(self, operations):
+        super().__init__()
+        self.operations = list(operations)
+        self.colname = self.operations[0].rewritten_column
+
+    def apply(self, df):
+        check_if_present(df, self.colname)
+        column = df[self.colname]
+        try:
+            codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        except TypeError:
+            # Unhashable values, rewrite the whole column
+            codes, uniques = None, column
+
+        values = self.rewrite(pd.Series(uniques))
+        if codes is not None:
+            values = values.take(codes)
+        values.index = df.index
+        return df.assign(**{self.colname: values})
+
+    def rewrite(self, values):
+        for op in self.operations:
+            values = op.rewrite(values)
+        return values
+
+    @property
+    def rewritten_column(self):
+        return self.colname
+
+    @property
+    def reads(self):
+        return [self.colname]
+
+    @property
+    def writes(self):
+        return [self.colname]
+
+    def name(self):
+        return ", ".join(op.name() for op in self.operations)
+
+    def message(self):
+        return "\n".join(op.message() for op in self.operations)
+
+    def fingerprint(self):
+        return "-".join(op.fingerprint() for op in self.operations)
+
+    def hash(self):
+        # Same value as the unfused operations in a step
+        return "-".join(op.hash() for op in self.operations)
+
+
+def fuse_column_rewrites(lst):
+    """Fuse adjacent operations of `lst` rewriting the same column."""
+
+    result = []
+    chain = []
+    for a in list(lst) + [None]:
+        colname = a.rewritten_column if a is not None else None
+        if chain and colname != chain[0].rewritten_column:
+            result.append(chain[0] if len(chain) == 1 else FusedColumnRewrite(chain))
+            chain = []
+        if colname is not None:
+            chain.append(a)
+        elif a is not None:
+            result.append(a)
+
+    return result
+
+
+def run_step(lst, cache_file, target, executor=None, skipped=None, fuse=False):
+    """Apply operations in `lst` to `cache_file` and write `target`.
+
+    If `executor` is provided, inputs of all operations are loaded in
+    parallel while earlier operations are applied. Operations that are keys
+    of the dictionary `skipped` are not applied, its values are the reasons.
+    If `fuse` is True, adjacent rewrites of the same column are fused.
+
+    Return the resulting dataframe or `TaskFailed`.
+    """
+
+    skipped = skipped or {}
+    for a in lst:
+        if a in skipped:
+            logger.info(skipped[a])
+
+    lst = [a for a in lst if a not in skipped]
+    if fuse:
+        lst = fuse_column_rewrites(lst)
+
+    if executor is not None:
+        df_future = executor.submit(pd.read_csv, cache_file) if cache_file is not None else None
+        for a in lst:
+            a.prefetch(executor)
+        df = df_future.result() if df_future is not None else None
+    else:
+        df = pd.read_csv(cache_file) if cache_file is not None else None
+
+    for a in lst:
+        logger.info(a.message())
+        try:
+            df = a.apply(df)
+        except Exception as e:
+            if settings.DEBUG <= logging.DEBUG:
+                raise e from e
+            return TaskFailed(_("The step `{name}` failed: {e}").format(name=a.name(), e=str(e)))
+
+    df.to_csv(target, index=False)
+    return df
 
 
 def split_list_by_token_inclusive(lst):
@@ -60,15 +203,48 @@ class check_file_and_config_unchanged:
 
 
 class Documents:
-    """Class recording operations done to central file"""
+    """Class recording operations done to central file
+
+    When `prefetch` is True, the input files of all the operations of a step
+    are read in a thread pool as soon as the step begins. When `prune` is
+    True (False by default), operations whose written columns are all
+    overwritten later without being read are skipped. When `fuse` is True
+    (False by default), adjacent operations rewriting the same column in
+    place (``replace_regex``, ``replace_column``, ``apply_column``) are
+    evaluated once on the unique values of the column, without the warnings
+    of each operation about the overwritten column.
+
+    Operations can also be read from a YAML or TOML pipeline file with
+    `from_file`, see `guv.pipeline`.
+
+    Dtypes of the columns of the central file can be declared with `dtypes`.
+    They are applied when tasks read the central file, operations work on
+    the columns as read from the checkpoints.
+    """
 
     target_dir = "generated"
     target_name = "student_data_{step}.csv"
+    dtypes_name = ".dtypes.json"
+    max_prefetch_workers = 4
 
-    def __init__(self):
+    def __init__(self, prefetch=True, prune=False, fuse=False):
         self.uv = None
+        self.prefetch = prefetch
+        self.prune = prune
+        self.fuse = fuse
+        self.pipeline = None
+        self.infer = False
+        self._dtypes = {}
         self._actions = []
 
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Return a `Documents` object with the operations of a pipeline file"""
+
+        from ..pipeline import Pipeline
+
+        return Pipeline.from_file(path).to_documents(**kwargs)
+
     @classmethod
     def target_from(cls, **kwargs):
         target = str(Path(settings.SEMESTER_DIR) / kwargs["uv"] / cls.target_dir / cls.target_name)
@@ -79,8 +255,46 @@ class Documents:
             action.setup(settings=settings, info=info)
         self.uv = info["uv"]
 
+    @property
+    def lineage(self):
+        """Column lineage graph of the recorded operations"""
+        return ColumnLineage(self.actions)
+
+    def skipped_actions(self):
+        """Return a dictionary of redundant operations and skipping messages."""
+
+        if not self.prune:
+            return {}
+
+        skipped = {}
+        for i, killers in self.lineage.redundant().items():
+            others = ", ".join(f"`{self.actions[j].name()}`" for j in killers)
+            skipped[self.actions[i]] = _("Skipping the operation `{name}`: its columns are overwritten by {others}").format(
+                name=self.actions[i].name(),
+                others=others
+            )
+
+        return skipped
+
+    def step_value(self, lst, skipped, final=False):
+        """Return the value of the step `lst` checked by doit.
+
+        Skipped operations of the step are part of it so that the step is
+        run again once they are no longer overwritten.
+        """
+
+        value = "-".join(op.hash() for op in lst)
+        pruned = sorted(op.hash() for op in lst if op in skipped)
+        if pruned:
+            value += "-skipped-" + "-".join(pruned)
+        if final and self.has_dtypes:
+            # Dtypes are written by the final step
+            value += "-" + self.dtypes_fingerprint()
+        return value
+
     def generate_doit_tasks(self):
         steps = split_list_by_token_inclusive(self.actions)
+        skipped = self.skipped_actions()
         for i, lst in enumerate(steps):
             step = i if i < len(steps) - 1 else "final"
             target = self.target_from(step=step, uv=self.uv)
@@ -89,30 +303,40 @@ class Documents:
             other_deps = [d for a in lst for d in a.deps]
             deps = other_deps if cache_file is None else [cache_file] + other_deps
 
-            def build_action(lst, cache_file, target):
+            def build_action(lst, cache_file, target, final):
                 def func():
-                    df = pd.read_csv(cache_file) if cache_file is not None else None
-                    for a in lst:
-                        logger.info(a.message())
+                    if not self.prefetch:
+                        res = run_step(lst, cache_file, target, skipped=skipped, fuse=self.fuse)
+                    else:
+                        executor = PrefetchExecutor(max_workers=self.max_prefetch_workers)
                         try:
-                            df = a.apply(df)
-                        except Exception as e:
-                            if settings.DEBUG <= logging.DEBUG:
-                                raise e from e
-                            return TaskFailed(_("The step `{name}` failed: {e}").format(name=a.name(), e=str(e)))
+                            res = run_step(
+                                lst, cache_file, target, executor=executor, skipped=skipped, fuse=self.fuse
+                            )
+                        finally:
+                            executor.shutdown(wait=False)
+
+                    if isinstance(res, TaskFailed):
+                        return res
 
-                    df.to_csv(target, index=False)
+                    if final:
+                        self.write_dtypes(res)
                 return func
 
-            value = "-".join(op.hash() for op in lst)
-            config_file = str(Path(settings.SEMESTER_DIR) / self.uv / "config.py")
+            value = self.step_value(lst, skipped, final=step == "final")
+            if self.pipeline is not None:
+                # Hashes are canonical, no need to rely on timestamps
+                uptodate = config_changed(value)
+            else:
+                config_file = str(Path(settings.SEMESTER_DIR) / self.uv / "config.py")
+                uptodate = check_file_and_config_unchanged(config_file, value)
 
             doit_task = {
                 "basename": f"DOCS_{i}",
-                "actions": [build_action(lst, cache_file, target)],
+                "actions": [build_action(lst, cache_file, target, step == "final")],
                 "file_dep": deps,
                 "targets": [target],
-                "uptodate": [check_file_and_config_unchanged(config_file, value)],
+                "uptodate": [uptodate],
                 "verbosity": 2
             }
 
@@ -125,6 +349,52 @@ class Documents:
 
             yield doit_task
 
+    def dtypes(self, dtypes=None, infer=False):
+        """Declare the dtypes of columns of the central file
+
+        `dtypes` is a dictionary whose keys are column names and values are
+        ``"category"`` for columns with few distinct values (groups, flags),
+        ``"text"`` for strings stored with pyarrow if installed or any dtype
+        understood by Pandas. If `infer` is True, the dtypes of undeclared
+        text columns are inferred.
+
+        Examples
+        --------
+
+        .. code:: python
+
+           DOCS.dtypes({"Tutorial": "category", "Comment": "text"})
+
+        """
+
+        if dtypes is not None:
+            self._dtypes.update(dtypes)
+        self.infer = self.infer or infer
+
+    def column_dtypes(self, df):
+        """Return the dtypes to apply to the central file `df`."""
+
+        dtypes = infer_dtypes(df) if self.infer else {}
+        dtypes.update(self._dtypes)
+        return dtypes
+
+    @property
+    def has_dtypes(self):
+        return self.infer or bool(self._dtypes)
+
+    def write_dtypes(self, df):
+        """Write the dtypes of the final central file `df` for `read_target`."""
+
+        fp = Path(settings.SEMESTER_DIR) / self.uv / self.target_dir / self.dtypes_name
+        if self.has_dtypes:
+            with open(fp, "w") as file:
+                json.dump(self.column_dtypes(df), file)
+        elif fp.exists():
+            fp.unlink()
+
+    def dtypes_fingerprint(self):
+        return json.dumps({"dtypes": self._dtypes, "infer": self.infer}, sort_keys=True)
+
     def add_action(self, action):
         self._actions.append(action)
 
@@ -276,4 +546,71 @@ class XlsStudentData(UVTask):
 
     @staticmethod
     def read_target(student_data):
-        return pd.read_excel(student_data, engine="openpyxl")
+        df = pd.read_excel(student_data, engine="openpyxl")
+
+        # Apply dtypes declared in DOCS
+        fp = Path(student_data).parent / Documents.target_dir / Documents.dtypes_name
+        if fp.exists():
+            with open(fp, "r") as file:
+                df = apply_dtypes(df, json.load(file))
+
+        return df
+
+
+class Lineage(UVTask, CliArgsMixin):
+    __doc__ = Docstring()
+
+    uptodate = False
+    cli_args = (
+        argument(
+            "column",
+            nargs="?",
+            help=_("Column of the central file to explain. If not specified, redundant operations are listed."),
+        ),
+    )
+
+    def setup(self):
+        super().setup()
+        self.parse_args()
+
+    def run(self):
+        if "DOCS" not in self.settings:
+            raise ImproperlyConfigured(_("The `config.py` file must contain a `DOCS` variable"))
+
+        docs = self.settings.DOCS
+        if not isinstance(docs, Documents):
+            raise ImproperlyConfigured(_("The `DOCS` variable must be of type `Documents`"))
+
+        docs.setup(settings=self.settings, info=self.info)
+        lineage = docs.lineage
+
+        if self.column is None:
+            redundant = lineage.redundant()
+            if not redundant:
+                logger.info(_("No redundant operation found"))
+            for i, killers in redundant.items():
+                others = ", ".join(self.describe(j, docs.actions[j]) for j in killers)
+                logger.info(_("{action} is overwritten by {others}").format(
+                    action=self.describe(i, docs.actions[i]),
+                    others=others
+                ))
+            return
+
+        indices = lineage.lineage(self.column)
+        if not indices:
+            logger.warning(_("No operation writes the column `%s`"), self.column)
+            return
+
+        logger.info(_("The column `%s` depends on the following operations:"), self.column)
+        for i in indices:
+            reads = lineage.reads[i]
+            if reads is None:
+                reads_msg = _("all columns")
+            else:
+                reads_msg = ", ".join(f"`{c}`" for c in sorted(reads)) or "-"
+            logger.info("  %s", self.describe(i, docs.actions[i]))
+            logger.info("    %s", _("reads: {columns}").format(columns=reads_msg))
+
+    @staticmethod
+    def describe(i, action):
+        return f"[{i + 1}] {action.name()}: {action.message()}"
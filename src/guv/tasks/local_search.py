@@ -0,0 +1,245 @@
+"""Optimizers of partitions under group constraints.
+
+All solvers minimize the score of a `ConstraintGraph` over partitions having
+the same group sizes as the initial partition, possibly made of super-nodes
+of several elements. They stop as soon as the lower
+bound `ConstraintGraph.min_cost` is reached, after `max_iter` attempts or
+after `time_limit` seconds. What an attempt is depends on the solver and is
+described by its `unit` attribute.
+"""
+
+import math
+import time
+
+import numpy as np
+
+from .evolutionary_algorithm import incremental_evolutionary_algorithm
+from .group_constraints import PartitionState
+
+
+class Solver:
+    """Base class of the solvers used by `CsvCreateGroups`"""
+
+    name = None
+    unit = None
+
+    def __init__(self, max_iter=1000, time_limit=None, seed=None, stop_event=None):
+        self.max_iter = max_iter
+        self.time_limit = time_limit
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.stop_event = stop_event
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.monotonic()
+
+    def time_exceeded(self):
+        """Return True if the time limit is reached or another solver is done."""
+
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        if self.time_limit is None:
+            return False
+        return time.monotonic() - self.start_time > self.time_limit
+
+    def solve(self, graph, initial_partition):
+        """Return the number of attempts, the best score and the best partition."""
+
+        raise NotImplementedError
+
+
+class EvolutionarySolver(Solver):
+    """Evolutionary algorithm permuting many elements at once"""
+
+    name = "evolutionary"
+    unit = "variants"
+    num_variants = 10
+    top_k = 20
+
+    def solve(self, graph, initial_partition):
+        self.start()
+        return incremental_evolutionary_algorithm(
+            initial_partition,
+            graph,
+            graph.min_cost,
+            max_variants=self.max_iter,
+            num_variants=self.num_variants,
+            num_permutations=math.ceil(0.4 * graph.n),
+            top_k=self.top_k,
+            rng=self.rng,
+            stop=self.time_exceeded,
+        )
+
+
+class SwapSolver(Solver):
+    """Base class of the solvers based on swaps of two elements"""
+
+    def conflicting(self, state):
+        """Return the elements involved in a violated constraint."""
+
+        graph, partition = state.graph, state.partition
+        costs = (
+            state.counts[np.arange(graph.n), partition]
+            - graph.offset * graph.sizes * (state.sizes[partition] - graph.sizes)
+        )
+        return np.flatnonzero((costs > 0) | state.balance_conflicts())
+
+    def random_partners(self, state, a, size):
+        """Return up to `size` random elements not in the group of `a` that can be swapped with `a`."""
+
+        others = np.flatnonzero(state.partition != state.partition[a])
+        if not state.graph.has_unit_sizes:
+            others = others[state.can_swap(a, others)]
+        if len(others) <= size:
+            return others
+        return self.rng.choice(others, size=size, replace=False)
+
+
+class SimulatedAnnealingSolver(SwapSolver):
+    """Simulated annealing on swaps of two elements
+
+    One attempt is a sweep of as many swaps as elements. The temperature
+    decreases geometrically from a value such that an average worsening
+    swap is initially accepted half of the time.
+    """
+
+    name = "annealing"
+    unit = "temperature steps"
+    final_temperature = 0.01
+
+    def initial_temperature(self, state):
+        deltas = []
+        for _ in range(min(100, state.graph.n)):
+            a = self.rng.integers(state.graph.n)
+            partners = self.random_partners(state, a, 1)
+            if len(partners) > 0:
+                deltas.append(abs(state.swap_delta(a, partners[0])))
+        mean_delta = np.mean(deltas) if deltas else 0
+        return max(mean_delta / math.log(2), 1)
+
+    def solve(self, graph, initial_partition):
+        self.start()
+        state = PartitionState(graph, initial_partition)
+        best_score, best_partition = state.score, state.partition.copy()
+        if best_score == graph.min_cost:
+            return 0, best_score, best_partition
+
+        temperature = self.initial_temperature(state)
+        cooling = (self.final_temperature / temperature) ** (1 / max(self.max_iter, 1))
+
+        attempt = 0
+        for attempt in range(1, self.max_iter + 1):
+            conflicting = self.conflicting(state)
+            for _ in range(graph.n):
+                # Favor elements involved in a violated constraint
+                if len(conflicting) > 0 and self.rng.random() < 0.5:
+                    a = conflicting[self.rng.integers(len(conflicting))]
+                else:
+                    a = self.rng.integers(graph.n)
+                b = self.rng.integers(graph.n)
+                if state.partition[a] == state.partition[b] or not state.can_swap(a, b):
+                    continue
+
+                delta = state.swap_delta(a, b)
+                if delta <= 0 or self.rng.random() < math.exp(-delta / temperature):
+                    state.swap(a, b)
+                    if state.score < best_score:
+                        best_score, best_partition = state.score, state.partition.copy()
+                        if best_score == graph.min_cost:
+                            return attempt, best_score, best_partition
+
+            temperature *= cooling
+            if self.time_exceeded():
+                break
+
+        return attempt, best_score, best_partition
+
+
+class TabuSolver(SwapSolver):
+    """Tabu search on swaps of two elements
+
+    At each attempt, swaps of elements involved in violated constraints with
+    random partners are evaluated and the best one is applied even if it
+    worsens the score. Moved elements cannot move again for a few attempts
+    unless the swap improves the best score found so far.
+    """
+
+    name = "tabu"
+    unit = "moves"
+    num_candidates = 20
+    num_partners = 20
+
+    def solve(self, graph, initial_partition):
+        self.start()
+        state = PartitionState(graph, initial_partition)
+        best_score, best_partition = state.score, state.partition.copy()
+        if best_score == graph.min_cost:
+            return 0, best_score, best_partition
+
+        tenure = max(3, min(20, graph.n // 10))
+        tabu_until = np.zeros(graph.n, dtype=int)
+
+        attempt = 0
+        for attempt in range(1, self.max_iter + 1):
+            conflicting = self.conflicting(state)
+            if len(conflicting) == 0:
+                conflicting = np.arange(graph.n)
+            if len(conflicting) > self.num_candidates:
+                conflicting = self.rng.choice(conflicting, size=self.num_candidates, replace=False)
+
+            best_move = None
+            for a in conflicting:
+                partners = self.random_partners(state, a, self.num_partners)
+                if len(partners) == 0:
+                    continue
+
+                deltas = state.swap_deltas(a, partners)
+                allowed = (tabu_until[partners] <= attempt) & (tabu_until[a] <= attempt)
+                aspiration = state.score + deltas < best_score
+                deltas = np.where(allowed | aspiration, deltas, np.iinfo(int).max)
+                k = np.argmin(deltas)
+                if deltas[k] != np.iinfo(int).max and (best_move is None or deltas[k] < best_move[0]):
+                    best_move = (deltas[k], a, partners[k])
+
+            if best_move is not None:
+                _, a, b = best_move
+                state.swap(a, b)
+                tabu_until[[a, b]] = attempt + tenure + self.rng.integers(tenure)
+                if state.score < best_score:
+                    best_score, best_partition = state.score, state.partition.copy()
+                    if best_score == graph.min_cost:
+                        return attempt, best_score, best_partition
+
+            if self.time_exceeded():
+                break
+
+        return attempt, best_score, best_partition
+
+
+SOLVERS = {
+    solver.name: solver
+    for solver in [EvolutionarySolver, SimulatedAnnealingSolver, TabuSolver]
+}
+
+
+def solve(solver_name, graph, initial_partition, stop_event=None, **kwargs):
+    """Run the solver named `solver_name`, possibly in a worker process.
+
+    `stop_event` is set when the lower bound is reached to stop the other
+    solvers sharing it.
+    """
+
+    solver = SOLVERS[solver_name](stop_event=stop_event, **kwargs)
+    result = solver.solve(graph, initial_partition)
+    if stop_event is not None and result[1] == graph.min_cost:
+        stop_event.set()
+    return result
+
+
+def best_result(results):
+    """Return the best of the results of several restarts."""
+
+    num_attempts = sum(result[0] for result in results)
+    _, best_score, best_partition = min(results, key=lambda result: result[1])
+    return num_attempts, best_score, best_partition
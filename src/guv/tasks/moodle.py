@@ -1,5 +1,8 @@
+import hashlib
 import json
 import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import random
 import shlex
@@ -18,11 +21,22 @@ from ..utils import (
     make_groups,
     normalize_string,
     pformat,
+    positive_int,
     sort_values,
 )
 from ..utils_config import Output, rel_to_dir
 from .base import CliArgsMixin, UVTask
-from .evolutionary_algorithm import evolutionary_algorithm
+from .group_constraints import (
+    ConstraintGraph,
+    get_affinity_components,
+    get_affinity_violations,
+    get_balance_violations,
+    get_group_codes,
+    get_repulse_violations,
+    pack_components,
+)
+from .local_search import SOLVERS, best_result, solve
+from .pairing_history import PairingHistory
 from .internal import XlsStudentData
 
 
@@ -275,36 +289,24 @@ class JsonGroup(UVTask, CliArgsMixin):
                 print(s, file=fd)
 
 
-def get_coocurrence_matrix_from_partition(series, nan_policy="same"):
-    """Return co-occurrence matrix of vector."""
-
-    if nan_policy == "same":
-        s_filled = series.fillna("unique_value_1")
-    elif nan_policy == "different":
-        unique_values = pd.Series([f"unique_value_{i}" for i in range(len(series))], index=series.index)
-        s_filled = series.fillna(unique_values)
-    else:
-        raise ValueError("Wrong nan_policy")
+def get_coocurrence_dict(df, columns, nan_policy="same"):
+    """Return a dictionary mapping columns with the group codes of the rows.
 
-    arr = s_filled.to_numpy()
-    return get_coocurrence_matrix_from_array(arr)
+    Two rows are in the same group of a column if they have the same code,
+    co-occurrence matrices are never built. See `get_group_codes` for
+    `nan_policy`.
+    """
 
+    return {
+        column: get_group_codes(df[column], nan_policy=nan_policy)
+        for column in columns
+    }
 
-def get_coocurrence_matrix_from_array(arr):
-    return (arr[:, None] == arr[None, :]).astype(int)
 
+def default_seed(title):
+    """Return a seed that only depends on `title`."""
 
-def get_coocurrence_dict(df, columns, nan_policy="same"):
-    """Return a dictionary mapping column with their co-occurrence matrix."""
-    cooc_dict = {}
-    for column in columns:
-        series = df[column]
-        cooc = get_coocurrence_matrix_from_partition(series, nan_policy=nan_policy)
-        if column in cooc_dict:
-            cooc_dict[column] = cooc_dict[column] + cooc
-        else:
-            cooc_dict[column] = cooc
-    return cooc_dict
+    return int.from_bytes(hashlib.sha256(title.encode("utf-8")).digest()[:4], "little")
 
 
 class CsvCreateGroups(UVTask, CliArgsMixin):
@@ -313,6 +315,7 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
     uptodate = False
     target_dir = "generated"
     target_name = "{title}_groups.csv"
+    cache_dir = ".groups_cache"
     cli_args = (
         argument("title", help=_("Name associated with the set of created groups. Included in the name of the created file and in the name of the created groups following the used *template*.")),
         argument(
@@ -398,12 +401,54 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
             type=lambda t: [s.strip() for s in t.split(",")],
             help=_("List of columns of affinity groups.")
         ),
+        argument(
+            "--balance",
+            required=False,
+            metavar="COL,[COL,...]",
+            default=[],
+            type=lambda t: [s.strip() for s in t.split(",")],
+            help=_("List of columns whose values should be evenly spread among groups.")
+        ),
+        argument(
+            "--avoid-history",
+            required=False,
+            metavar="TITLE,[TITLE,...]",
+            default=[],
+            type=lambda t: [s.strip() for s in t.split(",")],
+            help=_("List of titles of groups previously created whose members should not be grouped again.")
+        ),
         argument(
             "--max-iter",
             type=int,
             default=1000,
-            help=_("Maximum number of attempts to find groups with constraints (default %(default)s).")
-        )
+            help=_("Maximum number of attempts to find groups with constraints: variants for `evolutionary`, temperature steps of as many swaps as students for `annealing`, single swaps for `tabu` (default %(default)s).")
+        ),
+        argument(
+            "--solver",
+            choices=list(SOLVERS.keys()),
+            default="evolutionary",
+            help=_("Algorithm used to find groups with constraints (default %(default)s).")
+        ),
+        argument(
+            "--time-limit",
+            type=float,
+            default=None,
+            metavar="SECONDS",
+            help=_("Maximum time spent to find groups with constraints.")
+        ),
+        argument(
+            "--seed",
+            type=int,
+            default=None,
+            help=_("Seed of the random generator used to shuffle students and find groups with constraints (derived from the title by default).")
+        ),
+        argument(
+            "-j",
+            "--jobs",
+            type=positive_int,
+            default=1,
+            help=_("Number of processes used to find groups with constraints (default %(default)s).")
+        ),
     )
 
     def setup(self):
@@ -441,7 +486,7 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
                 with open(path, "r") as fd:
                     lines = [l.strip() for l in fd.readlines()]
                 if self.random:
-                    random.shuffle(lines)
+                    random.Random(self.seed).shuffle(lines)
                 for l in lines:
                     yield pformat(tmpl, group_name=l.strip())
             else:
@@ -449,7 +494,7 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
         else:
             names = self.names.copy()
             if self.random:
-                random.shuffle(names)
+                random.Random(self.seed).shuffle(names)
             for n in names:
                 yield pformat(tmpl, group_name=n)
 
@@ -495,8 +540,8 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
         if "{grouping_name}" not in self.template and self.grouping is not None and not self.global_:
             raise self.parser.error(_("The template does not contain '{grouping_name}' but the --grouping option is active with resetting of group names"))
 
-        if self.ordered is not None and (self.affinity_groups or self.other_groups):
-            raise self.parser.error(_("The ``ordered`` option is incompatible with the constraints ``other-groups`` and ``affinity_groups``."))
+        if self.ordered is not None and (self.affinity_groups or self.other_groups or self.balance or self.avoid_history):
+            raise self.parser.error(_("The ``ordered`` option is incompatible with the constraints ``other-groups``, ``affinity_groups``, ``balance`` and ``avoid-history``."))
 
         df = XlsStudentData.read_target(self.xls_merge)
 
@@ -516,9 +561,23 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
                 df, self.affinity_groups, file=self.xls_merge, base_dir=self.settings.CWD
             )
 
-        # Shuffled or ordered rows according to `ordered`
+        if self.balance is not None:
+            self.check_if_present(
+                df, self.balance, file=self.xls_merge, base_dir=self.settings.CWD
+            )
+
+        if self.avoid_history:
+            self.history = self.load_history()
+
+        # Same title, same groups unless a seed is given
+        if self.seed is None:
+            self.seed = default_seed(self.title)
+
+        # Shuffled or ordered rows according to `ordered`. Rows are sorted
+        # first to not depend on the order of the central file.
         if self.ordered is None:
-            df = df.sample(frac=1).reset_index(drop=True)
+            df = sort_values(df, [self.settings.LOGIN_COLUMN])
+            df = df.sample(frac=1, random_state=self.seed).reset_index(drop=True)
         elif len(self.ordered) == 0:
             columns = [self.settings.LASTNAME_COLUMN, self.settings.NAME]
             self.check_if_present(df, columns, file=self.xls_merge)
@@ -535,15 +594,18 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
 
         # Diviser le dataframe en morceaux d'après `key` et faire des
         # groupes dans chaque morceau
+        groupby = list(generate_groupby(df, self.grouping))
+        partitions = self.make_partitions(groupby)
+
         def df_gen():
             name_gen = self.create_name_gen(tmpl)
-            for name, df_group in generate_groupby(df, self.grouping):
+            for (name, df_group), partition in zip(groupby, partitions):
                 # Reset name generation for a new group
                 if not self.global_:
                     name_gen = self.create_name_gen(tmpl)
 
                 # Make sub-groups for group `name`
-                yield self.make_groups(name, df_group, name_gen)
+                yield self.make_groups(name, df_group, partition, name_gen)
 
         # Concatenate sub-groups for each grouping
         s_groups = pd.concat(df_gen())
@@ -577,20 +639,149 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
             command_line="guv " + " ".join(map(shlex.quote, sys.argv[1:]))
         ))
 
-    def make_groups(self, name, df, name_gen):
-        """Try to make subgroups in dataframe `df`.
+    def load_history(self):
+        """Return the pairing history updated with the groups files of the UV"""
+
+        directory = Path(self.target).parent
+        store = directory / PairingHistory.store_name
+        history = PairingHistory.load(store)
+        if history.update(directory):
+            directory.mkdir(parents=True, exist_ok=True)
+            history.save(store)
+
+        self.avoid_history = [normalize_string(title, type="file") for title in self.avoid_history]
+        for title in self.avoid_history:
+            if title not in history.titles:
+                raise GuvUserError(_("No groups created with the title `{title}`, available titles: {titles}").format(
+                    title=title, titles=", ".join(history.titles)
+                ))
+
+        return history
+
+    def make_partitions(self, groupby):
+        """Return a partition for each dataframe of `groupby`.
+
+        Partitions are optimized given the constraints. Students linked by
+        affinity groups are kept together when they fit in a group. If
+        `jobs` is greater than 1, `jobs` seeded restarts of each
+        optimization run in a process pool and all optimizations run
+        concurrently. The optimized partitions of the last run are cached
+        per target with a key computed from all the inputs of the
+        optimization.
+        """
+
+        partitions = [self.make_partition(len(df_group.index)) for _, df_group in groupby]
+        if not (self.affinity_groups or self.other_groups or self.balance or self.avoid_history):
+            return partitions
+
+        cooc_data = [self.get_cooc_data(df_group) for _, df_group in groupby]
+
+        # Only the last optimization of each target is kept
+        cache_file = Path(self.target).parent / self.cache_dir / f"{Path(self.target).stem}.json"
+        cache_key = self.cache_key(groupby)
+        if cache_file.exists():
+            with open(cache_file, "r") as stream:
+                cache = json.load(stream)
+            if cache.get("key") == cache_key:
+                logger.info(_("Constraints and students unchanged, groups are read from the cache"))
+                return [
+                    self.report_partition(name, df_group, data, (num_attempts, score, np.array(partition, dtype=int)))
+                    for (name, df_group), data, (num_attempts, score, partition) in zip(groupby, cooc_data, cache["results"])
+                ]
+
+        graphs = [data["graph"] for data in cooc_data]
+
+        # Students linked by affinity groups are merged in super-nodes
+        # when they fit in a group
+        labels = [None] * len(groupby)
+        if self.affinity_groups:
+            for i, data in enumerate(cooc_data):
+                group_sizes = np.bincount(partitions[i])
+                labels[i], partitions[i] = pack_components(data["components"], group_sizes)
+                graphs[i] = graphs[i].contract(labels[i])
+
+        kwargs = {"max_iter": self.max_iter, "time_limit": self.time_limit}
+
+        if self.jobs == 1:
+            results = [
+                solve(self.solver, graph, partition, seed=self.seed, **kwargs)
+                for graph, partition in zip(graphs, partitions)
+            ]
+        else:
+            seeds = [
+                int(s.generate_state(1)[0])
+                for s in np.random.SeedSequence(self.seed).spawn(self.jobs)
+            ]
+            with multiprocessing.Manager() as manager, ProcessPoolExecutor(self.jobs) as executor:
+                futures = []
+                for graph, partition in zip(graphs, partitions):
+                    # Shared by the restarts to stop as soon as one is optimal
+                    stop_event = manager.Event()
+                    futures.append([
+                        executor.submit(
+                            solve, self.solver, graph, partition, seed=seed, stop_event=stop_event, **kwargs
+                        )
+                        for seed in seeds
+                    ])
+                results = [best_result([f.result() for f in restarts]) for restarts in futures]
+
+        # Expand partitions of super-nodes to students
+        results = [
+            result if label is None else (result[0], result[1], result[2][label])
+            for result, label in zip(results, labels)
+        ]
+
+        partitions = [
+            self.report_partition(name, df_group, data, result)
+            for (name, df_group), data, result in zip(groupby, cooc_data, results)
+        ]
+
+        cache = {
+            "key": cache_key,
+            "results": [
+                [int(result[0]), int(result[1]), partition.tolist()]
+                for result, partition in zip(results, partitions)
+            ],
+        }
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_file, "w") as stream:
+            json.dump(cache, stream)
+
+        return partitions
+
+    def cache_key(self, groupby):
+        """Return the hash of everything the optimized partitions depend on"""
+
+        columns = [self.settings.LOGIN_COLUMN] + self.other_groups + self.affinity_groups + self.balance
+        groups = []
+        for name, df_group in groupby:
+            values = df_group[columns].astype(object)
+            group = {
+                "name": None if name is None else str(name),
+                "rows": values.where(values.notna(), None).values.tolist(),
+            }
+            if self.avoid_history:
+                logins = df_group[self.settings.LOGIN_COLUMN].tolist()
+                group["history"] = [a.tolist() for a in self.history.edges(self.avoid_history, logins)]
+            groups.append(group)
+
+        data = {
+            "groups": groups,
+            "columns": columns,
+            "sizing": [self.num_groups, self.group_size, self.proportions],
+            "solver": [self.solver, self.max_iter, self.time_limit, self.seed, self.jobs],
+        }
+        data = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def make_groups(self, name, df, partition, name_gen):
+        """Name the subgroups of `partition` in dataframe `df`.
 
         Returns a Pandas series whose index is the one of `df` and
         value is the group name generated from `name` and `name_gen`.
 
         """
 
-        n = len(df.index)
-        partition = self.make_partition(n)
-
-        if self.affinity_groups or self.other_groups:
-            partition = self.optimize_partition(name, df, partition)
-
         names = self.add_names_to_grouping(partition, name, name_gen)
         series = pd.Series(names, index=df.index)
 
@@ -646,96 +837,103 @@ class CsvCreateGroups(UVTask, CliArgsMixin):
 
         return make_groups(n, proportions)
 
-    def optimize_partition(self, name, df, initial_partition):
-        """Return an optimized partition given constraints and report"""
-
-        N = len(df.index)
-
-        cooc_data = self.get_cooc_data(df)
-        num_permutations = math.ceil(0.4 * N)
-        num_variants, best_score, best_partition = evolutionary_algorithm(
-            initial_partition,
-            cooc_data["cooc_cost"],
-            cooc_data["min_cost"],
-            max_variants=self.max_iter,
-            num_variants=10,
-            num_permutations=num_permutations,
-            top_k=20
-        )
+    def report_partition(self, name, df, cooc_data, result):
+        """Report violated constraints of an optimized partition and return it"""
+
+        num_variants, best_score, best_partition = result
+        unit = _(SOLVERS[self.solver].unit)
 
-        if best_score == cooc_data["min_cost"]:
+        if best_score == cooc_data["graph"].min_cost:
             if name is not None:
-                logger.info(_("Optimal partition for the group `{name}` found in {num_variants} attempts.").format(name=name, num_variants=num_variants))
+                logger.info(_("Optimal partition for the group `{name}` found in {num_variants} {unit}.").format(name=name, num_variants=num_variants, unit=unit))
             else:
-                logger.info(_("Optimal partition found in {num_variants} attempts.").format(num_variants=num_variants))
+                logger.info(_("Optimal partition found in {num_variants} {unit}.").format(num_variants=num_variants, unit=unit))
         else:
             if name is not None:
-                logger.warning(_("No optimal solution found for the group `{name}` in {max_iter} attempts, best solution:").format(name=name, max_iter=self.max_iter))
+                logger.warning(_("No optimal solution found for the group `{name}` in {max_iter} {unit} of the `{solver}` solver, best solution:").format(name=name, max_iter=self.max_iter, unit=unit, solver=self.solver))
             else:
-                logger.warning(_("No optimal solution found in {max_iter} attempts, best solution:").format(max_iter=self.max_iter))
+                logger.warning(_("No optimal solution found in {max_iter} {unit} of the `{solver}` solver, best solution:").format(max_iter=self.max_iter, unit=unit, solver=self.solver))
 
-            best_coocurrence = get_coocurrence_matrix_from_array(best_partition)
+            columns = [self.settings[e] for e in ["NAME_COLUMN", "LASTNAME_COLUMN"]]
 
-            for column, weight_coocurrence in cooc_data["cooc_repulse_dict"].items():
-                scores = weight_coocurrence * best_coocurrence
-                n_errors = (np.sum(scores) - N) // 2
+            def report_pairs(rows, cols):
+                for i, j in zip(rows, cols):
+                    stu1 = " ".join(df[columns].iloc[i])
+                    stu2 = " ".join(df[columns].iloc[j])
+                    logger.warning(f"  - {stu1} -- {stu2}")
+
+            for column, codes in cooc_data["cooc_repulse_dict"].items():
+                rows, cols = get_repulse_violations(best_partition, codes)
+                n_errors = len(rows)
                 if n_errors > 0:
                     logger.warning(_("- non-membership constraint by the column `{column}` violated {n_errors} times:").format(column=column, n_errors=n_errors))
-
-                    for i, j in np.column_stack(np.where(scores > 0)):
-                        if i >= j:
-                            continue
-                        columns = [self.settings[e] for e in ["NAME_COLUMN", "LASTNAME_COLUMN"]]
-                        stu1 = " ".join(df[columns].iloc[i])
-                        stu2 = " ".join(df[columns].iloc[j])
-                        logger.warning(f"  - {stu1} -- {stu2}")
+                    report_pairs(rows, cols)
                 else:
                     logger.warning(_("- non-membership constraint by the column `{column}` verified").format(column=column))
 
-            for column, weight_coocurrence in cooc_data["cooc_affinity_dict"].items():
-                scores = (1 - weight_coocurrence) * best_coocurrence
-                n_errors = np.sum(scores) // 2
-
+            for column, codes in cooc_data["cooc_affinity_dict"].items():
+                rows, cols = get_affinity_violations(best_partition, codes)
+                n_errors = len(rows)
                 if n_errors > 0:
                     logger.warning(_("- affinity constraint by the column `{column}` violated {n_errors} times:").format(column=column, n_errors=n_errors))
+                    report_pairs(rows, cols)
+                else:
+                    logger.warning(_("- affinity constraint by the column `{column}` verified").format(column=column))
 
-                    for i, j in np.column_stack(np.where(scores > 0)):
-                        if i >= j:
-                            continue
+            if self.avoid_history:
+                rows, cols, _weights = cooc_data["history"]
+                same = best_partition[rows] == best_partition[cols]
+                rows, cols = rows[same], cols[same]
+                n_errors = len(rows)
+                if n_errors > 0:
+                    logger.warning(_("- history constraint by the titles `{titles}` violated {n_errors} times:").format(titles=", ".join(self.avoid_history), n_errors=n_errors))
+                    report_pairs(rows, cols)
+                else:
+                    logger.warning(_("- history constraint by the titles `{titles}` verified").format(titles=", ".join(self.avoid_history)))
 
-                        columns = [self.settings[e] for e in ["NAME_COLUMN", "LASTNAME_COLUMN"]]
-                        stu1 = " ".join(df[columns].iloc[i])
-                        stu2 = " ".join(df[columns].iloc[j])
-                        logger.warning(f"  - {stu1} -- {stu2}")
+            for column, codes in cooc_data["balance_dict"].items():
+                groups, categories, counts, bounds = get_balance_violations(best_partition, codes)
+                n_errors = int(np.sum(counts - bounds))
+                if n_errors > 0:
+                    logger.warning(_("- balance constraint by the column `{column}` violated {n_errors} times:").format(column=column, n_errors=n_errors))
+                    for group, category, count, bound in zip(groups, categories, counts, bounds):
+                        value = df[column].iloc[np.flatnonzero(codes == category)[0]]
+                        logger.warning(_("  - group {group}: {count} students with `{value}` for at most {bound}").format(group=group + 1, count=count, value=value, bound=bound))
                 else:
-                    logger.warning(_("- affinity constraint by the column `{column}` verified").format(column=column))
+                    logger.warning(_("- balance constraint by the column `{column}` verified").format(column=column))
 
         return best_partition
 
     def get_cooc_data(self, df):
-        """Return various data to handle group constraints"""
+        """Return group codes, affinity components and the constraint graph of `df`"""
 
         cooc_repulse_dict = get_coocurrence_dict(df, self.other_groups, nan_policy="different")
-        cooc_repulse = sum(cooc for _, cooc in cooc_repulse_dict.items())
-        n_repulse = len(self.other_groups)
-
         cooc_affinity_dict = get_coocurrence_dict(df, self.affinity_groups, nan_policy="same")
-        cooc_affinity = sum(cooc for _, cooc in cooc_affinity_dict.items())
-        n_affinity = len(self.affinity_groups)
-
-        cooc_final = cooc_repulse - cooc_affinity
-        minimum_score = cooc_final.min(axis=None)
-
-        # Final distance matrix: 0 means OK, > 0 means a constraint is violated
-        cooc_final = cooc_final - minimum_score
-        N = len(df.index)
+        balance_dict = get_coocurrence_dict(df, self.balance, nan_policy="different")
+        history = None
+        if self.avoid_history:
+            # Pairs are weighted by the number of groups they already shared
+            history = self.history.edges(self.avoid_history, df[self.settings.LOGIN_COLUMN].tolist())
+
+        graph = ConstraintGraph.from_codes(
+            len(df.index),
+            list(cooc_repulse_dict.values()),
+            list(cooc_affinity_dict.values()),
+            list(balance_dict.values()),
+            weighted_pairs=history,
+        )
 
-        diagonal_cost = N * (n_repulse - n_affinity - minimum_score)
+        # Students without affinity group are not linked together
+        components = get_affinity_components(
+            len(df.index),
+            [get_group_codes(df[column], nan_policy="different") for column in cooc_affinity_dict],
+        )
 
         return {
-            "cooc_cost": cooc_final,
-            "min_cost": diagonal_cost,
+            "graph": graph,
+            "components": components,
             "cooc_repulse_dict": cooc_repulse_dict,
-            "cooc_affinity_dict": cooc_affinity_dict
+            "cooc_affinity_dict": cooc_affinity_dict,
+            "balance_dict": balance_dict,
+            "history": history,
         }
-
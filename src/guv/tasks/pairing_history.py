@@ -0,0 +1,108 @@
+"""Store of the pairs of students already put in the same group.
+
+The store is built from the ``{title}_groups.csv`` files written by
+`CsvCreateGroups` and kept as an edge list of login indices for each title.
+Only the files added or modified since the last update are read again.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .group_constraints import get_group_codes, get_pairs_from_codes
+
+GROUPS_SUFFIX = "_groups.csv"
+
+
+class PairingHistory:
+    """Pairs of logins that were in the same group, by title"""
+
+    store_name = ".pairing_history.json"
+
+    def __init__(self, logins=None, entries=None):
+        self.logins = list(logins or [])
+        self.login_index = {login: i for i, login in enumerate(self.logins)}
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, "r") as stream:
+                data = json.load(stream)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return cls()
+        return cls(data["logins"], data["entries"])
+
+    def save(self, path):
+        with open(path, "w") as stream:
+            json.dump({"logins": self.logins, "entries": self.entries}, stream)
+
+    @property
+    def titles(self):
+        return list(self.entries.keys())
+
+    def index(self, login):
+        if login not in self.login_index:
+            self.login_index[login] = len(self.logins)
+            self.logins.append(login)
+        return self.login_index[login]
+
+    def add(self, title, logins, groups, mtime=None):
+        """Replace the pairs of `title` with the ones of `groups`."""
+
+        indices = np.array([self.index(login) for login in logins], dtype=int)
+        rows, cols = get_pairs_from_codes(get_group_codes(pd.Series(groups), nan_policy="different"))
+        a, b = indices[rows], indices[cols]
+        self.entries[title] = {
+            "mtime": mtime,
+            "rows": np.minimum(a, b).tolist(),
+            "cols": np.maximum(a, b).tolist(),
+        }
+
+    def update(self, directory):
+        """Read the groups files of `directory` added or modified since the last update.
+
+        Returns True if the store changed.
+        """
+
+        changed = False
+        for path in sorted(Path(directory).glob("*" + GROUPS_SUFFIX)):
+            title = path.name[:-len(GROUPS_SUFFIX)]
+            mtime = path.stat().st_mtime
+            if title in self.entries and self.entries[title]["mtime"] == mtime:
+                continue
+
+            df = pd.read_csv(path, header=None, names=["Login", "group"])
+            self.add(title, df["Login"], df["group"], mtime=mtime)
+            changed = True
+
+        return changed
+
+    def edges(self, titles, logins):
+        """Return the pairs of positions in `logins` and their number of past groups.
+
+        Only the groups of `titles` are counted.
+        """
+
+        n = len(logins)
+        positions = np.full(len(self.logins), -1, dtype=int)
+        for position, login in enumerate(logins):
+            if login in self.login_index:
+                positions[self.login_index[login]] = position
+
+        keys = []
+        for title in titles:
+            entry = self.entries[title]
+            a = positions[np.asarray(entry["rows"], dtype=int)]
+            b = positions[np.asarray(entry["cols"], dtype=int)]
+            known = (a != -1) & (b != -1)
+            a, b = a[known], b[known]
+            keys.append(np.minimum(a, b) * n + np.maximum(a, b))
+
+        if not keys:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+        unique_keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+        return unique_keys // max(n, 1), unique_keys % max(n, 1), counts
@@ -1,3 +1,4 @@
+import argparse
 import hashlib
 from pathlib import Path
 import re
@@ -19,6 +20,18 @@ def argument(*args, **kwargs):
     return SimpleNamespace(args=args, kwargs=kwargs)
 
 
+def positive_int(value):
+    """Argparse type of an integer greater than or equal to 1"""
+
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(_("invalid int value: `{value}`").format(value=value))
+    if number < 1:
+        raise argparse.ArgumentTypeError(_("must be greater than or equal to 1: `{value}`").format(value=value))
+    return number
+
+
 def rotation_invariant_hash(s: str) -> str:
     # Generate all rotations
     rotations = [s[i:] + s[:i] for i in range(len(s))]
@@ -85,6 +98,39 @@ def smart_cast(value):
         return value
 
 
+def smart_cast_series(series):
+    """Return the values of `series` cast as with `smart_cast`.
+
+    Casting is done once for the whole column. Columns of mixed types
+    fall back to `smart_cast` on each value.
+    """
+
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return series.tolist()
+
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        integral = np.isfinite(values) & (values == np.trunc(values))
+        small = integral & (np.abs(values) < 2**63)
+        result = values.astype(object)
+        result[small] = values[small].astype(np.int64).astype(object)
+        result[integral & ~small] = [int(value) for value in values[integral & ~small]]
+        return result.tolist()
+
+    if pd.api.types.is_string_dtype(series):
+        result = series.to_numpy(dtype=object, na_value=np.nan)
+        numbers = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        integers = series.str.fullmatch(r"\s*[+-]?\d+\s*").fillna(False).to_numpy(dtype=bool)
+        floats = ~np.isnan(numbers) & ~integers
+        result[floats] = numbers[floats].astype(object)
+        if integers.any():
+            # Not through float to keep long numbers exact
+            result[integers] = pd.to_numeric(series[integers].str.strip()).astype(object).to_numpy()
+        return result.tolist()
+
+    return [smart_cast(value) for value in series]
+
+
 def plural(num, plural, singular):
     if num > 1:
         return plural
@@ -282,6 +328,59 @@ def read_dataframe(filename, read_method=None, kw_read=None):
     return df
 
 
+def text_dtype():
+    """Return the arrow-backed string dtype if pyarrow is installed."""
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "string"
+    return "string[pyarrow]"
+
+
+def infer_dtypes(df, max_categories=50, max_ratio=0.5):
+    """Return dtypes for the text columns of `df`.
+
+    Columns with few distinct values are declared as categorical, other text
+    columns as ``"text"``.
+    """
+
+    dtypes = {}
+    for colname in df.columns:
+        column = df[colname]
+        if not (pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column)):
+            continue
+
+        values = column.dropna()
+        if len(values) == 0 or not values.map(lambda v: isinstance(v, str)).all():
+            continue
+
+        n_unique = values.nunique()
+        if n_unique <= max_categories and n_unique <= max_ratio * len(values):
+            dtypes[colname] = "category"
+        else:
+            dtypes[colname] = "text"
+
+    return dtypes
+
+
+def apply_dtypes(df, dtypes):
+    """Cast columns of `df` to `dtypes`, ignoring missing columns.
+
+    The dtype ``"text"`` stands for arrow-backed strings when available.
+    """
+
+    casts = {
+        colname: text_dtype() if dtype == "text" else dtype
+        for colname, dtype in dtypes.items()
+        if colname in df.columns and str(df[colname].dtype) != dtype
+    }
+    if not casts:
+        return df
+
+    return df.astype(casts)
+
+
 def check_if_absent(dataframe, columns, errors="raise"):
     if errors not in ("raise", "warning", "silent"):
         raise ValueError("Unknown `errors`", errors)
@@ -114,14 +114,17 @@ def ask_choice(prompt, choices={}):
 
 
 class Output:
-    def __init__(self, target, protected=False):
+    def __init__(self, target, protected=False, backup=False):
         self._target = target
         self.protected = protected
+        self.backup = backup
         self.action = None
 
     def __enter__(self):
         if Path(self._target).exists():
-            if self.protected:
+            if self.backup:
+                self.action = "backup"
+            elif self.protected:
                 self.action = ask_choice(
                     _("The file `{fn}` already exists. ").format(fn=rel_to_dir(self._target, settings.SEMESTER_DIR)) + _("Overwrite (d), keep (g), save (s), cancel (a)? "),
                     choices={
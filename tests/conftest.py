@@ -3,6 +3,7 @@ import shutil
 import shlex
 import subprocess
 import textwrap
+import types
 from pathlib import Path
 import dbm
 import pandas as pd
@@ -106,6 +107,25 @@ def guv_data_current(request):
         "uvs": ["SY09", "SY02"],
     }
 
+@pytest.fixture
+def uv_settings(tmp_path, monkeypatch):
+    """Settings of a UV folder in `tmp_path`, also set as global settings"""
+
+    # Global settings are used when reporting
+    from guv.config import settings
+    monkeypatch.setattr(settings, "_settings", {
+        "CWD": str(tmp_path),
+        "SEMESTER_DIR": str(tmp_path),
+        "UV_DIR": str(tmp_path),
+    })
+
+    return types.SimpleNamespace(
+        UV_DIR=str(tmp_path),
+        CWD=str(tmp_path),
+        SEMESTER_DIR=str(tmp_path),
+    )
+
+
 @pytest.fixture(scope="session")
 def collection_dir(tmp_path_factory):
     """Central place to collect all test-created files."""
@@ -0,0 +1,26 @@
+import importlib.util
+import json
+from pathlib import Path
+
+BENCHMARK = Path(__file__).parents[1] / "benchmarks" / "bench_group_optimizer.py"
+
+
+def test_bench_group_optimizer(tmp_path):
+    spec = importlib.util.spec_from_file_location("bench_group_optimizer", BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    output = tmp_path / "results.jsonl"
+    module.main([
+        "--sizes", "30", "--other-columns", "1", "--other-sizes", "4",
+        "--affinity-columns", "0", "1", "--max-iter", "20", "--output", str(output),
+    ])
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert "arguments" in records[0]
+    runs = records[1:]
+    assert {r["solver"] for r in runs} == {"evolutionary", "annealing", "tabu", "dense"}
+    assert all(r["score"] >= r["min_cost"] for r in runs)
+    # The dense algorithm does not support super-nodes
+    assert not any(r["solver"] == "dense" and r["affinity_columns"] for r in runs)
+    assert all(r["peak_memory"] > 0 for r in runs)
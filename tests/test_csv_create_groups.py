@@ -39,3 +39,7 @@ def test_csv_create_groups(guv, guvcapfd):
     guvcapfd.no_warning()
     guvcapfd.reset()
 
+
+    guv("csv_create_groups Projet7 --group-size 3 --other-groups group_2 --jobs 0").failed()
+    guvcapfd.stdout_search("must be greater than or equal to 1")
+    guvcapfd.reset()
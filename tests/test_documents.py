@@ -0,0 +1,198 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from guv.helpers import Aggregate, Documents
+from guv.tasks.internal import PrefetchExecutor, fuse_column_rewrites, run_step
+from guv.utils import apply_dtypes, infer_dtypes
+
+
+def test_prefetch_aggregate(tmp_path, uv_settings):
+    pd.DataFrame({"K": [1, 2, 3], "B": [4, 5, 6]}).to_csv(tmp_path / "right.csv", index=False)
+    left_df = pd.DataFrame({"K": [1, 2, 3], "A": [1, 2, 3]})
+
+    op = Aggregate("right.csv", on="K")
+    op.setup(settings=uv_settings, info={"uv": "SY02"})
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        op.prefetch(executor)
+        df = op.apply(left_df)
+
+    assert list(df.columns) == ["K", "A", "B"]
+    assert list(df["B"]) == [4, 5, 6]
+
+
+def test_run_step_with_prefetch(tmp_path, uv_settings):
+    pd.DataFrame({"K": [1, 2], "A": [1, 2]}).to_csv(tmp_path / "cache.csv", index=False)
+    pd.DataFrame({"K": [1, 2], "B": [3, 4]}).to_csv(tmp_path / "b.csv", index=False)
+    pd.DataFrame({"K": [1, 2], "C": [5, 6]}).to_csv(tmp_path / "c.csv", index=False)
+
+    docs = Documents()
+    docs.aggregate("b.csv", on="K")
+    docs.aggregate("c.csv", on="K")
+    docs.setup(settings=uv_settings, info={"uv": "SY02"})
+
+    target = tmp_path / "target.csv"
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        run_step(docs.actions, str(tmp_path / "cache.csv"), str(target), executor=executor)
+
+    df = pd.read_csv(target)
+    assert list(df.columns) == ["K", "A", "B", "C"]
+
+
+def test_prefetch_executor_cancels_pending():
+    started, event = threading.Event(), threading.Event()
+
+    def wait():
+        started.set()
+        return event.wait()
+
+    executor = PrefetchExecutor(max_workers=1)
+    running = executor.submit(wait)
+    pending = executor.submit(wait)
+    started.wait()
+    executor.shutdown(wait=False)
+    event.set()
+
+    assert pending.cancelled()
+    assert running.result()
+
+
+def test_lineage_redundant(uv_settings):
+    docs = Documents()
+    docs.compute_new_column("A", func=lambda s: s["A"], colname="X")
+    docs.replace_column("X", {"a": "b"})
+    docs.compute_new_column("B", func=lambda s: s["B"], colname="Y")
+    docs.compute_new_column("C", func=lambda s: s["C"], colname="Y")
+    docs.setup(settings=uv_settings, info={"uv": "SY02"})
+
+    lineage = docs.lineage
+    assert lineage.redundant() == {2: [3]}
+    assert lineage.lineage("X") == [0, 1]
+    assert lineage.lineage("Y") == [3]
+
+
+def test_lineage_unknown_operation(uv_settings):
+    docs = Documents()
+    docs.compute_new_column("A", func=lambda s: s["A"], colname="Y")
+    docs.apply_df(lambda df: df)
+    docs.compute_new_column("C", func=lambda s: s["C"], colname="Y")
+    docs.setup(settings=uv_settings, info={"uv": "SY02"})
+
+    lineage = docs.lineage
+    assert lineage.redundant() == {}
+    assert lineage.lineage("Y") == [0, 1, 2]
+    assert lineage.lineage("Z") == [0, 1]
+
+
+def test_run_step_skips_redundant(tmp_path, uv_settings):
+    pd.DataFrame({"A": [1, 2], "B": [3, 4]}).to_csv(tmp_path / "cache.csv", index=False)
+
+    calls = []
+    def func(s):
+        calls.append(s)
+        return s["A"]
+
+    docs = Documents(prune=True)
+    docs.compute_new_column("A", func=func, colname="Y")
+    docs.compute_new_column("B", func=lambda s: s["B"], colname="Y")
+    docs.setup(settings=uv_settings, info={"uv": "SY02"})
+
+    target = tmp_path / "target.csv"
+    run_step(docs.actions, str(tmp_path / "cache.csv"), str(target), skipped=docs.skipped_actions())
+
+    df = pd.read_csv(target)
+    assert list(df["Y"]) == [3, 4]
+    assert not calls
+
+
+def test_step_value_with_skipped_operations(uv_settings):
+    def steps(overwrite):
+        docs = Documents(prune=True)
+        docs.compute_new_column("A", func=lambda s: s["A"], colname="Y")
+        docs.actions[-1].cache = True
+        docs.compute_new_column("B", func=lambda s: s["B"], colname="Z")
+        if overwrite:
+            docs.compute_new_column("C", func=lambda s: s["C"], colname="Y")
+        docs.setup(settings=uv_settings, info={"uv": "SY02"})
+        return docs, {task["basename"]: task for task in docs.generate_doit_tasks()}
+
+    docs, tasks = steps(overwrite=True)
+    assert docs.actions[0] in docs.skipped_actions()
+    value = tasks["DOCS_0"]["uptodate"][0].config_changed.config
+    assert value == docs.step_value(docs.actions[:1], docs.skipped_actions())
+
+    # Step 0 is run again once its operation is no longer overwritten
+    docs, tasks = steps(overwrite=False)
+    assert not docs.skipped_actions()
+    assert tasks["DOCS_0"]["uptodate"][0].config_changed.config != value
+
+
+def test_run_step_fuses_rewrites(tmp_path, uv_settings):
+    pd.DataFrame({"A": ["group1", "gr2", "group1", None], "B": [1, 2, 3, 4]}).to_csv(tmp_path / "cache.csv", index=False)
+
+    calls = []
+    def func(v):
+        calls.append(v)
+        return v if pd.isna(v) else v.upper()
+
+    docs = Documents()
+    docs.replace_regex("A", (r"group([0-9])", r"gr\1"))
+    docs.replace_column("A", {"gr2": "gr3"})
+    docs.apply_column("A", func)
+    docs.apply_column("B", lambda v: v + 1)
+    docs.setup(settings=uv_settings, info={"uv": "SY02"})
+
+    fused = fuse_column_rewrites(docs.actions)
+    assert len(fused) == 2
+    assert fused[0].hash() == "-".join(a.hash() for a in docs.actions[:3])
+
+    target = tmp_path / "target.csv"
+    run_step(docs.actions, str(tmp_path / "cache.csv"), str(target), fuse=True)
+
+    df = pd.read_csv(target)
+    assert list(df["A"].fillna("")) == ["GR1", "GR3", "GR1", ""]
+    assert list(df["B"]) == [2, 3, 4, 5]
+    assert len(calls) == 3
+
+
+def test_infer_dtypes():
+    df = pd.DataFrame({
+        "Tutorial": ["T1", "T2", "T1", "T2"],
+        "Comment": ["a", "b", "c", None],
+        "Grade": [1, 2, 3, 4],
+    })
+
+    dtypes = infer_dtypes(df)
+    assert dtypes == {"Tutorial": "category", "Comment": "text"}
+
+    df = apply_dtypes(df, dtypes)
+    assert isinstance(df["Tutorial"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["Comment"].dtype, pd.StringDtype)
+    assert df["Grade"].dtype == "int64"
+
+
+def test_dtypes_after_checkpoint(tmp_path, uv_settings):
+    (tmp_path / "SY02" / "generated").mkdir(parents=True)
+
+    docs = Documents(prefetch=False)
+    docs.dtypes({"A": "category"})
+    docs.apply_df(lambda df: pd.DataFrame({"A": ["x", "y", "x"], "B": [1, 2, 3]}))
+    docs.actions[-1].cache = True
+
+    # New value in a category column after the checkpoint
+    def edit(df):
+        df.loc[0, "A"] = "z"
+        return df
+    docs.apply_df(edit)
+    docs.setup(settings=uv_settings, info={"uv": "SY02"})
+
+    for task in docs.generate_doit_tasks():
+        assert task["actions"][0]() is None
+
+    df = pd.read_csv(Documents.target_from(uv="SY02", step="final"))
+    assert list(df["A"]) == ["z", "y", "x"]
+    with open(tmp_path / "SY02" / "generated" / ".dtypes.json") as file:
+        assert apply_dtypes(df, json.load(file))["A"].dtype == "category"
@@ -0,0 +1,100 @@
+import openpyxl
+import pandas as pd
+
+from guv.tasks.gradebook_evaluator import (evaluate_jury, evaluate_marking_scheme,
+                                         read_entered_grades, read_gradebook)
+
+
+def test_evaluate_marking_scheme():
+    totals, rescaled = evaluate_marking_scheme(
+        [2, 3], [1, 4], [[None, None], [1, 2], [1, "a"], [0.5, 4]]
+    )
+    assert totals.tolist() == ["", 3.5, None, 4.0]
+    assert rescaled.tolist() == ["", 14.0, None, 16.0]
+
+
+def test_evaluate_jury():
+    values = pd.DataFrame({
+        "quiz": [10, 5, 10, "ABS", 10, 8],
+        "final": [16, 20, None, 12, 14, 6],
+        "Aggregated grade": [None, "RESERVE", None, None, None, None],
+    })
+    grades = [
+        {"name": "quiz", "coefficient": 1, "maximum grade": 10, "passing grade": 6},
+        {"name": "final", "coefficient": 3, "maximum grade": 20, "passing grade": -1},
+        {"name": "Aggregated grade", "passing grade": -1},
+    ]
+    percentiles = {"A": 1, "B": 0.5, "C": 0.25, "D": 0}
+
+    outcome, thresholds = evaluate_jury(values, grades, percentiles)
+    assert outcome["Aggregated grade"].tolist() == [17.0, "RESERVE", 5.0, None, 15.5, 8.5]
+    assert outcome["Passed"].tolist() == [1, 0, None, 1, 1, 1]
+    assert outcome["Passing grade"].tolist() == [17.0, "", "", "", 15.5, 8.5]
+    assert thresholds == {"A": 17.0, "B": 15.5, "C": 12.0, "D": 8.5}
+    assert outcome["ECTS grade"].tolist() == ["A", "RESERVE", None, None, "B", "D"]
+
+    outcome, thresholds = evaluate_jury(values, grades, percentiles, thresholds=dict(thresholds, A=20))
+    assert outcome["ECTS grade"].tolist() == ["B", "RESERVE", None, None, "B", "D"]
+
+
+def test_read_gradebook(tmp_path):
+    # Layout and formulas as written by `XlsGradeBookNoGroup`
+    workbook = openpyxl.Workbook()
+    data = workbook.active
+    data.title = "data"
+    data.append(["Email", "grade raw", "grade"])
+    data.append(["a@utc.fr", "='grade'!$E$6", "='grade'!$E$7"])
+    data.append(["b@utc.fr", "='grade'!$F$6", "='grade'!$F$7"])
+
+    sheet = workbook.create_sheet("grade")
+    sheet["B3"], sheet["C3"] = 2, 4
+    sheet["B4"], sheet["C4"] = 3, 1
+    sheet["B6"], sheet["B7"] = "=SUM(B3:B4)", 20
+    sheet["E3"], sheet["E4"] = 2, 1
+    sheet["F3"] = 1
+    for column in "EF":
+        sheet[f"{column}6"] = (
+            f'=IF(COUNTBLANK({column}3:{column}4) > 0, "", '
+            f"SUMPRODUCT($B$3:$B$4*{column}3:{column}4/$C$3:$C$4))"
+        )
+        sheet[f"{column}7"] = f'=IF(ISTEXT({column}6),"",{column}6/$B$6*$B$7)'
+
+    path = tmp_path / "gradebook.xlsx"
+    workbook.save(path)
+
+    df = read_gradebook(path)
+    assert df.attrs["grade_columns"] == ["grade raw", "grade"]
+    assert df["grade raw"].tolist()[0] == 4
+    assert df["grade"].tolist()[0] == 16
+    assert df[["grade raw", "grade"]].iloc[1].isna().all()
+
+
+def test_read_entered_grades(tmp_path):
+    # Layout and formulas as written by `XlsGradeBookGroup`
+    workbook = openpyxl.Workbook()
+    data = workbook.active
+    data.title = "data"
+    data.append(["Email", "grade raw"])
+    data.append(["a@utc.fr", "='grade'!F6"])
+    data.append(["b@utc.fr", "='grade'!G6"])
+    data.append([None, None])
+
+    sheet = workbook.create_sheet("grade")
+    sheet["E3"], sheet["E4"] = 2, None
+    sheet["F3"], sheet["F4"] = '=IF(ISBLANK(E3),"",E3)', '=IF(ISBLANK(E4),"",E4)'
+    sheet["G3"], sheet["G4"] = '=IF(ISBLANK(E3),"",E3)', 0
+    for column in "EFG":
+        sheet[f"{column}6"] = (
+            f'=IF(COUNTBLANK({column}3:{column}4) > 0, "", '
+            f"SUMPRODUCT($B$3:$B$4*{column}3:{column}4/$C$3:$C$4))"
+        )
+
+    path = tmp_path / "gradebook.xlsx"
+    workbook.save(path)
+
+    grades = read_entered_grades(path, "Email", ["grade raw", "other raw"])
+    assert list(grades) == ["grade raw"]
+    assert grades["grade raw"]["a@utc.fr"].values == [2, None]
+    assert grades["grade raw"]["a@utc.fr"].mirrored == [True, True]
+    assert grades["grade raw"]["b@utc.fr"].values == [2, 0]
+    assert grades["grade raw"]["b@utc.fr"].mirrored == [True, False]
@@ -0,0 +1,300 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from guv.tasks.evolutionary_algorithm import (apply_moves, evaluate, evaluate_moves,
+                                              evolutionary_algorithm, generate_moves)
+from guv.tasks.group_constraints import (ConstraintGraph, PartitionState, get_affinity_components,
+                                         get_affinity_violations, get_balance_violations, get_group_codes,
+                                         get_repulse_violations, pack_components)
+from guv.tasks.local_search import SOLVERS, best_result, solve
+from guv.tasks.moodle import get_coocurrence_dict
+
+
+def dense_cooc(codes):
+    # Elements always co-occur with themselves, even without a group
+    same = (codes[:, None] == codes[None, :]) & (codes[:, None] != -1)
+    return (same | np.eye(len(codes), dtype=bool)).astype(int)
+
+
+def dense_penalty(df, repulse_columns, affinity_columns):
+    n = len(df.index)
+    cooc_repulse = sum(map(dense_cooc, get_coocurrence_dict(df, repulse_columns, nan_policy="different").values()), np.zeros((n, n), dtype=int))
+    cooc_affinity = sum(map(dense_cooc, get_coocurrence_dict(df, affinity_columns, nan_policy="same").values()), np.zeros((n, n), dtype=int))
+    cooc = cooc_repulse - cooc_affinity
+    minimum = cooc.min(axis=None)
+    return cooc - minimum, n * (len(repulse_columns) - len(affinity_columns) - minimum)
+
+
+def random_df(rng, n):
+    return pd.DataFrame({
+        "A": rng.choice(["a", "b", "c", None], size=n),
+        "B": rng.choice(["x", "y", "z", "t", "u"], size=n),
+        "C": rng.choice(["g1", "g2", None], size=n),
+    })
+
+
+def test_constraint_graph_matches_dense():
+    rng = np.random.default_rng(0)
+    for repulse, affinity in [(["A"], []), ([], ["C"]), (["A", "B"], ["C"]), (["B"], ["B"])]:
+        df = random_df(rng, 30)
+        penalty, min_cost = dense_penalty(df, repulse, affinity)
+        graph = ConstraintGraph.from_dataframe(df, repulse, affinity)
+
+        partitions = np.stack([rng.permutation(np.arange(30) % 7) for _ in range(5)])
+        assert graph.min_cost == min_cost
+        assert np.array_equal(evaluate(partitions, graph), evaluate(partitions, penalty))
+        assert graph.score(partitions[0]) == evaluate(partitions[:1], penalty)[0]
+
+
+def test_constraint_graph_is_sparse():
+    df = pd.DataFrame({"A": np.arange(600) // 20})
+    graph = ConstraintGraph.from_dataframe(df, ["A"])
+    assert graph.num_edges == 30 * 20 * 19 // 2
+
+
+def test_violations_match_dense():
+    rng = np.random.default_rng(5)
+    df = random_df(rng, 40)
+    partition = rng.permutation(np.arange(40) % 8)
+    same_group = partition[:, None] == partition[None, :]
+    upper = np.triu(np.ones((40, 40), dtype=bool), k=1)
+
+    for codes in get_coocurrence_dict(df, ["A", "B", "C"], nan_policy="different").values():
+        assert codes.dtype == np.int32
+        rows, cols = get_repulse_violations(partition, codes)
+        expected = np.nonzero(dense_cooc(codes).astype(bool) & same_group & upper)
+        assert np.array_equal(rows, expected[0]) and np.array_equal(cols, expected[1])
+
+    for codes in get_coocurrence_dict(df, ["A", "B", "C"], nan_policy="same").values():
+        rows, cols = get_affinity_violations(partition, codes)
+        expected = np.nonzero(~dense_cooc(codes).astype(bool) & same_group & upper)
+        assert np.array_equal(rows, expected[0]) and np.array_equal(cols, expected[1])
+
+
+def test_partition_state_deltas():
+    rng = np.random.default_rng(1)
+    df = random_df(rng, 40)
+    graph = ConstraintGraph.from_dataframe(df, ["A", "B"], ["C"])
+    state = PartitionState(graph, rng.permutation(np.arange(40) % 6))
+
+    for _ in range(50):
+        a, b = rng.choice(40, size=2, replace=False)
+        delta = state.swap_delta(a, b)
+        assert state.swap_deltas(a, [b, a])[0] == delta
+        before = state.score
+        assert state.swap(a, b) == delta
+        assert state.score == before + delta == graph.score(state.partition)
+
+        a, h = rng.integers(40), rng.integers(6)
+        delta = state.move_delta(a, h)
+        assert state.move(a, h) == delta
+        assert state.score == graph.score(state.partition)
+
+
+def test_evaluate_moves_leaves_state_unchanged():
+    rng = np.random.default_rng(2)
+    df = random_df(rng, 30)
+    graph = ConstraintGraph.from_dataframe(df, ["A"], ["C"])
+    state = PartitionState(graph, np.arange(30) % 5)
+    partition = state.partition.copy()
+
+    moves = generate_moves(30, 8)
+    score = evaluate_moves(state, moves)
+    assert np.array_equal(state.partition, partition)
+    assert score == graph.score(apply_moves(state.copy(), moves).partition)
+
+
+def test_incremental_evolutionary_algorithm():
+    df = pd.DataFrame({"A": np.arange(60) // 4})
+    graph = ConstraintGraph.from_dataframe(df, ["A"])
+    np.random.seed(0)
+    _, score, partition = evolutionary_algorithm(np.arange(60) // 4, graph, graph.min_cost, max_variants=20000, top_k=20)
+    assert score == graph.min_cost == graph.score(partition)
+    assert np.array_equal(np.bincount(partition), np.full(15, 4))
+
+
+def test_evolutionary_algorithm_with_super_nodes():
+    # Elements 0 and 1 are merged in a super-node of size 2
+    graph = ConstraintGraph.from_codes(6, repulse_codes=[np.array([0, 1, 0, 1, 0, 1])])
+    contracted = graph.contract(np.array([0, 0, 1, 2, 3, 4]))
+    initial_partition = np.array([0, 1, 1, 0, 1])
+
+    np.random.seed(0)
+    _, score, partition = evolutionary_algorithm(initial_partition, contracted, contracted.min_cost, max_variants=50)
+    assert score == contracted.score(partition)
+    assert np.array_equal(np.bincount(partition, weights=contracted.sizes), [3, 3])
+
+
+def test_permutation_delta_with_counts():
+    rng = np.random.default_rng(3)
+    df = random_df(rng, 30)
+    graph = ConstraintGraph.from_dataframe(df, ["A", "B"], ["C"])
+    state = PartitionState(graph, np.arange(30) % 5)
+    state.counts
+
+    targets, sources = generate_moves(30, 10)
+    delta = state.permutation_delta(targets, sources)
+    assert state.permute(targets, sources) == delta
+    assert state.score == graph.score(state.partition)
+    assert np.array_equal(state.counts, PartitionState(graph, state.partition).counts)
+
+
+@pytest.mark.parametrize("name", list(SOLVERS.keys()))
+def test_solvers(name):
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame({"A": rng.permutation(np.arange(120) // 4), "B": rng.permutation(np.arange(120) // 3)})
+    graph = ConstraintGraph.from_dataframe(df, ["A", "B"])
+    initial_partition = np.arange(120) // 4
+
+    solver = SOLVERS[name](max_iter=5000, time_limit=20, seed=0)
+    _, score, partition = solver.solve(graph, initial_partition)
+    assert score == graph.min_cost == graph.score(partition)
+    assert np.array_equal(np.bincount(partition), np.bincount(initial_partition))
+
+    # Same seed, same result
+    _, _, partition2 = SOLVERS[name](max_iter=5000, time_limit=20, seed=0).solve(graph, initial_partition)
+    assert np.array_equal(partition, partition2)
+
+
+def test_affinity_components():
+    a = np.array([0, 0, 1, -1, 2, 2])
+    b = np.array([-1, 3, 3, -1, -1, 4])
+    assert list(get_affinity_components(6, [a, b])) == [0, 0, 0, 1, 2, 2]
+
+    labels, node_groups = pack_components(np.array([0, 0, 0, 1, 2, 2]), [3, 3])
+    assert list(labels) == [0, 0, 0, 2, 1, 1]
+    assert list(np.bincount(node_groups[labels])) == [3, 3]
+
+    # Too large components are split
+    labels, node_groups = pack_components(np.array([0, 0, 0, 0, 1, 1]), [3, 3])
+    assert len(set(labels[:4])) == 4
+    assert list(np.bincount(node_groups[labels])) == [3, 3]
+
+
+def test_contracted_graph_matches_elements():
+    rng = np.random.default_rng(6)
+    df = random_df(rng, 30)
+    df["D"] = rng.permutation(np.arange(30) // 2)
+    graph = ConstraintGraph.from_dataframe(df, ["A", "B"], ["D"])
+    components = get_affinity_components(30, [get_group_codes(df["D"], nan_policy="different")])
+    labels, node_partition = pack_components(components, np.full(10, 3))
+    contracted = graph.contract(labels)
+
+    # One pair fits in each group of 3, the other pairs are split
+    assert contracted.n == 20 and contracted.min_cost == graph.min_cost
+    partitions = np.stack([rng.permutation(node_partition) for _ in range(5)])
+    assert np.array_equal(contracted.score(partitions), graph.score(partitions[:, labels]))
+
+    # Incremental deltas account for the sizes of the super-nodes
+    state = PartitionState(contracted, node_partition)
+    for _ in range(50):
+        a, b = rng.integers(20, size=2)
+        delta = state.swap_delta(a, b)
+        assert state.swap_deltas(a, [b])[0] == delta
+        assert state.swap(a, b) == delta
+        assert state.score == contracted.score(state.partition)
+
+
+@pytest.mark.parametrize("name", list(SOLVERS.keys()))
+def test_solvers_with_super_nodes(name):
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({
+        "A": rng.permutation(np.arange(60) // 4),
+        "D": rng.choice([*range(10), None], size=60),
+    })
+    graph = ConstraintGraph.from_dataframe(df, ["A"], ["D"])
+    components = get_affinity_components(60, [get_group_codes(df["D"], nan_policy="different")])
+    group_sizes = np.full(15, 4)
+    labels, node_partition = pack_components(components, group_sizes)
+    contracted = graph.contract(labels)
+
+    _, score, partition = SOLVERS[name](max_iter=500, time_limit=20, seed=0).solve(contracted, node_partition)
+    partition = partition[labels]
+    assert score == graph.score(partition)
+    assert np.array_equal(np.bincount(partition), group_sizes)
+
+    # Components that fit in a group are never split
+    for c in np.unique(labels):
+        assert len(set(partition[labels == c])) == 1
+
+
+def test_balance_penalty():
+    codes = np.array([0, 0, 0, 0, 1, 1, -1, -1])
+    graph = ConstraintGraph.from_codes(8, balance_codes=[codes])
+
+    # At most 2 elements of category 0 and 1 of category 1 per group
+    assert graph.min_cost == 0
+    assert graph.score(np.array([0, 0, 1, 1, 0, 1, 0, 1])) == 0
+    assert graph.score(np.array([0, 0, 0, 1, 1, 0, 1, 1])) == 2
+    assert graph.score(np.array([0, 0, 0, 0, 1, 1, 1, 1])) == 6
+
+    groups, categories, counts, bounds = get_balance_violations(np.array([0, 0, 0, 1, 1, 0, 1, 1]), codes)
+    assert list(groups) == [0] and list(categories) == [0]
+    assert list(counts) == [3] and list(bounds) == [2]
+
+
+def test_partition_state_balance_deltas():
+    rng = np.random.default_rng(8)
+    df = random_df(rng, 40)
+    df["D"] = rng.permutation(np.arange(40) // 2)
+    graph = ConstraintGraph.from_dataframe(df, ["A"], ["D"], ["B", "C"])
+    components = get_affinity_components(40, [get_group_codes(df["D"], nan_policy="different")])
+    labels, node_partition = pack_components(components, np.full(8, 5))
+    contracted = graph.contract(labels)
+
+    state = PartitionState(contracted, node_partition)
+    assert state.score == graph.score(node_partition[labels])
+    for _ in range(50):
+        a, b = rng.integers(contracted.n, size=2)
+        delta = state.swap_delta(a, b)
+        assert state.swap_deltas(a, [b])[0] == delta
+        assert state.swap(a, b) == delta
+        assert state.score == contracted.score(state.partition)
+
+    state = PartitionState(graph, rng.permutation(np.arange(40) % 8))
+    for _ in range(10):
+        targets, sources = generate_moves(40, 6, rng=rng)
+        delta = state.permutation_delta(targets, sources)
+        assert state.permute(targets, sources) == delta
+        assert state.score == graph.score(state.partition)
+        assert all(
+            np.array_equal(counts, balance.group_counts(state.partition, 8))
+            for balance, counts in zip(graph.balances, state.balance_counts)
+        )
+
+
+@pytest.mark.parametrize("name", list(SOLVERS.keys()))
+def test_solvers_with_balance(name):
+    rng = np.random.default_rng(9)
+    df = pd.DataFrame({
+        "A": rng.permutation(np.arange(60) // 4),
+        "Level": rng.choice(["low", "mid", "high"], size=60, p=[0.5, 0.3, 0.2]),
+    })
+    graph = ConstraintGraph.from_dataframe(df, ["A"], balance_columns=["Level"])
+    initial_partition = np.arange(60) // 4
+
+    _, score, partition = SOLVERS[name](max_iter=2000, time_limit=20, seed=0).solve(graph, initial_partition)
+    assert score == graph.min_cost == graph.score(partition)
+    groups, _, _, _ = get_balance_violations(partition, get_group_codes(df["Level"], nan_policy="different"))
+    assert len(groups) == 0
+
+
+def test_parallel_restarts():
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame({"A": rng.permutation(np.arange(80) // 4)})
+    graph = ConstraintGraph.from_dataframe(df, ["A"])
+    initial_partition = np.arange(80) // 4
+
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(2) as executor:
+        stop_event = manager.Event()
+        futures = [
+            executor.submit(solve, "tabu", graph, initial_partition, seed=seed, stop_event=stop_event, max_iter=5000)
+            for seed in range(3)
+        ]
+        _, score, partition = best_result([f.result() for f in futures])
+
+    assert score == graph.min_cost == graph.score(partition)
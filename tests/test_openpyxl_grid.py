@@ -0,0 +1,60 @@
+import openpyxl
+
+from guv.openpyxl_grid import GridWorkbook
+from guv.openpyxl_utils import AddressBuilder, frame_range, get_address_of_cell, get_segment
+
+
+def test_grid_workbook_round_trip(tmp_path):
+    workbook = GridWorkbook()
+    data = workbook.create_sheet("data")
+    sheet = workbook.create_sheet("data")
+    assert sheet.title == "data1"
+    workbook.active = sheet
+
+    ref = sheet.cell(2, 2)
+    ref.text("header").merge(ref.right(2)).center()
+    for i, cell in enumerate(get_segment(ref.below(), ref.below().right(2))):
+        cell.value = i
+    ref.below(2).value = "=SUM({}:{})".format(
+        get_address_of_cell(ref.below()), get_address_of_cell(ref.below().right(2))
+    )
+    frame_range(ref, ref.below(2).right(2))
+    sheet.freeze_panes = ref.top()
+    data.cell(1, 1).text("name").style = "Pandas"
+
+    assert (sheet.max_row, sheet.max_column) == (4, 4)
+    assert get_address_of_cell(data.cell(1, 1)) == "'data'!A1"
+
+    path = tmp_path / "grid.xlsx"
+    workbook.save(path)
+
+    wb = openpyxl.load_workbook(path)
+    ws = wb["data1"]
+    assert wb.active.title == "data1"
+    assert ws.freeze_panes == "B1"
+    assert [str(r) for r in ws.merged_cells.ranges] == ["B2:D2"]
+    assert ws["B2"].value == "header"
+    assert ws["B2"].alignment.horizontal == "center"
+    assert [c.value for c in ws[3][1:4]] == [0, 1, 2]
+    assert ws["B4"].value == "=SUM(B3:D3)"
+    assert ws["B2"].border.top.style == "thin"
+    assert ws["D4"].border.right.style == "thin"
+    assert ws["C3"].border.top.style is None
+    assert wb["data"]["A1"].style == "Pandas"
+    assert wb["data"]["A1"].border.left.style == "thin"
+
+
+def test_address_builder():
+    workbook = GridWorkbook()
+    data = workbook.create_sheet("data")
+    sheet = workbook.create_sheet("grades")
+    addresses = AddressBuilder(sheet)
+
+    # Relative to `sheet` whatever the active worksheet
+    assert workbook.active is data
+    assert addresses.address(sheet.cell(3, 28)) == "AB3"
+    assert addresses.address(sheet.cell(3, 28), absolute=True) == "$AB$3"
+    assert addresses.address(data.cell(2, 1)) == "'data'!A2"
+    assert addresses.address(sheet.cell(1, 1), add_worksheet_name=True) == "'grades'!A1"
+    assert addresses.range(sheet.cell(4, 3), sheet.cell(2, 1), absolute=True) == "$A$2:$C$4"
+    assert addresses.range(data.cell(2, 1), data.cell(5, 1), compat=True) == "INDIRECT(\"'data'!A2:A5\")"
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from guv.tasks.group_constraints import ConstraintGraph
+from guv.tasks.pairing_history import PairingHistory
+
+
+def write_groups(path, groups):
+    pd.DataFrame(
+        [(login, group) for group, logins in groups.items() for login in logins]
+    ).to_csv(path, index=False, header=False)
+
+
+def test_pairing_history(tmp_path):
+    write_groups(tmp_path / "P1_groups.csv", {"g1": ["a", "b", "c"], "g2": ["d", "e"]})
+    write_groups(tmp_path / "P2_groups.csv", {"g1": ["a", "b"], "g2": ["c", "d", "e"]})
+
+    history = PairingHistory()
+    assert history.update(tmp_path)
+    assert sorted(history.titles) == ["P1", "P2"]
+    assert not history.update(tmp_path)
+
+    rows, cols, weights = history.edges(["P1", "P2"], ["e", "a", "b", "x", "d"])
+    pairs = {(r, c): w for r, c, w in zip(rows, cols, weights)}
+    assert pairs == {(1, 2): 2, (0, 4): 2}
+
+    store = tmp_path / PairingHistory.store_name
+    history.save(store)
+    history = PairingHistory.load(store)
+    assert history.edges(["P1"], ["a", "c"])[2].tolist() == [1]
+
+    # Only modified files are read again
+    write_groups(tmp_path / "P1_groups.csv", {"g1": ["a", "d"], "g2": ["b", "c", "e"]})
+    os.utime(tmp_path / "P1_groups.csv", (0, 0))
+    assert history.update(tmp_path)
+    assert history.edges(["P1"], ["a", "c"])[2].tolist() == []
+    assert history.edges(["P1"], ["a", "d"])[2].tolist() == [1]
+
+
+def test_history_as_repulsion():
+    graph = ConstraintGraph.from_codes(4, weighted_pairs=(np.array([0]), np.array([1]), np.array([3])))
+    assert graph.min_cost == 0
+    assert graph.score(np.array([0, 0, 1, 1])) == 6
+    assert graph.score(np.array([0, 1, 0, 1])) == 0
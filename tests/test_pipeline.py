@@ -0,0 +1,121 @@
+import textwrap
+
+import pandas as pd
+import pytest
+
+from guv.config import Settings
+from guv.exceptions import ImproperlyConfigured
+from guv.pipeline import Pipeline
+from guv.tasks.internal import run_step
+
+
+YAML_PIPELINE = r"""
+operations:
+  - replace_regex:
+      args: [G, ["group([0-9])", "gr\\1"]]
+  - apply_column:
+      colname: G
+      func: {hook: upper}
+      cache: true
+  - fillna_column: H
+"""
+
+TOML_PIPELINE = r"""
+[[operations]]
+replace_regex = { args = ["G", ["group([0-9])", "gr\\1"]] }
+
+[[operations]]
+apply_column = { colname = "G", func = { hook = "upper" }, cache = true }
+
+[[operations]]
+fillna_column = "H"
+"""
+
+HOOKS = """
+def upper(value):
+    return value.upper()
+"""
+
+
+def write(path, content):
+    path.write_text(textwrap.dedent(content))
+    return path
+
+
+def digest(path):
+    return "-".join(spec.hash() for spec in Pipeline.from_file(path).operations)
+
+
+def test_pipeline_canonical_hash(tmp_path):
+    write(tmp_path / "hooks.py", HOOKS)
+    write(tmp_path / "docs.yaml", YAML_PIPELINE)
+    write(tmp_path / "docs.toml", TOML_PIPELINE)
+
+    value = digest(tmp_path / "docs.yaml")
+    assert digest(tmp_path / "docs.toml") == value
+
+    # Comments and formatting of hooks are ignored
+    write(tmp_path / "hooks.py", "# Comment\n" + HOOKS.replace("value.upper()", "value.upper( )"))
+    assert digest(tmp_path / "docs.yaml") == value
+
+    write(tmp_path / "hooks.py", HOOKS.replace("upper()", "lower()"))
+    assert digest(tmp_path / "docs.yaml") != value
+
+
+def test_pipeline_hook_helpers(tmp_path):
+    hooks = HOOKS.replace("value.upper()", "SUFFIX + helper(value)") + textwrap.dedent("""
+    SUFFIX = "-"
+
+    def helper(value):
+        return value.upper()
+    """)
+    write(tmp_path / "hooks.py", hooks)
+    value = digest(write(tmp_path / "docs.yaml", YAML_PIPELINE))
+
+    # Helpers and constants used by a hook are part of its hash
+    write(tmp_path / "hooks.py", hooks.replace("value.upper()", "value.lower()"))
+    assert digest(tmp_path / "docs.yaml") != value
+    write(tmp_path / "hooks.py", hooks.replace('SUFFIX = "-"', 'SUFFIX = "+"'))
+    assert digest(tmp_path / "docs.yaml") != value
+
+
+def test_pipeline_unknown_hook(tmp_path):
+    write(tmp_path / "hooks.py", HOOKS)
+    write(tmp_path / "docs.yaml", YAML_PIPELINE.replace("hook: upper", "hook: lower"))
+    with pytest.raises(ImproperlyConfigured):
+        digest(tmp_path / "docs.yaml")
+
+
+def test_pipeline_loaded_when_used(tmp_path):
+    uv_dir = tmp_path / "SY02"
+    uv_dir.mkdir()
+    write(tmp_path / "config.py", "")
+    write(uv_dir / "config.py", 'DOCS = "docs.yaml"\n')
+    write(uv_dir / "docs.yaml", YAML_PIPELINE)
+
+    # The hooks file is missing, the error is only raised when DOCS is used
+    settings = Settings(str(uv_dir))
+    assert "DOCS" in settings
+    with pytest.raises(ImproperlyConfigured):
+        settings.DOCS
+
+    write(uv_dir / "hooks.py", HOOKS)
+    settings = Settings(str(uv_dir))
+    assert [a.name() for a in settings.DOCS.actions] == ["replace_regex", "apply_column", "fillna_column"]
+    assert settings.DOCS is settings.DOCS
+
+
+def test_pipeline_to_documents(tmp_path, uv_settings):
+    write(tmp_path / "hooks.py", HOOKS)
+    pipeline = Pipeline.from_file(write(tmp_path / "docs.yaml", YAML_PIPELINE))
+    docs = pipeline.to_documents()
+    docs.setup(settings=uv_settings, info={"uv": "SY02"})
+
+    assert [a.name() for a in docs.actions] == ["replace_regex", "apply_column", "fillna_column"]
+    assert [a.cache for a in docs.actions] == [False, True, False]
+    assert docs.actions[0].hash() == pipeline.operations[0].hash()
+
+    pd.DataFrame({"G": ["group1", "gr2"], "H": [1, 2]}).to_csv(tmp_path / "cache.csv", index=False)
+    target = tmp_path / "target.csv"
+    run_step(docs.actions[:2], str(tmp_path / "cache.csv"), str(target))
+    assert list(pd.read_csv(target)["G"]) == ["GR1", "GR2"]
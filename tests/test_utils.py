@@ -0,0 +1,29 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from guv.utils import positive_int, smart_cast, smart_cast_series
+
+
+@pytest.mark.parametrize("series", [
+    pd.Series(["12", " 3", "1.0", "abc", None, "1e3", "-4", "12345678901234567"]),
+    pd.Series([1.0, 2.5, np.nan, 1e20]),
+    pd.Series([1, 2]),
+    pd.Series([True, False]),
+    pd.Series(["a", 1, 2.0, "3"], dtype=object),
+    pd.Series([], dtype=str),
+])
+def test_smart_cast_series(series):
+    result = smart_cast_series(series)
+    expected = [smart_cast(value) for value in series]
+    assert [type(v) for v in result] == [type(v) for v in expected]
+    assert pd.Series(result, dtype=object).equals(pd.Series(expected, dtype=object))
+
+
+def test_positive_int():
+    assert positive_int("3") == 3
+    for value in ["0", "-2", "abc"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            positive_int(value)
@@ -37,3 +37,60 @@ def test_xls_grade_book_no_group_3(guv, guvcapfd):
     ).succeed()
     guv.check_output_file(guv.cwd / "generated" / "Test3_gradebook.xlsx")
     guvcapfd.no_warning()
+
+
+@path_dependency("test_xls_student_data")
+def test_xls_grade_book_no_group_4(guv, guvcapfd):
+    uv = guv.uvs[0]
+    guv.cd(guv.semester, uv)
+    guv.copy_file("config_gradebook_test1.yaml", "documents")
+    guv(
+        "xls_grade_book_no_group --name Test4 --marking-scheme documents/config_gradebook_test1.yaml --max-students 2 --transpose"
+    ).succeed()
+    guv.check_output_file(guv.cwd / "generated" / "Test4_gradebook.xlsx")
+    guvcapfd.no_warning()
+
+
+@path_dependency("test_xls_grade_book_no_group_1")
+def test_xls_grade_book_no_group_5(guv, guvcapfd):
+    uv = guv.uvs[0]
+    guv.cd(guv.semester, uv)
+    guv(
+        "xls_grade_book_no_group --name Test1 --marking-scheme documents/config_gradebook_test1.yaml --update"
+    ).succeed()
+    guv.check_output_file(guv.cwd / "generated" / "Test1_gradebook.xlsx")
+    guvcapfd.no_warning()
+
+
+@path_dependency("test_xls_student_data")
+def test_xls_grade_book_no_group_6(guv, guvcapfd):
+    uv = guv.uvs[0]
+    guv.cd(guv.semester)
+    guv.copy_file("config_gradebook_test1.yaml", f"{uv}/documents")
+    guv(
+        f"xls_grade_book_no_group --name Test6 --marking-scheme documents/config_gradebook_test1.yaml --uvs {uv}"
+    ).succeed()
+    guv.check_output_file(guv.cwd / uv / "generated" / "Test6_gradebook.xlsx")
+    guvcapfd.no_warning()
+
+
+@path_dependency("test_xls_student_data")
+def test_xls_grade_book_no_group_7(guv, guvcapfd):
+    # Only the first UV has student data and a marking scheme, the
+    # gradebook of the second one fails
+    uv, failing_uv = guv.uvs
+    guv.cd(guv.semester)
+    guv.copy_file("config_gradebook_test1.yaml", f"{uv}/documents")
+    guv(
+        "xls_grade_book_no_group --name Test7 --marking-scheme documents/config_gradebook_test1.yaml -j 2"
+    ).failed()
+    guvcapfd.stdout_search(f"The gradebook of `{failing_uv}` failed", f"Gradebooks failed for {failing_uv}")
+    guv.check_output_file(guv.cwd / uv / "generated" / "Test7_gradebook.xlsx")
+    assert not (guv.cwd / failing_uv / "generated" / "Test7_gradebook.xlsx").exists()
+
+
+@path_dependency("test_xls_student_data")
+def test_xls_grade_book_no_group_8(guv, guvcapfd):
+    guv.cd(guv.semester)
+    guv("xls_grade_book_no_group --name Test8 --marking-scheme documents/config_gradebook_test1.yaml -j 0").failed()
+    guvcapfd.stdout_search("must be greater than or equal to 1")